@@ -1,58 +1,698 @@
 from __future__ import annotations
 
 import asyncio
-import json
-from typing import Any, Optional
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Generic, Hashable, Optional, TypeVar
 
 try:
     import redis.asyncio as redis
 except Exception:  # pragma: no cover - fallback typing only
     redis = None  # type: ignore
 
+from .codec import Codec
 from .config import get_settings
 
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 _redis_client: Optional["redis.Redis"] = None
+_pubsub_client: Optional["redis.Redis"] = None
+
+T = TypeVar("T")
+K = TypeVar("K", bound=Hashable)
+
+
+def init_redis() -> None:
+    """Open the Redis connection pools; called from the app lifespan."""
+    global _redis_client, _pubsub_client
+    if redis is None or _redis_client is not None:
+        return
+    _redis_client = redis.Redis(
+        connection_pool=redis.ConnectionPool.from_url(
+            settings.REDIS_URL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+            socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT_SECONDS,
+            health_check_interval=30,
+        )
+    )
+    # subscribers block on reads, so they cannot share the request timeouts
+    _pubsub_client = redis.from_url(
+        settings.REDIS_URL,
+        max_connections=2,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT_SECONDS,
+        socket_keepalive=True,
+    )
+
+
+async def close_redis() -> None:
+    global _redis_client, _pubsub_client
+    await feed_cache.stop_listener()
+    await redis_breaker.stop()
+    for client in (_redis_client, _pubsub_client):
+        if client is not None:
+            await client.aclose(close_connection_pool=True)
+    _redis_client = _pubsub_client = None
 
 
 async def get_redis() -> Optional["redis.Redis"]:
-    global _redis_client
-    if redis is None:
-        return None
-    if _redis_client is None:
-        _redis_client = redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+    init_redis()
     return _redis_client
 
 
-async def cache_user_feed(username: str, feed: list[dict], ttl_seconds: int = 300) -> None:
-    client = await get_redis()
-    if not client:
-        return
-    key = f"feed:{username}"
-    try:
-        await client.set(key, json.dumps(feed), ex=ttl_seconds)
-    except Exception:
-        pass
+async def get_pubsub_redis() -> Optional["redis.Redis"]:
+    init_redis()
+    return _pubsub_client
 
 
-async def get_cached_feed(username: str) -> Optional[list[dict]]:
+async def _ping_redis() -> bool:
     client = await get_redis()
-    if not client:
-        return None
-    key = f"feed:{username}"
-    try:
-        data = await client.get(key)
-        if data:
-            return json.loads(data)
-    except Exception:
-        return None
-    return None
+    return client is not None and bool(await client.ping())
+
+
+class CircuitBreaker:
+    """Stops calls to a failing dependency.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    ``allow()`` returns False, so callers skip the dependency at no cost.
+    While open, ``probe`` runs every ``retry_seconds`` in the background and
+    closes the breaker once it succeeds. Without a probe (or an event loop)
+    one call is let through every ``retry_seconds`` instead.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        retry_seconds: float = 5.0,
+        probe: Callable[[], Awaitable[bool]] | None = None,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.retry_seconds = retry_seconds
+        self.probe = probe
+        self.failures = 0
+        self.rejected = 0
+        self.opened_at: float | None = None
+        self._probe_task: asyncio.Task | None = None
+
+    @property
+    def state(self) -> str:
+        return "closed" if self.opened_at is None else "open"
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self._probe_task is None and time.monotonic() - self.opened_at >= self.retry_seconds:
+            self.opened_at = time.monotonic()  # one trial call; a failure keeps it open
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        if self.opened_at is not None and self._probe_task is None:
+            self.close()
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.opened_at is None and self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            logger.warning("%s circuit open after %d failures", self.name, self.failures)
+            self._start_probe()
+
+    def close(self) -> None:
+        if self.opened_at is not None:
+            logger.info("%s circuit closed", self.name)
+        self.opened_at = None
+        self.failures = 0
+
+    def _start_probe(self) -> None:
+        if self.probe is None:
+            return
+        try:
+            self._probe_task = asyncio.get_running_loop().create_task(self._probe_until_closed())
+        except RuntimeError:
+            self._probe_task = None
+
+    async def _probe_until_closed(self) -> None:
+        try:
+            while self.opened_at is not None:
+                await asyncio.sleep(self.retry_seconds)
+                try:
+                    if await self.probe():
+                        self.close()
+                except Exception as exc:
+                    logger.debug("%s probe failed: %s", self.name, exc)
+        finally:
+            self._probe_task = None
+
+    async def stop(self) -> None:
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+
+
+def _text(value: bytes | str) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class LRUCache:
+    """Bounded in-process cache; entries expire ``ttl`` seconds after being set.
+
+    Entries may belong to a ``group`` (e.g. every feed of one user) that
+    ``delete_group`` drops at once.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any, str | None]] = OrderedDict()
+        self._groups: dict[str, set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Any:
+        """The live value for ``key`` or None."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires, value, _ = entry
+        if expires <= time.monotonic():
+            self.delete(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None, group: str | None = None) -> None:
+        if self.maxsize <= 0:
+            return
+        self.delete(key)
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value, group)
+        if group is not None:
+            self._groups.setdefault(group, set()).add(key)
+        while len(self._data) > self.maxsize:
+            self.delete(next(iter(self._data)))
+
+    def delete(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is None or entry[2] is None:
+            return
+        keys = self._groups.get(entry[2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._groups[entry[2]]
+
+    def delete_group(self, group: str) -> int:
+        keys = self._groups.pop(group, set())
+        for key in keys:
+            self._data.pop(key, None)
+        return len(keys)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._groups.clear()
+
+
+@dataclass
+class CacheStats:
+    local_hits: int = 0
+    redis_hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    stale: int = 0
+    refreshes: int = 0
+    invalidations: int = 0
+    errors: int = 0
+
+    def as_dict(self) -> dict[str, float]:
+        stats: dict[str, float] = asdict(self)
+        lookups = self.local_hits + self.redis_hits + self.stale + self.misses
+        stats["hit_ratio"] = (lookups - self.misses) / lookups if lookups else 0.0
+        return stats
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    fresh_until: float  # wall-clock time, shared by every worker
+    group: str | None = None
+
+    @property
+    def stale(self) -> bool:
+        return time.time() >= self.fresh_until
+
+
+class TieredCache:
+    """An in-process LRU in front of Redis, with single-flight fills.
+
+    Entries are fresh for ``soft_ttl`` seconds and dropped after ``ttl``.
+    In between, ``get_or_compute`` serves the stale value immediately and
+    refreshes it in a background task. Only one coroutine per key and
+    worker computes a value; concurrent misses await its result. Redis
+    errors count as misses, so the cache never fails a request.
+
+    ``invalidate(group)`` deletes a group of entries from Redis and
+    publishes the group on ``channel``; every worker subscribed through
+    ``start_listener`` then drops it from its LRU.
+
+    While ``breaker`` is open, Redis is skipped and the LRU serves alone.
+
+    With ``fill_lock_seconds`` set, fills are also coalesced across workers:
+    the first worker to miss takes a Redis lock on the key and the others
+    poll Redis for its result for up to that long before computing it
+    themselves.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        *,
+        local_size: int,
+        local_ttl: float,
+        ttl: float,
+        soft_ttl: float | None = None,
+        channel: str | None = None,
+        codec: Codec | None = None,
+        breaker: CircuitBreaker | None = None,
+        client_factory: Callable[[], Awaitable[Any]] = get_redis,
+        pubsub_factory: Callable[[], Awaitable[Any]] | None = None,
+        fill_lock_seconds: float = 0.0,
+        fill_poll_seconds: float = 0.1,
+    ) -> None:
+        self.namespace = namespace
+        self.channel = channel
+        self.codec = codec or Codec()
+        self.ttl = ttl
+        self.soft_ttl = ttl if soft_ttl is None else min(soft_ttl, ttl)
+        self.fill_lock_seconds = fill_lock_seconds
+        self.fill_poll_seconds = fill_poll_seconds
+        self.local = LRUCache(local_size, local_ttl)
+        self.stats = CacheStats()
+        self.breaker = breaker
+        self._client_factory = client_factory
+        self._pubsub_factory = pubsub_factory or client_factory
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._inflight_groups: dict[str, str | None] = {}
+        self._discard: set[asyncio.Task] = set()
+        self._listener: asyncio.Task | None = None
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _group_key(self, group: str) -> str:
+        return f"{self.namespace}:group:{group}"
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.namespace}:lock:{key}"
+
+    async def _client(self) -> Any:
+        if self.breaker is not None and not self.breaker.allow():
+            return None
+        return await self._client_factory()
+
+    def _redis_ok(self) -> None:
+        if self.breaker is not None:
+            self.breaker.record_success()
+
+    def _redis_failed(self, action: str, key: str, exc: Exception) -> None:
+        self.stats.errors += 1
+        if self.breaker is not None:
+            self.breaker.record_failure()
+        logger.debug("Redis %s of %s failed: %s", action, key, exc)
+
+    async def _remote_get(self, key: str) -> CacheEntry | None:
+        client = await self._client()
+        if client is None:
+            return None
+        try:
+            data = await client.get(self._redis_key(key))
+        except Exception as exc:
+            self._redis_failed("read", key, exc)
+            return None
+        self._redis_ok()
+        if not data:
+            return None
+        try:
+            entry = CacheEntry(**self.codec.decode(data))
+        except Exception as exc:
+            self.stats.errors += 1
+            logger.warning("Could not decode cached %s: %s", key, exc)
+            return None
+        self.local.set(key, entry, group=entry.group)
+        return entry
+
+    async def _lookup(self, key: str) -> CacheEntry | None:
+        """Freshest entry for ``key``; a stale local entry is checked against Redis."""
+        entry = self.local.get(key)
+        if entry is None or entry.stale:
+            remote = await self._remote_get(key)
+            if remote is not None and (entry is None or remote.fresh_until > entry.fresh_until):
+                if not remote.stale:
+                    self.stats.redis_hits += 1
+                return remote
+        else:
+            self.stats.local_hits += 1
+        return entry
+
+    async def get(self, key: str) -> Any:
+        """Cached value for ``key``, stale or not."""
+        entry = await self._lookup(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        if entry.stale:
+            self.stats.stale += 1
+        return entry.value
+
+    async def set(self, key: str, value: Any, ttl: float | None = None, group: str | None = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        entry = CacheEntry(value, time.time() + min(self.soft_ttl, ttl), group)
+        self.local.set(key, entry, group=group)
+        client = await self._client()
+        if client is None:
+            return
+        try:
+            data = self.codec.encode(asdict(entry))
+        except Exception as exc:
+            self.stats.errors += 1
+            logger.warning("Could not encode %s for Redis: %s", key, exc)
+            return
+        # milliseconds, so sub-second TTLs don't round to an invalid EX 0
+        px = max(1, int(ttl * 1000))
+        try:
+            if group is None:
+                await client.set(self._redis_key(key), data, px=px)
+            else:
+                async with client.pipeline(transaction=False) as pipe:
+                    pipe.set(self._redis_key(key), data, px=px)
+                    pipe.sadd(self._group_key(group), key)
+                    pipe.expire(self._group_key(group), int(self.ttl))
+                    await pipe.execute()
+        except Exception as exc:
+            self._redis_failed("write", key, exc)
+            return
+        self._redis_ok()
+
+    async def delete(self, key: str) -> None:
+        self.local.delete(key)
+        client = await self._client()
+        if client is None:
+            return
+        try:
+            await client.delete(self._redis_key(key))
+        except Exception as exc:
+            self._redis_failed("delete", key, exc)
+            return
+        self._redis_ok()
+
+    def evict_group(self, group: str) -> None:
+        """Drop ``group`` from this worker.
+
+        Fills already running for the group may have read the old data: their
+        callers still get the result, but it is not stored and new callers
+        start a fresh fill.
+        """
+        self.local.delete_group(group)
+        for key in [key for key, key_group in self._inflight_groups.items() if key_group == group]:
+            self._discard.add(self._inflight.pop(key))
+            del self._inflight_groups[key]
+
+    async def invalidate(self, group: str) -> None:
+        """Delete ``group`` everywhere: here, in Redis and in subscribed workers."""
+        self.stats.invalidations += 1
+        self.evict_group(group)
+        client = await self._client()
+        if client is None:
+            # other workers' copies expire with the LRU TTL
+            return
+        try:
+            keys = [_text(key) for key in await client.smembers(self._group_key(group))]
+            await client.delete(self._group_key(group), *(self._redis_key(key) for key in keys))
+            if self.channel:
+                await client.publish(self.channel, group)
+        except Exception as exc:
+            self._redis_failed("invalidation", group, exc)
+            logger.warning("Could not invalidate cache group %s in Redis: %s", group, exc)
+            return
+        self._redis_ok()
+
+    def start_listener(self) -> None:
+        """Subscribe this worker to invalidations, once per event loop."""
+        if self.channel and (self._listener is None or self._listener.done()):
+            self._listener = asyncio.ensure_future(self._listen())
+
+    async def stop_listener(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self, max_retry_seconds: float = 30.0) -> None:
+        retry = 1.0
+        while True:
+            if self.breaker is not None and self.breaker.state == "open":
+                # start_listener runs again once requests reach Redis
+                return
+            client = await self._pubsub_factory()
+            if client is None:
+                return
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    # invalidations published while unsubscribed are lost
+                    self.local.clear()
+                    retry = 1.0
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.evict_group(_text(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Cache invalidation listener on %s failed (%s); retrying in %.0fs", self.channel, exc, retry)
+            await asyncio.sleep(retry)
+            retry = min(retry * 2, max_retry_seconds)
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[T]],
+        ttl: float | None = None,
+        group: str | None = None,
+        none_ttl: float | None = None,
+    ) -> T:
+        """Cached value for ``key``, computing and storing it once on a miss.
+
+        ``compute`` may outlive the calling request when it refreshes a stale
+        entry, so it must not borrow request-scoped resources. A caller that
+        is cancelled does not cancel the fill other callers are waiting on.
+        A None result is not stored, unless ``none_ttl`` says for how long.
+        """
+        entry = self.local.get(key)
+        if entry is not None and not entry.stale:
+            self.stats.local_hits += 1
+            return entry.value
+        task = self._inflight.get(key)
+        if task is not None:
+            if entry is not None:
+                self.stats.stale += 1
+                return entry.value
+            self.stats.coalesced += 1
+            return await asyncio.shield(task)
+
+        entry = await self._lookup(key)
+        if entry is not None and not entry.stale:
+            return entry.value
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fill(key, compute, ttl, group, none_ttl))
+            self._inflight[key] = task
+            self._inflight_groups[key] = group
+            task.add_done_callback(lambda t: self._fill_done(key, t))
+            if entry is not None:
+                self.stats.refreshes += 1
+        if entry is not None:
+            self.stats.stale += 1
+            return entry.value
+        self.stats.misses += 1
+        return await asyncio.shield(task)
+
+    async def _fill(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[T]],
+        ttl: float | None,
+        group: str | None,
+        none_ttl: float | None = None,
+    ) -> T:
+        locked = False
+        if self.fill_lock_seconds > 0:
+            locked, entry = await self._acquire_fill(key)
+            if entry is not None:
+                return entry.value
+        try:
+            value = await compute()
+            if asyncio.current_task() not in self._discard:
+                if value is not None:
+                    await self.set(key, value, ttl, group)
+                elif none_ttl:
+                    await self.set(key, None, none_ttl, group)
+            return value
+        finally:
+            if locked:
+                await self._release_fill(key)
+
+    async def _acquire_fill(self, key: str) -> tuple[bool, CacheEntry | None]:
+        """Take the cross-worker fill lock for ``key``, or wait for its holder.
+
+        Returns whether the lock was taken and, if another worker stored a
+        fresh value in time, that entry.
+        """
+        client = await self._client()
+        if client is None:
+            return False, None
+        try:
+            acquired = await client.set(self._lock_key(key), b"1", nx=True, ex=math.ceil(self.fill_lock_seconds))
+        except Exception as exc:
+            self._redis_failed("lock", key, exc)
+            return False, None
+        self._redis_ok()
+        if acquired:
+            return True, None
+        deadline = time.monotonic() + self.fill_lock_seconds
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.fill_poll_seconds)
+            entry = await self._remote_get(key)
+            if entry is not None and not entry.stale:
+                self.stats.coalesced += 1
+                return False, entry
+        logger.debug("Gave up waiting for another worker to fill %s", key)
+        return False, None
+
+    async def _release_fill(self, key: str) -> None:
+        client = await self._client()
+        if client is None:
+            return
+        try:
+            await client.delete(self._lock_key(key))
+        except Exception as exc:
+            self._redis_failed("unlock", key, exc)
+
+    def _fill_done(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            del self._inflight_groups[key]
+        self._discard.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Filling cache key %s failed: %r", key, task.exception())
+
+
+class RefreshingCache(Generic[K, T]):
+    """Process-wide values shared by every request, rebuilt on a schedule.
+
+    The first ``get`` of a key builds it, with concurrent callers awaiting the
+    same build. After that the value is served from memory and rebuilt in the
+    background once it is ``refresh_seconds`` old; a failed rebuild keeps the
+    previous value.
+    """
+
+    def __init__(self, build: Callable[[K], Awaitable[T]], refresh_seconds: float, max_entries: int = 256) -> None:
+        self.build = build
+        self.refresh_seconds = refresh_seconds
+        self.max_entries = max_entries
+        self._values: OrderedDict[K, tuple[float, T]] = OrderedDict()
+        self._building: dict[K, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def peek(self, key: K) -> T | None:
+        entry = self._values.get(key)
+        return None if entry is None else entry[1]
+
+    async def get(self, key: K) -> T:
+        entry = self._values.get(key)
+        if entry is None:
+            return await asyncio.shield(self._start_build(key))
+        self._values.move_to_end(key)
+        if time.monotonic() - entry[0] > self.refresh_seconds:
+            self._start_build(key)
+        return entry[1]
+
+    def invalidate(self, key: K) -> None:
+        self._values.pop(key, None)
+
+    def _start_build(self, key: K) -> asyncio.Task:
+        task = self._building.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._build(key))
+            self._building[key] = task
+            task.add_done_callback(lambda t: self._build_done(key, t))
+        return task
+
+    async def _build(self, key: K) -> T:
+        value = await self.build(key)
+        self._values[key] = (time.monotonic(), value)
+        self._values.move_to_end(key)
+        while len(self._values) > self.max_entries:
+            self._values.popitem(last=False)
+        return value
+
+    def _build_done(self, key: K, task: asyncio.Task) -> None:
+        self._building.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Rebuilding shared %r failed: %r", key, task.exception())
+
+
+redis_breaker = CircuitBreaker(
+    "Redis",
+    failure_threshold=settings.REDIS_FAILURE_THRESHOLD,
+    retry_seconds=settings.REDIS_RETRY_SECONDS,
+    probe=_ping_redis,
+)
+feed_cache = TieredCache(
+    "feed",
+    local_size=settings.FEED_CACHE_LOCAL_SIZE,
+    local_ttl=settings.FEED_CACHE_LOCAL_TTL_SECONDS,
+    ttl=settings.FEED_CACHE_TTL_SECONDS,
+    soft_ttl=settings.FEED_CACHE_SOFT_TTL_SECONDS,
+    channel="feed:invalidate",
+    codec=Codec(settings.CACHE_SERIALIZER, settings.CACHE_COMPRESSION, settings.CACHE_COMPRESSION_MIN_BYTES),
+    breaker=redis_breaker,
+    pubsub_factory=get_pubsub_redis,
+    # every worker warms the same users at startup; one computes each feed
+    fill_lock_seconds=settings.FEED_CACHE_FILL_LOCK_SECONDS,
+)
+
+upstream_cache = TieredCache(
+    "upstream",
+    local_size=settings.UPSTREAM_CACHE_LOCAL_SIZE,
+    local_ttl=settings.UPSTREAM_CACHE_LOCAL_TTL_SECONDS,
+    ttl=settings.UPSTREAM_CACHE_TTL_SECONDS,
+    codec=Codec(settings.CACHE_SERIALIZER, settings.CACHE_COMPRESSION, settings.CACHE_COMPRESSION_MIN_BYTES),
+    breaker=redis_breaker,
+    fill_lock_seconds=settings.UPSTREAM_FILL_LOCK_SECONDS,
+)
+
+
+async def invalidate_user_feeds(username: str) -> None:
+    """Drop every cached feed of ``username`` after their engagements change."""
+    await feed_cache.invalidate(username)
 
 
 def paginate(items: list[dict], limit: int, offset: int) -> list[dict]:
     start = max(offset, 0)
     end = start + max(limit, 0)
     return items[start:end]
-
-
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import json
+import zlib
+from dataclasses import dataclass
+from typing import Any, Callable
+
+try:
+    import orjson
+except Exception:  # pragma: no cover - optional dependency
+    orjson = None  # type: ignore
+
+try:
+    import msgpack
+except Exception:  # pragma: no cover - optional dependency
+    msgpack = None  # type: ignore
+
+try:
+    import zstandard
+except Exception:  # pragma: no cover - optional dependency
+    zstandard = None  # type: ignore
+
+try:
+    import lz4.frame as lz4_frame
+except Exception:  # pragma: no cover - optional dependency
+    lz4_frame = None  # type: ignore
+
+
+# Encoded values start with FORMAT_VERSION, a serializer id and a compression
+# id, so any worker can decode what another wrote with different settings.
+FORMAT_VERSION = 1
+
+
+@dataclass(frozen=True)
+class Serializer:
+    id: int
+    name: str
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[bytes], Any]
+
+
+@dataclass(frozen=True)
+class Compressor:
+    id: int
+    name: str
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+SERIALIZERS: dict[str, Serializer] = {"json": Serializer(0, "json", _json_dumps, json.loads)}
+if orjson is not None:
+    SERIALIZERS["orjson"] = Serializer(1, "orjson", orjson.dumps, orjson.loads)
+if msgpack is not None:
+    SERIALIZERS["msgpack"] = Serializer(
+        2,
+        "msgpack",
+        lambda value: msgpack.packb(value, use_bin_type=True),
+        lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False),
+    )
+
+COMPRESSORS: dict[str, Compressor] = {
+    "none": Compressor(0, "none", bytes, bytes),
+    "zlib": Compressor(1, "zlib", lambda data: zlib.compress(data, 1), zlib.decompress),
+}
+if zstandard is not None:
+    _zstd_compressor = zstandard.ZstdCompressor(level=3)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+    COMPRESSORS["zstd"] = Compressor(2, "zstd", _zstd_compressor.compress, _zstd_decompressor.decompress)
+if lz4_frame is not None:
+    COMPRESSORS["lz4"] = Compressor(3, "lz4", lz4_frame.compress, lz4_frame.decompress)
+
+_SERIALIZERS_BY_ID = {s.id: s for s in SERIALIZERS.values()}
+_COMPRESSORS_BY_ID = {c.id: c for c in COMPRESSORS.values()}
+
+
+def _pick(name: str, available: dict, preference: tuple[str, ...]):
+    if name == "auto":
+        return next(available[n] for n in preference if n in available)
+    if name not in available:
+        raise ValueError(f"Codec {name!r} is not installed; available: {', '.join(available)}")
+    return available[name]
+
+
+class Codec:
+    """Bytes for cached values: serialize, then compress above ``min_compress_bytes``.
+
+    ``serializer`` is json, orjson or msgpack and ``compression`` none, zlib,
+    zstd or lz4; "auto" picks the fastest installed one. Decoding follows the
+    header, not the settings.
+    """
+
+    def __init__(self, serializer: str = "auto", compression: str = "auto", min_compress_bytes: int = 1024) -> None:
+        self.serializer = _pick(serializer, SERIALIZERS, ("msgpack", "orjson", "json"))
+        self.compressor = _pick(compression, COMPRESSORS, ("zstd", "lz4", "zlib"))
+        self.min_compress_bytes = min_compress_bytes
+
+    def encode(self, value: Any) -> bytes:
+        data = self.serializer.dumps(value)
+        compressor = COMPRESSORS["none"]
+        if self.compressor.id and len(data) >= self.min_compress_bytes:
+            compressed = self.compressor.compress(data)
+            if len(compressed) < len(data):
+                compressor, data = self.compressor, compressed
+        return bytes((FORMAT_VERSION, self.serializer.id, compressor.id)) + data
+
+    def decode(self, data: bytes | str) -> Any:
+        if isinstance(data, str):
+            data = data.encode()
+        if data[:1] in (b"{", b"["):
+            # written as plain JSON before the codec existed
+            return json.loads(data)
+        if len(data) < 3 or data[0] != FORMAT_VERSION:
+            raise ValueError(f"Unknown cache format {data[:1]!r}")
+        serializer = _SERIALIZERS_BY_ID.get(data[1])
+        compressor = _COMPRESSORS_BY_ID.get(data[2])
+        if serializer is None or compressor is None:
+            raise ValueError(f"Cache value needs serializer {data[1]} / compression {data[2]}, which are not installed")
+        return serializer.loads(compressor.decompress(data[3:]))
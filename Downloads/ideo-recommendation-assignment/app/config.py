@@ -5,7 +5,7 @@ Handles environment variables and application settings.
 
 import os
 from functools import lru_cache
-from typing import Optional
+from typing import Dict, Optional
 
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
@@ -37,6 +37,17 @@ class Settings(BaseSettings):
         default="redis://localhost:6379/0",
         description="Redis connection URL for caching"
     )
+    REDIS_MAX_CONNECTIONS: int = Field(default=50, description="Connections in each worker's Redis pool")
+    REDIS_SOCKET_TIMEOUT_SECONDS: float = Field(default=0.25, description="Redis command timeout")
+    REDIS_CONNECT_TIMEOUT_SECONDS: float = Field(default=0.25, description="Redis connect timeout")
+    REDIS_FAILURE_THRESHOLD: int = Field(
+        default=5,
+        description="Consecutive Redis failures that open the circuit and turn caching off"
+    )
+    REDIS_RETRY_SECONDS: float = Field(
+        default=5.0,
+        description="How often an open Redis circuit probes for recovery"
+    )
     
     # Application Configuration
     APP_NAME: str = Field(default="video-recommendation-engine", description="Application name")
@@ -48,6 +59,248 @@ class Settings(BaseSettings):
         description="Resonance algorithm parameter for external APIs"
     )
     
+    # Recommendation Engine Configuration
+    FEATURE_INDEX_PATH: str = Field(
+        default="data/post_features.npz",
+        description="On-disk location of the post feature index"
+    )
+    FEATURE_INDEX_REFRESH_SECONDS: float = Field(
+        default=30.0,
+        description="How often API workers check for a newer post feature index"
+    )
+    FEED_SCORING_CHUNK_SIZE: int = Field(
+        default=500,
+        description="Posts loaded per keyset page when scoring the full catalog"
+    )
+    FEED_SNAPSHOT_SIZE: int = Field(
+        default=500,
+        description="Depth of the ranked snapshot kept for cursor pagination"
+    )
+    FEED_SNAPSHOT_MAX_COUNT: int = Field(
+        default=1000,
+        description="Ranked snapshots held per worker"
+    )
+    FEED_SNAPSHOT_TTL_SECONDS: float = Field(
+        default=600.0,
+        description="How long a ranked snapshot serves cursor pages"
+    )
+    
+    # Candidate Pipeline: retrieval sources and their time budgets
+    PIPELINE_SOURCE_LIMIT: int = Field(
+        default=200,
+        description="Candidates requested from each retrieval source"
+    )
+    PIPELINE_STAGE_BUDGET_MS: float = Field(
+        default=50.0,
+        description="Time budget of one candidate source before it is skipped"
+    )
+    PIPELINE_STAGE_BUDGETS_MS: Dict[str, float] = Field(
+        default_factory=dict,
+        description="Per-source budget overrides, e.g. {\"ann\": 10}"
+    )
+    PIPELINE_TOTAL_BUDGET_MS: float = Field(
+        default=150.0,
+        description="Wall-clock limit on candidate generation for one request"
+    )
+    
+    # Offline Models: item-item neighbours, ALS factors and the ANN index over them
+    ITEM_NEIGHBOURS_PATH: str = Field(
+        default="data/item_neighbours.npz",
+        description="Precomputed item-item neighbour lists"
+    )
+    ITEM_NEIGHBOURS_TOP_N: int = Field(
+        default=50,
+        description="Neighbours kept per video by the item-item build"
+    )
+    ALS_MODEL_DIR: str = Field(
+        default="data/als",
+        description="Directory holding versioned ALS factor files"
+    )
+    ANN_INDEX_PATH: str = Field(
+        default="data/ann_index.npz",
+        description="IVF index over the ALS video factors"
+    )
+    ANN_NPROBE: int = Field(
+        default=8,
+        description="Partitions scanned per ANN query"
+    )
+    ANN_CANDIDATES: int = Field(
+        default=300,
+        description="Candidates fetched from the ANN index per request"
+    )
+    
+    # Trending Configuration
+    TRENDING_BACKEND: str = Field(
+        default="memory",
+        description="Where trending counters live: memory (single process) or redis"
+    )
+    TRENDING_HALF_LIFE_HOURS: float = Field(
+        default=6.0,
+        description="Half-life of an engagement in the trending counters"
+    )
+    TRENDING_SNAPSHOT_DIR: str = Field(
+        default="data/trending",
+        description="Snapshot directory for in-memory trending counters"
+    )
+    TRENDING_LIST_SIZE: int = Field(
+        default=500,
+        description="Depth of the ready-ranked trending list served to cold-start feeds"
+    )
+    TRENDING_REFRESH_SECONDS: float = Field(
+        default=30.0,
+        description="How often ranked trending lists are rebuilt in the background"
+    )
+    
+    # Feed Cache: per-worker LRU in front of Redis, plus HTTP caching of responses
+    FEED_CACHE_TTL_SECONDS: int = Field(
+        default=3600,
+        description="Hard TTL: how long a cached feed may be served at all"
+    )
+    FEED_CACHE_SOFT_TTL_SECONDS: float = Field(
+        default=300.0,
+        description="Soft TTL: older cached feeds are served once more while they are recomputed"
+    )
+    FEED_CACHE_COLD_START_TTL_SECONDS: float = Field(
+        default=30.0,
+        description="How long a feed with nothing personal to rank is remembered as such"
+    )
+    FEED_CACHE_LOCAL_SIZE: int = Field(
+        default=10000,
+        description="Feeds kept in each worker's in-process LRU"
+    )
+    FEED_CACHE_LOCAL_TTL_SECONDS: float = Field(
+        default=120.0,
+        description="Lifetime of a feed in the in-process LRU; keep it below the Redis TTL"
+    )
+    FEED_CACHE_FILL_LOCK_SECONDS: float = Field(
+        default=10.0,
+        description="How long workers wait for another worker computing the same feed before computing it too"
+    )
+    SHARED_FEED_REFRESH_SECONDS: float = Field(
+        default=60.0,
+        description="How often the shared cold-start and category feeds are rebuilt"
+    )
+    FEED_HTTP_MAX_AGE_SECONDS: int = Field(
+        default=15,
+        description="Cache-Control max-age of feed responses, for clients and CDNs"
+    )
+    FEED_HTTP_STALE_SECONDS: int = Field(
+        default=60,
+        description="Cache-Control stale-while-revalidate of feed responses"
+    )
+    
+    # Cache Encoding: how values are stored in Redis, by every cache
+    CACHE_SERIALIZER: str = Field(
+        default="auto",
+        description="Serializer for cached values: auto, msgpack, orjson or json"
+    )
+    CACHE_COMPRESSION: str = Field(
+        default="auto",
+        description="Compression for cached values: auto, zstd, lz4, zlib or none"
+    )
+    CACHE_COMPRESSION_MIN_BYTES: int = Field(
+        default=1024,
+        description="Cached values smaller than this are stored uncompressed"
+    )
+    
+    # Cache Warm-up Configuration
+    WARMUP_ON_STARTUP: bool = Field(
+        default=True,
+        description="Precompute feeds of recently active users when the app starts"
+    )
+    WARMUP_USERS: int = Field(
+        default=1000,
+        description="How many of the most recently active users get their feeds warmed"
+    )
+    WARMUP_CONCURRENCY: int = Field(
+        default=8,
+        description="Feeds computed at once during warm-up"
+    )
+    WARMUP_READY_COVERAGE: float = Field(
+        default=0.9,
+        description="Share of warm-up users that must be cached before /ready reports ready"
+    )
+    WARMUP_CHECK_SECONDS: float = Field(
+        default=60.0,
+        description="How often warm-up checks for a rebuilt model to warm feeds for"
+    )
+    
+    # Socialverse Client: connection pool, rate limit, retries and paging
+    UPSTREAM_MAX_CONNECTIONS: int = Field(
+        default=100,
+        description="Connections each process may open to the Socialverse API"
+    )
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS: int = Field(
+        default=20,
+        description="Idle Socialverse API connections kept open for reuse"
+    )
+    UPSTREAM_KEEPALIVE_SECONDS: float = Field(
+        default=30.0,
+        description="How long an idle Socialverse API connection is kept open"
+    )
+    UPSTREAM_HTTP2: bool = Field(
+        default=False,
+        description="Talk HTTP/2 to the Socialverse API; needs the h2 package"
+    )
+    UPSTREAM_TIMEOUT_SECONDS: float = Field(default=30.0, description="Socialverse API read/write timeout")
+    UPSTREAM_CONNECT_TIMEOUT_SECONDS: float = Field(default=5.0, description="Socialverse API connect timeout")
+    UPSTREAM_RATE_LIMIT: float = Field(
+        default=20.0,
+        description="Requests per second each process starts with towards the Socialverse API"
+    )
+    UPSTREAM_MIN_RATE: float = Field(
+        default=1.0,
+        description="Floor the rate drops to while the Socialverse API keeps answering 429"
+    )
+    UPSTREAM_BURST: int = Field(default=20, description="Requests that may start at once before the rate applies")
+    UPSTREAM_MAX_RETRIES: int = Field(
+        default=4,
+        description="Retries of a Socialverse request after 429, 502-504 or a connection error"
+    )
+    UPSTREAM_BACKOFF_BASE_SECONDS: float = Field(default=0.5, description="First retry backoff, doubled per attempt")
+    UPSTREAM_BACKOFF_MAX_SECONDS: float = Field(default=30.0, description="Longest retry backoff")
+    UPSTREAM_PAGE_SIZE: int = Field(default=1000, description="Rows requested per page from Socialverse list endpoints")
+    UPSTREAM_PAGE_CONCURRENCY: int = Field(
+        default=4,
+        description="Pages of one Socialverse list endpoint fetched at once"
+    )
+    UPSTREAM_MAX_PAGES: int = Field(
+        default=1000,
+        description="Safety cap on pages read from one Socialverse list endpoint"
+    )
+    
+    # Socialverse Response Cache
+    UPSTREAM_CACHE_TTL_SECONDS: int = Field(
+        default=300,
+        description="How long Socialverse API responses are cached in Redis, shared by every worker"
+    )
+    UPSTREAM_CACHE_LOCAL_SIZE: int = Field(
+        default=256,
+        description="Socialverse API responses kept in each worker's in-process LRU"
+    )
+    UPSTREAM_CACHE_LOCAL_TTL_SECONDS: float = Field(
+        default=60.0,
+        description="Lifetime of a Socialverse API response in the in-process LRU"
+    )
+    UPSTREAM_FILL_LOCK_SECONDS: float = Field(
+        default=30.0,
+        description="How long workers wait for another worker fetching the same API page before fetching it too"
+    )
+    
+    # Sync and Bulk Ingest Configuration
+    SYNC_USER_CONCURRENCY: int = Field(
+        default=8,
+        description="Users whose engagements the sync job fetches at once"
+    )
+    SYNC_STOP_AT_WATERMARK: bool = Field(
+        default=True,
+        description="Stop paging a newest-first list at the first page already below its sync watermark"
+    )
+    INGEST_BATCH_SIZE: int = Field(
+        default=1000,
+        description="Records the sync job buffers before writing them in one transaction"
+    )
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -1,11 +1,19 @@
 from __future__ import annotations
 
-from typing import Iterable, Sequence
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, AsyncIterator, Iterable, Sequence
 
-from sqlalchemy import select
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from .models import User, Post, Engagement, EngagementType
+from .cache import invalidate_user_feeds
+from .feature_index import post_feature_index
+from .models.posts import User, Post, Engagement, EngagementType, SyncState, UserProfile
+from .profiles import apply_engagement, engagement_weight, merge_seen
+from .services.ann import get_ann_index
+from .trending import get_trending_store
 
 
 async def get_user_by_username(db: AsyncSession, username: str) -> User | None:
@@ -21,6 +29,17 @@ async def create_user(db: AsyncSession, username: str) -> User:
     return user
 
 
+async def has_engagements(db: AsyncSession, username: str) -> bool:
+    engaged = select(Engagement.id).where(Engagement.user_id == User.id).exists()
+    result = await db.execute(select(User.id).where(User.username == username, engaged))
+    return result.first() is not None
+
+
+async def get_usernames(db: AsyncSession) -> list[str]:
+    result = await db.execute(select(User.username).order_by(User.id))
+    return list(result.scalars().all())
+
+
 async def get_or_create_user(db: AsyncSession, username: str) -> User:
     user = await get_user_by_username(db, username)
     if user:
@@ -28,15 +47,82 @@ async def get_or_create_user(db: AsyncSession, username: str) -> User:
     return await create_user(db, username)
 
 
-async def get_posts(db: AsyncSession, *, category: str | None = None, limit: int = 20, offset: int = 0) -> Sequence[Post]:
+async def get_posts(
+    db: AsyncSession,
+    *,
+    category: str | None = None,
+    limit: int = 20,
+    offset: int = 0,
+    exclude_ids: Iterable[int] = (),
+) -> Sequence[Post]:
     stmt = select(Post).order_by(Post.created_at.desc())
     if category:
         stmt = stmt.where(Post.category == category)
+    exclude_ids = list(exclude_ids)
+    if exclude_ids:
+        stmt = stmt.where(Post.id.notin_(exclude_ids))
     stmt = stmt.limit(limit).offset(offset)
     result = await db.execute(stmt)
     return list(result.scalars().all())
 
 
+async def get_posts_by_ids(db: AsyncSession, post_ids: Iterable[int]) -> Sequence[Post]:
+    ids = list(post_ids)
+    if not ids:
+        return []
+    result = await db.execute(select(Post).where(Post.id.in_(ids)))
+    return list(result.scalars().all())
+
+
+async def iter_post_chunks(
+    db: AsyncSession, *, category: str | None = None, chunk_size: int = 500
+) -> AsyncIterator[list[Post]]:
+    # Keyset pagination on the primary key: every page is an index range scan,
+    # however deep into the catalog we are.
+    last_id: int | None = None
+    while True:
+        stmt = select(Post).order_by(Post.id.desc()).limit(chunk_size)
+        if category:
+            stmt = stmt.where(Post.category == category)
+        if last_id is not None:
+            stmt = stmt.where(Post.id < last_id)
+        result = await db.execute(stmt)
+        chunk = list(result.scalars().all())
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1].id
+
+
+async def get_recent_post_ids(db: AsyncSession, *, limit: int, category: str | None = None) -> list[int]:
+    stmt = select(Post.id).order_by(Post.id.desc()).limit(limit)
+    if category:
+        stmt = stmt.where(Post.category == category)
+    result = await db.execute(stmt)
+    return list(result.scalars().all())
+
+
+async def get_post_ids_in_categories(db: AsyncSession, categories: Iterable[str], *, limit: int) -> list[int]:
+    # categories as normalised by post_features (lower case)
+    names = list(categories)
+    if not names:
+        return []
+    stmt = select(Post.id).where(func.lower(Post.category).in_(names)).order_by(Post.id.desc()).limit(limit)
+    result = await db.execute(stmt)
+    return list(result.scalars().all())
+
+
+async def get_popular_post_ids(db: AsyncSession, *, limit: int, category: str | None = None) -> list[int]:
+    engagements = func.count(Engagement.id)
+    stmt = select(Engagement.post_id).group_by(Engagement.post_id).order_by(engagements.desc()).limit(limit)
+    if category:
+        stmt = stmt.join(Post, Post.id == Engagement.post_id).where(Post.category == category)
+    result = await db.execute(stmt)
+    return list(result.scalars().all())
+
+
 async def get_post_by_title(db: AsyncSession, title: str) -> Post | None:
     result = await db.execute(select(Post).where(Post.title == title))
     return result.scalars().first()
@@ -55,20 +141,314 @@ async def save_post(db: AsyncSession, *, title: str, category: str | None, metad
         if existing.category != category:
             existing.category = category
             updated = True
-        if metadata is not None and existing.metadata != metadata:
-            existing.metadata = metadata
+        if metadata is not None and existing.post_metadata != metadata:
+            existing.post_metadata = metadata
             updated = True
         if updated:
             await db.commit()
             await db.refresh(existing)
+        post_feature_index.upsert(existing.id, existing.category, existing.post_metadata)
         return existing
-    post = Post(title=title, category=category, metadata=metadata)
+    post = Post(title=title, category=category, post_metadata=metadata)
     db.add(post)
     await db.commit()
     await db.refresh(post)
+    post_feature_index.upsert(post.id, post.category, post.post_metadata)
+    await _index_post_embedding(db, post)
     return post
 
 
+async def _index_post_embedding(db: AsyncSession, post: Post, siblings: int = 200) -> None:
+    # a new post has no engagements to learn a vector from, so it enters the
+    # ANN index at the mean vector of recent posts in its category
+    index = get_ann_index()
+    if index is None or not post.category or str(post.id) in index:
+        return
+    result = await db.execute(
+        select(Post.id)
+        .where(Post.category == post.category, Post.id != post.id)
+        .order_by(Post.id.desc())
+        .limit(siblings)
+    )
+    vector = index.mean_vector(str(pid) for pid in result.scalars())
+    if vector is not None:
+        index.add(str(post.id), vector)
+
+
+async def get_user_profile(db: AsyncSession, user_id: int) -> UserProfile | None:
+    return await db.get(UserProfile, user_id)
+
+
+async def _engagement_features(db: AsyncSession, post_id: int) -> dict[str, float]:
+    features = post_feature_index.features(post_id)
+    if features is None:
+        post = await db.get(Post, post_id)
+        if post is None:
+            return {}
+        post_feature_index.upsert(post.id, post.category, post.post_metadata)
+        features = post_feature_index.features(post_id) or {}
+    return features
+
+
+async def _aggregate_profile(db: AsyncSession, profile: UserProfile) -> None:
+    engagements = await get_user_engagements(db, profile.user_id)
+    vector: dict[str, float] = {}
+    seen: list[int] = []
+    for e in engagements:
+        features = await _engagement_features(db, e.post_id)
+        vector = apply_engagement(vector, features, engagement_weight(e.type, e.rating_score))
+        seen = merge_seen(seen, e.post_id)
+    profile.vector = vector
+    profile.seen_post_ids = seen
+    profile.engagement_count = len(engagements)
+
+
+async def rebuild_user_profile(db: AsyncSession, user_id: int) -> UserProfile | None:
+    """Aggregate a profile from the full engagement history.
+
+    Only used to backfill users whose engagements predate profiles;
+    save_engagement keeps profiles current incrementally.
+    """
+    profile = await get_user_profile(db, user_id)
+    if profile is None:
+        profile = UserProfile(user_id=user_id)
+        db.add(profile)
+    await _aggregate_profile(db, profile)
+    if not profile.engagement_count:
+        db.expunge(profile)
+        return None
+    await db.commit()
+    return profile
+
+
+def _upsert(db: AsyncSession, model):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    # dependencies.check_dialect refuses any other database at startup
+    raise NotImplementedError(f"Bulk upserts support PostgreSQL and SQLite, not {dialect}")
+
+
+async def dedupe_post_titles(db: AsyncSession) -> int:
+    """Merge posts sharing a title into the oldest one; returns how many were removed.
+
+    Engagements move to the kept post. Needed once before the unique title
+    index can be built on a database older than it. Does not commit.
+    """
+    keep = func.min(Post.id).label("keep")
+    groups = (await db.execute(select(Post.title, keep).group_by(Post.title).having(func.count() > 1))).all()
+    removed = 0
+    for title, kept in groups:
+        dupes = select(Post.id).where(Post.title == title, Post.id != kept)
+        await db.execute(update(Engagement).where(Engagement.post_id.in_(dupes)).values(post_id=kept))
+        removed += (await db.execute(delete(Post).where(Post.title == title, Post.id != kept))).rowcount
+    return removed
+
+
+async def dedupe_engagements(db: AsyncSession) -> int:
+    """Drop all but the oldest engagement per user, post and type; returns how many went.
+
+    Profiles of the users affected are deleted and rebuilt from the
+    remaining history on their next feed. Needed once before the unique
+    engagement index can be built on a database older than it. Does not commit.
+    """
+    keep = select(func.min(Engagement.id)).group_by(Engagement.user_id, Engagement.post_id, Engagement.type)
+    dupes = select(Engagement.user_id).where(Engagement.id.not_in(keep))
+    users = set((await db.execute(dupes)).scalars())
+    if not users:
+        return 0
+    removed = (await db.execute(delete(Engagement).where(Engagement.id.not_in(keep)))).rowcount
+    await db.execute(delete(UserProfile).where(UserProfile.user_id.in_(users)))
+    return removed
+
+
+async def upsert_users(db: AsyncSession, usernames: Iterable[str]) -> dict[str, int]:
+    """Insert missing users in one statement; ids of all of them by username."""
+    names = sorted(set(usernames))
+    if not names:
+        return {}
+    now = datetime.utcnow()
+    stmt = _upsert(db, User).on_conflict_do_nothing(index_elements=["username"])
+    await db.execute(stmt, [{"username": name, "created_at": now} for name in names])
+    result = await db.execute(select(User.username, User.id).where(User.username.in_(names)))
+    return dict(result.tuples().all())
+
+
+async def upsert_posts(db: AsyncSession, posts: Iterable[dict]) -> dict[str, tuple[int, bool]]:
+    """Insert or update posts by title in one statement, like save_post does row by row.
+
+    ``posts`` holds title, category and metadata; a None metadata keeps the
+    stored one. Returns ``(id, created)`` by title. Does not commit.
+    """
+    rows = {post["title"]: post for post in posts}
+    if not rows:
+        return {}
+    existing = set((await db.execute(select(Post.title).where(Post.title.in_(rows)))).scalars())
+    now = datetime.utcnow()
+    ids: dict[str, int] = {}
+    # one executemany per shape keeps the compiled statement cached
+    for with_metadata in (True, False):
+        params = [
+            {"title": title, "category": post.get("category"), "created_at": now}
+            | ({"post_metadata": post["metadata"]} if with_metadata else {})
+            for title, post in rows.items()
+            if (post.get("metadata") is not None) == with_metadata
+        ]
+        if not params:
+            continue
+        stmt = _upsert(db, Post)
+        updates = {"category": stmt.excluded.category}
+        if with_metadata:
+            updates["post_metadata"] = stmt.excluded.post_metadata
+        stmt = stmt.on_conflict_do_update(index_elements=["title"], set_=updates).returning(Post.id, Post.title)
+        result = await db.execute(stmt, params)
+        ids.update((title, post_id) for post_id, title in result.tuples())
+    for title, post in rows.items():
+        post_feature_index.upsert(ids[title], post.get("category"), post.get("metadata"))
+    return {title: (post_id, title not in existing) for title, post_id in ids.items()}
+
+
+async def get_sync_states(db: AsyncSession) -> dict[str, tuple[Any, int]]:
+    """``(mark, run)`` of every upstream list the sync job has written, by key."""
+    result = await db.execute(select(SyncState.key, SyncState.mark, SyncState.run))
+    return {key: (mark, run) for key, mark, run in result.tuples()}
+
+
+async def save_sync_states(db: AsyncSession, states: dict[str, tuple[Any, int]]) -> None:
+    """Upsert ``(mark, run)`` by key in one statement. Does not commit."""
+    if not states:
+        return
+    now = datetime.utcnow()
+    stmt = _upsert(db, SyncState)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["key"],
+        set_={"mark": stmt.excluded.mark, "run": stmt.excluded.run, "updated_at": stmt.excluded.updated_at},
+    )
+    await db.execute(
+        stmt,
+        [{"key": key, "mark": mark, "run": run, "updated_at": now} for key, (mark, run) in states.items()],
+    )
+
+
+async def index_new_post_embeddings(db: AsyncSession, posts: Iterable[tuple[int, str | None]], siblings: int = 200) -> None:
+    """Batch form of _index_post_embedding: one sibling query per category."""
+    index = get_ann_index()
+    if index is None:
+        return
+    by_category: dict[str, list[int]] = defaultdict(list)
+    for post_id, category in posts:
+        if category and str(post_id) not in index:
+            by_category[category].append(post_id)
+    for category, post_ids in by_category.items():
+        result = await db.execute(
+            select(Post.id)
+            .where(Post.category == category, Post.id.notin_(post_ids))
+            .order_by(Post.id.desc())
+            .limit(siblings)
+        )
+        vector = index.mean_vector(str(pid) for pid in result.scalars())
+        if vector is not None:
+            for post_id in post_ids:
+                index.add(str(post_id), vector)
+
+
+async def insert_engagements(db: AsyncSession, rows: Sequence[dict]) -> list[dict]:
+    """Insert new engagements in batched multi-row INSERTs and fold them into profiles.
+
+    ``rows`` hold user_id, post_id, type, rating_score and timestamp. A
+    user, post and type already stored, or earlier in ``rows``, is skipped
+    by ON CONFLICT, so syncing the same upstream rows again writes nothing;
+    only a stored rating synced with another score is updated, and its
+    profile moved by the difference in weight. Returns the rows written,
+    updated ratings with their old score as ``previous_rating_score``.
+    Does not commit; trending and feed invalidation are left to the caller.
+    """
+    unique: dict[tuple, dict] = {}
+    for row in rows:
+        unique.setdefault((row["user_id"], row["post_id"], row["type"]), row)
+    if not unique:
+        return []
+    previous = await _changed_ratings(db, unique)
+    stmt = _upsert(db, Engagement)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "post_id", "type"],
+        set_={"rating_score": stmt.excluded.rating_score},
+        where=(Engagement.type == EngagementType.rating)
+        & Engagement.rating_score.is_distinct_from(stmt.excluded.rating_score),
+    ).returning(Engagement.user_id, Engagement.post_id, Engagement.type)
+    result = await db.execute(stmt, list(unique.values()))
+    keys = [tuple(key) for key in result.tuples()]
+    if not keys:
+        return []
+    rows = []
+    by_user: dict[int, list[tuple]] = defaultdict(list)
+    for key in keys:
+        row = unique[key]
+        weight = engagement_weight(row["type"], row.get("rating_score"))
+        if key in previous:
+            row = {**row, "previous_rating_score": previous[key]}
+            weight -= engagement_weight(row["type"], previous[key])
+        rows.append(row)
+        by_user[row["user_id"]].append((row["post_id"], weight, key not in previous))
+    result = await db.execute(
+        select(UserProfile).where(UserProfile.user_id.in_(list(by_user))).with_for_update()
+    )
+    profiles = {profile.user_id: profile for profile in result.scalars()}
+
+    # users without a profile get one backfilled from their whole history,
+    # new rows included, read in one query for all of them
+    new_ids = [user_id for user_id in by_user if user_id not in profiles]
+    if new_ids:
+        history = await db.execute(
+            select(Engagement.user_id, Engagement.post_id, Engagement.type, Engagement.rating_score)
+            .where(Engagement.user_id.in_(new_ids))
+            .order_by(Engagement.id)
+        )
+        for user_id in new_ids:
+            by_user[user_id] = []
+            profiles[user_id] = UserProfile(user_id=user_id, vector={}, seen_post_ids=[], engagement_count=0)
+            db.add(profiles[user_id])
+        for user_id, post_id, etype, rating_score in history.tuples():
+            by_user[user_id].append((post_id, engagement_weight(etype, rating_score), True))
+
+    for user_id, user_rows in by_user.items():
+        profile = profiles[user_id]
+        vector, seen = profile.vector or {}, profile.seen_post_ids or []
+        added = 0
+        for post_id, weight, new in user_rows:
+            features = await _engagement_features(db, post_id)
+            vector = apply_engagement(vector, features, weight)
+            if new:
+                seen = merge_seen(seen, post_id)
+                added += 1
+        profile.vector = vector
+        profile.seen_post_ids = seen
+        profile.engagement_count = (profile.engagement_count or 0) + added
+    return rows
+
+
+async def _changed_ratings(db: AsyncSession, rows: dict[tuple, dict]) -> dict[tuple, int | None]:
+    """Stored scores of the ratings in ``rows`` that arrive with a different score."""
+    ratings = [key for key in rows if EngagementType(key[2]) == EngagementType.rating]
+    if not ratings:
+        return {}
+    result = await db.execute(
+        select(Engagement.user_id, Engagement.post_id, Engagement.rating_score).where(
+            Engagement.type == EngagementType.rating,
+            Engagement.user_id.in_({key[0] for key in ratings}),
+            Engagement.post_id.in_({key[1] for key in ratings}),
+        )
+    )
+    stored = {(user_id, post_id): score for user_id, post_id, score in result.tuples()}
+    return {
+        key: stored[key[:2]]
+        for key in ratings
+        if key[:2] in stored and stored[key[:2]] != rows[key].get("rating_score")
+    }
+
+
 async def save_engagement(
     db: AsyncSession,
     *,
@@ -76,11 +456,58 @@ async def save_engagement(
     post_id: int,
     type: EngagementType,
     rating_score: int | None = None,
+    invalidate_feeds: bool = True,
 ) -> Engagement:
-    engagement = Engagement(user_id=user_id, post_id=post_id, type=type, rating_score=rating_score)
-    db.add(engagement)
+    """Store an engagement and fold it into the user's profile and trending.
+
+    Pass ``invalidate_feeds=False`` when saving many engagements of one user
+    and call ``cache.invalidate_user_feeds`` once afterwards.
+    A user engages with a post in each way once; repeating it returns the
+    stored engagement and changes nothing, except that rating again with
+    another score replaces the stored score.
+    """
+    result = await db.execute(
+        select(Engagement).where(Engagement.user_id == user_id, Engagement.post_id == post_id, Engagement.type == type)
+    )
+    engagement = result.scalars().first()
+    rescored = engagement is not None
+    if rescored:
+        if type != EngagementType.rating or engagement.rating_score == rating_score:
+            return engagement
+        # the profile moves by the difference between the two scores' weights
+        weight = engagement_weight(type, rating_score) - engagement_weight(type, engagement.rating_score)
+        engagement.rating_score = rating_score
+    else:
+        engagement = Engagement(user_id=user_id, post_id=post_id, type=type, rating_score=rating_score)
+        db.add(engagement)
+        weight = engagement_weight(type, rating_score)
+    features = await _engagement_features(db, post_id)
+
+    # Fold the engagement into the stored profile in the same transaction
+    result = await db.execute(select(UserProfile).where(UserProfile.user_id == user_id).with_for_update())
+    profile = result.scalars().first()
+    if profile is None:
+        # first profile for this user: backfill from history, new row included
+        profile = UserProfile(user_id=user_id)
+        db.add(profile)
+        await db.flush()
+        await _aggregate_profile(db, profile)
+    else:
+        profile.vector = apply_engagement(profile.vector or {}, features, weight)
+        if not rescored:
+            profile.seen_post_ids = merge_seen(profile.seen_post_ids, post_id)
+            profile.engagement_count = (profile.engagement_count or 0) + 1
+
     await db.commit()
     await db.refresh(engagement)
+
+    if not rescored:
+        category = next((f[4:] for f in features if f.startswith("cat:")), None)
+        await get_trending_store("posts").record(str(post_id), category, weight, engagement.timestamp)
+    if invalidate_feeds:
+        user = await db.get(User, user_id)
+        if user is not None:
+            await invalidate_user_feeds(user.username)
     return engagement
 
 
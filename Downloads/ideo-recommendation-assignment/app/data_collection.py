@@ -1,16 +1,39 @@
 from __future__ import annotations
 
-from typing import Any, Optional
-
-import httpx
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Optional
 
+from . import crud
+from .cache import upstream_cache
 from .config import get_settings
-from .crud import save_post, save_engagement, get_or_create_user, get_user_by_username
-from .models import EngagementType
+from .http_client import get_with_retries
+from .ingest import BulkIngestor
+from .pagination import map_unordered, paginate
+from .models.posts import EngagementType
 from .dependencies import AsyncSession
+from .feature_index import post_feature_index
+from .services.ann import save_ann_index_if_dirty
+from .trending import get_trending_store
+from .watermarks import MarkFields
 
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+USERS_ENDPOINT = "users/get_all"
+POSTS_ENDPOINT = "posts/summary/get"
+RUN_KEY = "run"
+
+# where each list keeps the time and id that order it; an engagement is
+# ordered by when it happened, not by the post it points at
+USER_MARKS = MarkFields(timestamps=("created_at", "joined_at"), ids=("id", "user_id"))
+POST_MARKS = MarkFields(timestamps=("updated_at", "created_at"), ids=("id", "post_id"))
+ENGAGEMENT_MARKS = MarkFields(
+    timestamps=("engaged_at", "viewed_at", "liked_at", "inspired_at", "rated_at", "timestamp"),
+    ids=("engagement_id", "interaction_id"),
+)
 
 
 def _headers() -> dict[str, str]:
@@ -20,87 +43,222 @@ def _headers() -> dict[str, str]:
     return headers
 
 
-async def _get(endpoint: str, params: Optional[dict[str, Any]] = None) -> Any:
+async def _fetch(endpoint: str, params: Optional[dict[str, Any]] = None) -> Any:
     url = settings.API_BASE_URL.rstrip("/") + "/" + endpoint.lstrip("/")
-    async with httpx.AsyncClient(timeout=20) as client:
-        resp = await client.get(url, headers=_headers(), params=params)
-        resp.raise_for_status()
-        return resp.json()
+    resp = await get_with_retries(url, headers=_headers(), params=params, timeout=20)
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def _get(endpoint: str, params: Optional[dict[str, Any]] = None, use_cache: bool = True) -> Any:
+    """Upstream response, shared through Redis by every worker and process."""
+    if not use_cache:
+        return await _fetch(endpoint, params)
+    key = endpoint + "?" + "&".join(f"{k}={v}" for k, v in sorted((params or {}).items()))
+    return await upstream_cache.get_or_compute(key, lambda: _fetch(endpoint, params))
+
+
+async def iter_pages(
+    endpoint: str,
+    params: Optional[dict[str, Any]] = None,
+    stop: Optional[Callable[[list], bool]] = None,
+    use_cache: bool = True,
+) -> AsyncIterator[list]:
+    """Rows of every page of a list endpoint, page by page as they arrive.
+
+    A page for which ``stop(rows)`` is true is the last one requested.
+    ``use_cache=False`` reads every page from upstream, as the sync does.
+    """
+    page_size = settings.UPSTREAM_PAGE_SIZE
+
+    async def fetch_page(page: int) -> Any:
+        return await _get(endpoint, {**(params or {}), "page": page, "page_size": page_size}, use_cache=use_cache)
+
+    pages = paginate(
+        fetch_page,
+        page_size=page_size,
+        concurrency=settings.UPSTREAM_PAGE_CONCURRENCY,
+        max_pages=settings.UPSTREAM_MAX_PAGES,
+        stop=stop,
+    )
+    async for _, rows in pages:
+        yield rows
 
 
-async def fetch_viewed_posts(username: str | None = None) -> Any:
+async def _get_all(endpoint: str, params: Optional[dict[str, Any]] = None, use_cache: bool = True) -> list:
+    return [row async for rows in iter_pages(endpoint, params, use_cache=use_cache) for row in rows]
+
+
+async def fetch_viewed_posts(username: str | None = None, use_cache: bool = True) -> Any:
     if username:
-        return await _get(f"users/{username}/viewed")
-    return await _get("posts/view", params={"page": 1, "page_size": 1000, "resonance_algorithm": "resonance_algorithm_cjsvervb7dbhss8bdrj89s44jfjdbsjd0xnjkbvuire8zcjwerui3njfbvsujc5if"})
+        return await _get(f"users/{username}/viewed", use_cache=use_cache)
+    return await _get_all("posts/view", params={"resonance_algorithm": "resonance_algorithm_cjsvervb7dbhss8bdrj89s44jfjdbsjd0xnjkbvuire8zcjwerui3njfbvsujc5if"}, use_cache=use_cache)
 
 
-async def fetch_liked_posts(username: str | None = None) -> Any:
+async def fetch_liked_posts(username: str | None = None, use_cache: bool = True) -> Any:
     if username:
-        return await _get(f"users/{username}/liked")
-    return await _get("posts/like", params={"page": 1, "page_size": 1000, "resonance_algorithm": "resonance_algorithm_cjsvervb7dbhss8bdrj89s44jfjdbsjd0xnjkbvuire8zcjwerui3njfbvsujc5if"})
+        return await _get(f"users/{username}/liked", use_cache=use_cache)
+    return await _get_all("posts/like", params={"resonance_algorithm": "resonance_algorithm_cjsvervb7dbhss8bdrj89s44jfjdbsjd0xnjkbvuire8zcjwerui3njfbvsujc5if"}, use_cache=use_cache)
 
 
-async def fetch_inspired_posts(username: str | None = None) -> Any:
+async def fetch_inspired_posts(username: str | None = None, use_cache: bool = True) -> Any:
     if username:
-        return await _get(f"users/{username}/inspired")
-    return await _get("posts/inspire", params={"page": 1, "page_size": 1000, "resonance_algorithm": "resonance_algorithm_cjsvervb7dbhss8bdrj89s44jfjdbsjd0xnjkbvuire8zcjwerui3njfbvsujc5if"})
+        return await _get(f"users/{username}/inspired", use_cache=use_cache)
+    return await _get_all("posts/inspire", params={"resonance_algorithm": "resonance_algorithm_cjsvervb7dbhss8bdrj89s44jfjdbsjd0xnjkbvuire8zcjwerui3njfbvsujc5if"}, use_cache=use_cache)
 
 
-async def fetch_rated_posts(username: str | None = None) -> Any:
+async def fetch_rated_posts(username: str | None = None, use_cache: bool = True) -> Any:
     if username:
-        return await _get(f"users/{username}/rated")
-    return await _get("posts/rating", params={"page": 1, "page_size": 1000, "resonance_algorithm": "resonance_algorithm_cjsvervb7dbhss8bdrj89s44jfjdbsjd0xnjkbvuire8zcjwerui3njfbvsujc5if"})
+        return await _get(f"users/{username}/rated", use_cache=use_cache)
+    return await _get_all("posts/rating", params={"resonance_algorithm": "resonance_algorithm_cjsvervb7dbhss8bdrj89s44jfjdbsjd0xnjkbvuire8zcjwerui3njfbvsujc5if"}, use_cache=use_cache)
 
 
-async def fetch_all_posts() -> Any:
-    return await _get("posts/summary/get", params={"page": 1, "page_size": 1000})
+async def fetch_all_posts(use_cache: bool = True) -> Any:
+    return await _get_all("posts/summary/get", use_cache=use_cache)
 
 
-async def fetch_all_users() -> Any:
-    return await _get("users/get_all", params={"page": 1, "page_size": 1000})
+async def fetch_all_users(use_cache: bool = True) -> Any:
+    return await _get_all("users/get_all", use_cache=use_cache)
 
 
 async def sync_to_db(db: AsyncSession) -> None:
-    users = await fetch_all_users()
-    for user in users or []:
-        username = user.get("username")
-        if not username:
-            continue
-        await get_or_create_user(db, username)
-
-    posts = await fetch_all_posts()
-    for p in posts or []:
-        title = p.get("title") or "Untitled"
-        category = p.get("category")
-        metadata = p.get("metadata") or {}
-        await save_post(db, title=title, category=category, metadata=metadata)
-
-    # Optionally sync engagements for each user
-    for user in users or []:
-        username = user.get("username")
-        if not username:
-            continue
-        viewed = await fetch_viewed_posts(username)
-        for item in viewed or []:
-            await _save_eng_from_item(db, username, item, EngagementType.view)
-        liked = await fetch_liked_posts(username)
-        for item in liked or []:
-            await _save_eng_from_item(db, username, item, EngagementType.like)
-        inspired = await fetch_inspired_posts(username)
-        for item in inspired or []:
-            await _save_eng_from_item(db, username, item, EngagementType.inspire)
-        rated = await fetch_rated_posts(username)
-        for item in rated or []:
-            await _save_eng_from_item(db, username, item, EngagementType.rating)
-
-
-async def _save_eng_from_item(db: AsyncSession, username: str, item: dict, etype: EngagementType) -> None:
-    user = await get_or_create_user(db, username)
-    title = item.get("title") or item.get("post_title") or "Untitled"
-    category = item.get("category")
-    metadata = item.get("metadata") or {}
-    post = await save_post(db, title=title, category=category, metadata=metadata)
-    rating_score = item.get("rating") if etype == EngagementType.rating else None
-    await save_engagement(db, user_id=user.id, post_id=post.id, type=etype, rating_score=rating_score)
+    """Write what changed upstream since the last sync.
+
+    Each upstream list has a watermark in sync_states: the highest
+    ``(timestamp, id)`` mark written from it. Only rows above it are
+    written, and a newest-first list stops being paged at the first page
+    entirely below it. Watermarks commit in the same transaction as the
+    rows they cover, and each run is numbered, so a run that crashed or was
+    cancelled is resumed by the next one: lists and users it finished are
+    skipped, the rest are read again from their watermark.
+    """
+    states = await crud.get_sync_states(db)
+    run, resuming = _current_run(states)
+    if resuming:
+        logger.info("Resuming sync run %d", run)
+
+    def finished(key: str) -> bool:
+        return resuming and key in states and states[key][1] == run
+
+    def watermark(key: str) -> Any:
+        return states[key][0] if key in states else None
+
+    # writes are buffered and go out in INGEST_BATCH_SIZE batches
+    async with BulkIngestor(db) as ingest:
+        await ingest.checkpoint(RUN_KEY, {"finished": False}, run)
+
+        if not finished(USERS_ENDPOINT):
+            async for users in _new_rows(USERS_ENDPOINT, USER_MARKS, watermark(USERS_ENDPOINT), ingest, run):
+                for user in users:
+                    if user.get("username"):
+                        await ingest.add_user(user["username"])
+
+        if not finished(POSTS_ENDPOINT):
+            async for posts in _new_rows(POSTS_ENDPOINT, POST_MARKS, watermark(POSTS_ENDPOINT), ingest, run):
+                for p in posts:
+                    await ingest.add_post(p.get("title") or "Untitled", p.get("category"), p.get("metadata") or {})
+
+        # every synced user is checked for new engagements, not only new users
+        await ingest.flush()
+        usernames = [
+            username for username in await crud.get_usernames(db)
+            if not all(finished(key) for key in _engagement_keys(username))
+        ]
+
+        # Engagements are fetched for SYNC_USER_CONCURRENCY users at once and
+        # buffered through the one session as each user's fetches complete
+        async for username, engagements in map_unordered(
+            _fetch_user_engagements, usernames, settings.SYNC_USER_CONCURRENCY
+        ):
+            if engagements is None:
+                continue
+            # a user's rows and watermarks commit together, or not at all
+            async with ingest.atomic():
+                for (etype, items), key in zip(engagements, _engagement_keys(username)):
+                    items = [item for item in items or [] if isinstance(item, dict)]
+                    for item in ENGAGEMENT_MARKS.newer(items, watermark(key)):
+                        rating_score = item.get("rating") if etype == EngagementType.rating else None
+                        await ingest.add_engagement(
+                            username, _post_from_item(item), etype, rating_score, _engaged_at(item)
+                        )
+                    await ingest.checkpoint(key, ENGAGEMENT_MARKS.high_water(items, watermark(key)), run)
+
+        await ingest.checkpoint(RUN_KEY, {"finished": True}, run)
+
+    logger.info("Sync run %d wrote %s", run, ingest.stats.as_dict())
+    post_feature_index.save_if_dirty()
+    save_ann_index_if_dirty()
+    get_trending_store("posts").save_snapshot()
+
+
+def _current_run(states: dict[str, tuple[Any, int]]) -> tuple[int, bool]:
+    """Number of this sync run, and whether it resumes one that did not finish."""
+    if RUN_KEY not in states:
+        return 1, False
+    mark, run = states[RUN_KEY]
+    if (mark or {}).get("finished"):
+        return run + 1, False
+    return run, True
+
+
+def _engaged_at(item: Any) -> datetime | None:
+    """When upstream says the engagement happened, as naive UTC like the stored timestamps."""
+    ts = ENGAGEMENT_MARKS.time_of(item)
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+
+def _engagement_keys(username: str) -> list[str]:
+    # in the order _fetch_user_engagements returns the lists
+    return [f"users/{username}/{name}" for name in ("viewed", "liked", "inspired", "rated")]
+
+
+async def _new_rows(
+    endpoint: str, fields: MarkFields, watermark: Any, ingest: BulkIngestor, run: int
+) -> AsyncIterator[list]:
+    """Pages of ``endpoint`` rows above ``watermark``; checkpoints the new watermark once all are read.
+
+    The watermark only moves at the end, because pages arrive out of order
+    and an interrupted list has to be read again from where it was.
+    """
+
+    def stop(rows: list) -> bool:
+        return settings.SYNC_STOP_AT_WATERMARK and fields.is_stale(rows, watermark)
+
+    high = watermark
+    async for rows in iter_pages(endpoint, stop=stop, use_cache=False):
+        high = fields.high_water(rows, high)
+        rows = fields.newer(rows, watermark)
+        if rows:
+            yield rows
+    await ingest.checkpoint(endpoint, high, run)
+
+
+async def _fetch_user_engagements(username: str) -> list[tuple[EngagementType, Any]] | None:
+    """All four engagement lists of ``username``, fetched fresh and concurrently; None if any failed."""
+    fetchers = (
+        (EngagementType.view, fetch_viewed_posts),
+        (EngagementType.like, fetch_liked_posts),
+        (EngagementType.inspire, fetch_inspired_posts),
+        (EngagementType.rating, fetch_rated_posts),
+    )
+    payloads = await asyncio.gather(
+        *(fetch(username, use_cache=False) for _, fetch in fetchers), return_exceptions=True
+    )
+    errors = [p for p in payloads if isinstance(p, Exception)]
+    if errors:
+        # one user must not end the run; the next sync picks them up
+        logger.warning("Skipping engagements of %s: %s", username, errors[0])
+        return None
+    return [(etype, payload) for (etype, _), payload in zip(fetchers, payloads)]
+
+
+def _post_from_item(item: dict) -> dict:
+    return {
+        "title": item.get("title") or item.get("post_title") or "Untitled",
+        "category": item.get("category"),
+        "metadata": item.get("metadata") or {},
+    }
 
 
@@ -1,16 +1,32 @@
 from __future__ import annotations
 
+import argparse
+import asyncio
+import logging
 from contextlib import asynccontextmanager
 
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
 from .config import get_settings
-from .models import Base
+from .models.posts import Base
 
 
+logger = logging.getLogger(__name__)
 settings = get_settings()
+# crud writes users, posts and engagements with these dialects' INSERT ... ON CONFLICT
+UPSERT_DIALECTS = ("postgresql", "sqlite")
+
+
+def check_dialect(name: str) -> None:
+    if name not in UPSERT_DIALECTS:
+        raise ValueError(
+            f"DATABASE_URL points to a {name} database; the posts tables need PostgreSQL or SQLite"
+        )
+
 
 engine = create_async_engine(settings.DATABASE_URL, echo=settings.DEBUG, future=True)
+# fail at startup rather than on the first sync
+check_dialect(engine.dialect.name)
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
 
@@ -19,6 +35,27 @@ async def init_db() -> None:
         await conn.run_sync(Base.metadata.create_all)
 
 
+async def upgrade_db() -> None:
+    """Bring a database created before the unique post and engagement indexes up to date.
+
+    create_all adds missing tables but not indexes on existing ones, so
+    duplicate titles and engagements are merged first and the indexes are
+    then created.
+    """
+    from . import crud
+    from .models.posts import Engagement, Post
+
+    async with AsyncSessionLocal() as db:
+        posts = await crud.dedupe_post_titles(db)
+        engagements = await crud.dedupe_engagements(db)
+        await db.commit()
+    logger.info("Merged %d duplicate posts, removed %d duplicate engagements", posts, engagements)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        for index in (*Post.__table__.indexes, *Engagement.__table__.indexes):
+            await conn.run_sync(index.create, checkfirst=True)
+
+
 async def close_db() -> None:
     await engine.dispose()
 
@@ -28,3 +65,13 @@ async def get_db() -> AsyncSession:
         yield session
 
 
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Posts database maintenance")
+    parser.add_argument("command", choices=["init", "upgrade"])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(init_db() if args.command == "init" else upgrade_db())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from collections import defaultdict
+from typing import Iterable, Mapping
+
+import numpy as np
+
+from .config import get_settings
+from .scoring import FeatureVocabulary, PostFeatureMatrix
+
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def post_features(category: str | None, metadata: object) -> dict[str, float]:
+    vector: dict[str, float] = defaultdict(float)
+    if category:
+        vector[f"cat:{category.lower()}"] = 1.0
+    if isinstance(metadata, dict):
+        for k, v in metadata.items():
+            key = f"m:{k}:{str(v).lower()}"
+            vector[key] += 1.0
+    return dict(vector)
+
+
+class PostFeatureIndex:
+    """In-memory post feature index backed by an ``.npz`` file.
+
+    Features are computed once per post version in ``upsert``. Scoring goes
+    through a compacted CSR matrix plus a small delta matrix holding posts
+    changed since the last compaction, so an update never forces a rebuild
+    of the whole catalog on the request path. Upserts made since the last
+    save are kept apart and replayed over each reload, so a process that
+    never saves still picks up newer versions from the one that does.
+    """
+
+    def __init__(self, path: str | None = None, *, merge_threshold: int = 1024) -> None:
+        self.path = path
+        self.merge_threshold = merge_threshold
+        self.version = 0
+        self.vocab = FeatureVocabulary()
+        self._features: dict[int, dict[str, float]] = {}
+        self._main = PostFeatureMatrix.from_vectors((), self.vocab)
+        self._pending: set[int] = set()
+        self._delta: PostFeatureMatrix | None = None
+        self._local: dict[int, dict[str, float]] = {}
+        self._dirty = False
+        self._disk_mtime_ns = 0
+        self._last_check = 0.0
+
+    def __len__(self) -> int:
+        return len(self._features)
+
+    def __contains__(self, post_id: int) -> bool:
+        return post_id in self._features
+
+    @property
+    def post_ids(self) -> list[int]:
+        return list(self._features)
+
+    def features(self, post_id: int) -> dict[str, float] | None:
+        return self._features.get(post_id)
+
+    def upsert(self, post_id: int, category: str | None, metadata: object) -> bool:
+        vector = post_features(category, metadata)
+        if self._features.get(post_id) == vector:
+            return False
+        self._features[post_id] = vector
+        self._local[post_id] = vector
+        self._pending.add(post_id)
+        self._delta = None
+        self._dirty = True
+        if len(self._pending) >= self.merge_threshold:
+            self.compact()
+        return True
+
+    def compact(self) -> None:
+        self._main = PostFeatureMatrix.from_vectors(self._features.items(), self.vocab)
+        self._pending.clear()
+        self._delta = None
+
+    def _delta_matrix(self) -> PostFeatureMatrix:
+        if self._delta is None:
+            self._delta = PostFeatureMatrix.from_vectors(
+                ((pid, self._features[pid]) for pid in self._pending), self.vocab
+            )
+        return self._delta
+
+    def score(self, user_vec: Mapping[str, float], post_ids: Iterable[int]) -> np.ndarray:
+        """Cosine score of ``user_vec`` against each of ``post_ids``.
+
+        Posts missing from the index score 0.0.
+        """
+        post_ids = list(post_ids)
+        delta = self._delta_matrix()
+        q = self._main.query(user_vec)
+        scores = np.zeros(len(post_ids), dtype=np.float64)
+        for matrix in (self._main, delta):
+            positions: list[int] = []
+            rows: list[int] = []
+            for i, pid in enumerate(post_ids):
+                if matrix is self._main and pid in self._pending:
+                    continue
+                row = matrix.row_of(pid)
+                if row is not None:
+                    positions.append(i)
+                    rows.append(row)
+            if rows:
+                scores[positions] = matrix.score_rows(q, rows)
+        return scores
+
+    # Persistence
+
+    def save(self, path: str | None = None) -> None:
+        path = path or self.path
+        if not path:
+            return
+        self.compact()
+        disk_version = _read_version(path)
+        self.version = max(self.version, disk_version) + 1
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                raw = [v for vec in self._features.values() for v in vec.values()]
+                np.savez(
+                    f,
+                    version=np.int64(self.version),
+                    vocab=np.array(self.vocab.names, dtype=str),
+                    post_ids=self._main.post_ids,
+                    indptr=self._main.indptr,
+                    indices=self._main.indices,
+                    raw=np.array(raw, dtype=np.float32),
+                )
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._local.clear()
+        self._dirty = False
+        self._disk_mtime_ns = os.stat(path).st_mtime_ns
+        logger.info("Saved post feature index v%s (%d posts) to %s", self.version, len(self), path)
+
+    def save_if_dirty(self) -> None:
+        if self._dirty:
+            self.save()
+
+    @classmethod
+    def load(cls, path: str) -> "PostFeatureIndex":
+        index = cls(path)
+        index._load_from(path)
+        return index
+
+    def _load_from(self, path: str) -> None:
+        mtime_ns = os.stat(path).st_mtime_ns
+        with np.load(path, allow_pickle=False) as npz:
+            names = npz["vocab"].tolist()
+            post_ids = npz["post_ids"]
+            indptr = npz["indptr"]
+            indices = npz["indices"]
+            raw = npz["raw"]
+            version = int(npz["version"])
+        features: dict[int, dict[str, float]] = {}
+        for r, pid in enumerate(post_ids.tolist()):
+            start, end = indptr[r], indptr[r + 1]
+            features[pid] = {names[c]: float(v) for c, v in zip(indices[start:end], raw[start:end])}
+        # local upserts the file doesn't have yet win over it
+        for pid, vector in list(self._local.items()):
+            if features.get(pid) == vector:
+                del self._local[pid]
+            else:
+                features[pid] = vector
+        self.vocab = FeatureVocabulary(names)
+        self._features = features
+        self.version = version
+        self.compact()
+        self._dirty = bool(self._local)
+        self._disk_mtime_ns = mtime_ns
+
+    def refresh_if_stale(self, min_interval: float | None = None) -> bool:
+        """Reload from disk when another process has written a newer version.
+
+        Costs one ``stat`` call at most every ``min_interval`` seconds.
+        """
+        if not self.path:
+            return False
+        interval = settings.FEATURE_INDEX_REFRESH_SECONDS if min_interval is None else min_interval
+        now = time.monotonic()
+        if now - self._last_check < interval:
+            return False
+        self._last_check = now
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime_ns == self._disk_mtime_ns:
+            return False
+        if _read_version(self.path) <= self.version:
+            self._disk_mtime_ns = mtime_ns
+            return False
+        self._load_from(self.path)
+        logger.info("Picked up post feature index v%s (%d posts)", self.version, len(self))
+        return True
+
+
+def _read_version(path: str) -> int:
+    try:
+        with np.load(path, allow_pickle=False) as npz:
+            return int(npz["version"])
+    except (FileNotFoundError, KeyError, ValueError, OSError):
+        return 0
+
+
+def _load_default_index() -> PostFeatureIndex:
+    path = settings.FEATURE_INDEX_PATH
+    if path and os.path.exists(path):
+        try:
+            return PostFeatureIndex.load(path)
+        except Exception as exc:  # corrupt or incompatible file: start empty
+            logger.warning("Could not load post feature index from %s: %s", path, exc)
+    return PostFeatureIndex(path)
+
+
+post_feature_index = _load_default_index()
+
+
+async def rebuild_index(chunk_size: int = 1000) -> PostFeatureIndex:
+    from .crud import get_posts
+    from .dependencies import AsyncSessionLocal
+
+    index = PostFeatureIndex(settings.FEATURE_INDEX_PATH)
+    index.version = post_feature_index.version
+    async with AsyncSessionLocal() as db:
+        offset = 0
+        while True:
+            posts = await get_posts(db, limit=chunk_size, offset=offset)
+            if not posts:
+                break
+            for p in posts:
+                index.upsert(p.id, p.category, p.post_metadata)
+            offset += len(posts)
+    index.save()
+    return index
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Post feature index maintenance")
+    parser.add_argument("command", choices=["rebuild", "info"])
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+    if args.command == "rebuild":
+        index = asyncio.run(rebuild_index(args.chunk_size))
+    else:
+        index = post_feature_index
+    print(f"version={index.version} posts={len(index)} features={len(index.vocab)} path={index.path}")
+
+
+if __name__ == "__main__":
+    main()
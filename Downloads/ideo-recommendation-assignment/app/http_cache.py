@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any
+
+from fastapi import Response
+
+from .config import get_settings
+
+
+settings = get_settings()
+
+
+def content_version(value: Any) -> str:
+    """Digest of a JSON-able value; equal digests mean equal response bodies."""
+    data = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return hashlib.blake2b(data, digest_size=12).hexdigest()
+
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag over ``parts``, e.g. a feed version and the requested window."""
+    digest = hashlib.blake2b("\x1f".join(str(p) for p in parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    # If-None-Match uses weak comparison, so a W/ prefix still matches
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def feed_cache_control(private: bool = True) -> str:
+    """Cache-Control for feeds; only feeds that are the same for everyone may be ``public``."""
+    return (
+        f"{'private' if private else 'public'}, max-age={settings.FEED_HTTP_MAX_AGE_SECONDS}, "
+        f"stale-while-revalidate={settings.FEED_HTTP_STALE_SECONDS}"
+    )
+
+
+def not_modified(etag: str, headers: dict[str, str] | None = None, private: bool = True) -> Response:
+    return Response(
+        status_code=304,
+        headers={"ETag": etag, "Cache-Control": feed_cache_control(private), **(headers or {})},
+    )
+
+
+def conditional_json(body: bytes, if_none_match: str | None, private: bool = True) -> Response:
+    """``body`` as a JSON response with an ETag, or 304 when the client has it."""
+    etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, private=private)
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": feed_cache_control(private)},
+    )
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Optional
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+except Exception:  # pragma: no cover - optional dependency
+    h2 = None  # type: ignore
+
+from .config import get_settings
+from .rate_limit import AdaptiveTokenBucket, backoff_delay, parse_retry_after
+
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+_client: Optional[httpx.AsyncClient] = None
+
+# responses worth another attempt; everything else goes back to the caller
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+upstream_limiter = AdaptiveTokenBucket(
+    settings.UPSTREAM_RATE_LIMIT,
+    burst=settings.UPSTREAM_BURST,
+    min_rate=settings.UPSTREAM_MIN_RATE,
+)
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Client with the configured connection pool; callers own and close it."""
+    http2 = settings.UPSTREAM_HTTP2 and h2 is not None
+    if settings.UPSTREAM_HTTP2 and not http2:
+        logger.warning("UPSTREAM_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(settings.UPSTREAM_TIMEOUT_SECONDS, connect=settings.UPSTREAM_CONNECT_TIMEOUT_SECONDS),
+        limits=httpx.Limits(
+            max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.UPSTREAM_KEEPALIVE_SECONDS,
+        ),
+        http2=http2,
+    )
+
+
+def init_http_client() -> None:
+    """Open the process-wide Socialverse client; called from the app lifespan."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The shared client, so every upstream call reuses pooled keep-alive connections."""
+    init_http_client()
+    return _client
+
+
+async def get_with_retries(url: str, **kwargs: Any) -> httpx.Response:
+    """GET through the shared client under ``upstream_limiter``.
+
+    429s slow the limiter down and wait out Retry-After. 429/5xx gateway
+    errors and connection failures are retried up to UPSTREAM_MAX_RETRIES
+    times with jittered exponential backoff. The last response (or error)
+    goes back to the caller.
+    """
+    client = get_http_client()
+    attempt = 0
+    while True:
+        last = attempt >= settings.UPSTREAM_MAX_RETRIES
+        await upstream_limiter.acquire()
+        try:
+            response = await client.get(url, **kwargs)
+        except httpx.TransportError as exc:
+            if last:
+                raise
+            delay = backoff_delay(
+                attempt, base=settings.UPSTREAM_BACKOFF_BASE_SECONDS, cap=settings.UPSTREAM_BACKOFF_MAX_SECONDS
+            )
+            logger.warning("GET %s failed (%s); retry %d in %.1fs", url, exc, attempt + 1, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        if response.status_code not in RETRY_STATUSES:
+            upstream_limiter.on_success()
+            return response
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if response.status_code == 429:
+            upstream_limiter.on_throttled(retry_after)
+        if last:
+            return response
+        delay = backoff_delay(
+            attempt,
+            base=settings.UPSTREAM_BACKOFF_BASE_SECONDS,
+            cap=settings.UPSTREAM_BACKOFF_MAX_SECONDS,
+            retry_after=retry_after,
+        )
+        logger.warning("GET %s returned %d; retry %d in %.1fs", url, response.status_code, attempt + 1, delay)
+        await response.aclose()
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+    _client = None
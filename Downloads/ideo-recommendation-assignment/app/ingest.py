@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud
+from .cache import invalidate_user_feeds
+from .config import get_settings
+from .models.posts import EngagementType
+from .profiles import engagement_weight
+from .trending import get_trending_store
+
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Engagements older than this many trending half-lives (1/16 of their weight
+# left) are backfill: they are stored and folded into profiles but not
+# counted as trending.
+TRENDING_BACKFILL_HALF_LIVES = 4
+
+
+@dataclass
+class IngestStats:
+    users: int = 0
+    posts: int = 0
+    new_posts: int = 0
+    engagements: int = 0
+    flushes: int = 0
+    seconds: float = 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        return asdict(self)
+
+
+class BulkIngestor:
+    """Buffers synced users, posts and engagements and writes them in batches.
+
+    Each flush of ``batch_size`` buffered records is one transaction. Users
+    and posts are upserted with multi-row INSERT ... ON CONFLICT.
+    Engagements new to the database are inserted in batched multi-row
+    INSERTs and folded into profiles, keeping the upstream time of each when it has one. Sync
+    watermarks given to ``checkpoint`` are written in the same transaction
+    as the rows before them, and ``atomic`` keeps a group of records out of
+    different flushes. Trending counters (recent engagements only) and feed
+    invalidation follow the commit. Leaving ``async with`` flushes the rest.
+    """
+
+    def __init__(self, db: AsyncSession, batch_size: int | None = None, invalidate_feeds: bool = True) -> None:
+        self.db = db
+        self.batch_size = batch_size or settings.INGEST_BATCH_SIZE
+        self.invalidate_feeds = invalidate_feeds
+        self.stats = IngestStats()
+        self._users: set[str] = set()
+        self._posts: dict[str, dict] = {}
+        self._engagements: list[tuple[str, str, EngagementType, int | None, datetime | None]] = []
+        self._states: dict[str, tuple[Any, int]] = {}
+        self._held = 0
+        # ids of everything written so far, so later batches need no lookups
+        self._user_ids: dict[str, int] = {}
+
+    async def __aenter__(self) -> "BulkIngestor":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            await self.flush()
+
+    def pending(self) -> int:
+        return len(self._users) + len(self._posts) + len(self._engagements) + len(self._states)
+
+    async def add_user(self, username: str) -> None:
+        if username not in self._user_ids:
+            self._users.add(username)
+            await self._maybe_flush()
+
+    async def add_post(self, title: str, category: str | None, metadata: dict | None) -> None:
+        self._posts[title] = {"title": title, "category": category, "metadata": metadata}
+        await self._maybe_flush()
+
+    async def add_engagement(
+        self,
+        username: str,
+        post: dict,
+        type: EngagementType,
+        rating_score: int | None = None,
+        timestamp: datetime | None = None,
+    ) -> None:
+        """Buffer an engagement; ``post`` (title, category, metadata) is upserted with it.
+
+        ``timestamp`` is when it happened (naive UTC); the flush time if None.
+        """
+        if username not in self._user_ids:
+            self._users.add(username)
+        self._posts[post["title"]] = post
+        self._engagements.append((username, post["title"], type, rating_score, timestamp))
+        await self._maybe_flush()
+
+    async def checkpoint(self, key: str, mark: Any, run: int) -> None:
+        """Record ``mark`` as the watermark of ``key``, committed with the rows added so far."""
+        self._states[key] = (mark, run)
+        await self._maybe_flush()
+
+    @asynccontextmanager
+    async def atomic(self) -> AsyncIterator[None]:
+        """Hold off flushing until the block ends, so its records commit together."""
+        self._held += 1
+        try:
+            yield
+        finally:
+            self._held -= 1
+        await self._maybe_flush()
+
+    async def _maybe_flush(self) -> None:
+        if not self._held and self.pending() >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self.pending():
+            return
+        started = time.perf_counter()
+        users, posts, engagements, states = self._users, self._posts, self._engagements, self._states
+        self._users, self._posts, self._engagements, self._states = set(), {}, [], {}
+        now = datetime.utcnow()
+        try:
+            self._user_ids.update(await crud.upsert_users(self.db, users))
+            post_ids = await crud.upsert_posts(self.db, posts.values())
+            rows = [
+                {
+                    "user_id": self._user_ids[username],
+                    "post_id": post_ids[title][0],
+                    "type": etype,
+                    "rating_score": rating_score,
+                    "timestamp": timestamp or now,
+                }
+                for username, title, etype, rating_score, timestamp in engagements
+            ]
+            rows = await crud.insert_engagements(self.db, rows)
+            await crud.save_sync_states(self.db, states)
+            await self.db.commit()
+        except BaseException:  # cancelled too: don't leave the batch's transaction open
+            await self.db.rollback()
+            raise
+
+        new_posts = [(post_id, posts[title]["category"]) for title, (post_id, created) in post_ids.items() if created]
+        await crud.index_new_post_embeddings(self.db, new_posts)
+        trending = get_trending_store("posts")
+        horizon = now - timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS * TRENDING_BACKFILL_HALF_LIVES)
+        categories = {post_id: posts[title]["category"] for title, (post_id, _) in post_ids.items()}
+        for row in rows:
+            # a new score for a stored rating is not a new engagement
+            if row["timestamp"] < horizon or "previous_rating_score" in row:
+                continue
+            weight = engagement_weight(row["type"], row["rating_score"])
+            await trending.record(str(row["post_id"]), categories[row["post_id"]], weight, row["timestamp"])
+        if self.invalidate_feeds:
+            engaged = {row["user_id"] for row in rows}
+            for username, user_id in self._user_ids.items():
+                if user_id in engaged:
+                    await invalidate_user_feeds(username)
+
+        self.stats.users += len(users)
+        self.stats.posts += len(posts)
+        self.stats.new_posts += len(new_posts)
+        self.stats.engagements += len(rows)
+        self.stats.flushes += 1
+        self.stats.seconds += time.perf_counter() - started
+        logger.debug("Flushed %d users, %d posts, %d engagements", len(users), len(posts), len(rows))
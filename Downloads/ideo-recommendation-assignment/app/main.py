@@ -13,9 +13,12 @@ from fastapi.responses import JSONResponse
 from fastapi.openapi.docs import get_swagger_ui_html
 from fastapi.openapi.utils import get_openapi
 
+from app.cache import close_redis, feed_cache, init_redis
 from app.config import settings
+from app.http_client import close_http_client, init_http_client
 from app.routes.recommendations import router as recommendations_router
 from app.models.recommendation import ErrorResponse
+from app.services.warmup import feed_warmup
 
 # Configure logging
 logging.basicConfig(
@@ -42,10 +45,25 @@ async def lifespan(app: FastAPI):
     logger.info(f"Database URL: {settings.DATABASE_URL}")
     logger.info(f"Debug Mode: {settings.DEBUG}")
     
+    init_redis()
+    init_http_client()
+    # evict feeds other workers invalidate from this worker's LRU
+    feed_cache.start_listener()
+    
+    # Warm feeds in the background; /ready reports when enough are cached
+    if settings.WARMUP_ON_STARTUP:
+        feed_warmup.start(settings.WARMUP_CHECK_SECONDS)
+    else:
+        feed_warmup.ready = True
+    
     yield
     
     # Shutdown
     logger.info("Shutting down Video Recommendation Engine...")
+    await feed_warmup.stop()
+    await close_http_client()
+    await feed_cache.stop_listener()
+    await close_redis()
 
 
 # Create FastAPI application
@@ -150,6 +168,16 @@ async def health():
     return {"status": "healthy"}
 
 
+# Readiness endpoint for load balancers
+@app.get("/ready", response_model=Dict[str, Any])
+async def ready():
+    """
+    Readiness check: 503 until cache warm-up has covered WARMUP_READY_COVERAGE of its users.
+    """
+    status = feed_warmup.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
 # Custom OpenAPI schema
 def custom_openapi():
     """Generate custom OpenAPI schema with additional information."""
@@ -8,6 +8,7 @@ from sqlalchemy import (
     DateTime,
     Enum,
     ForeignKey,
+    Index,
     Integer,
     JSON,
     String,
@@ -40,6 +41,8 @@ class User(Base):
 
 class Post(Base):
     __tablename__ = "posts"
+    # posts are identified by title on ingestion (crud.save_post, crud.upsert_posts)
+    __table_args__ = (Index("uq_posts_title", "title", unique=True),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     title: Mapped[str] = mapped_column(String(255), nullable=False)
@@ -52,8 +55,21 @@ class Post(Base):
     )
 
 
+class UserProfile(Base):
+    __tablename__ = "user_profiles"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    vector: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
+    seen_post_ids: Mapped[list] = mapped_column(JSON, default=list, nullable=False)
+    engagement_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
 class Engagement(Base):
     __tablename__ = "engagements"
+    # one row per user, post and kind of engagement, so re-synced upstream
+    # rows are skipped rather than counted again
+    __table_args__ = (Index("uq_engagements_user_post_type", "user_id", "post_id", "type", unique=True),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -66,3 +82,12 @@ class Engagement(Base):
     post: Mapped[Post] = relationship("Post", back_populates="engagements")
 
 
+class SyncState(Base):
+    __tablename__ = "sync_states"
+    # one row per upstream list data_collection.sync_to_db reads: its watermark,
+    # and the sync run that last wrote it, so an interrupted run can resume
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    mark: Mapped[list | dict | None] = mapped_column(JSON)
+    run: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+import math
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, TypeVar
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+# where list endpoints put their rows and their size, by the names APIs commonly use
+ITEM_KEYS = ("data", "items", "results", "posts", "users")
+PAGE_COUNT_KEYS = ("total_pages", "page_count", "pages", "max_page")
+TOTAL_KEYS = ("total", "total_count", "count")
+
+
+def page_items(payload: Any) -> list:
+    """Rows of one page, whether the endpoint returns a bare list or wraps it."""
+    if isinstance(payload, list):
+        return payload
+    if isinstance(payload, dict):
+        for key in ITEM_KEYS:
+            value = payload.get(key)
+            if isinstance(value, list):
+                return value
+            if isinstance(value, dict):
+                return page_items(value)
+    return []
+
+
+def page_count(payload: Any, page_size: int) -> int | None:
+    """Number of pages the first page announces, or None if it does not say."""
+    if not isinstance(payload, dict):
+        return None
+    for key in PAGE_COUNT_KEYS:
+        if isinstance(payload.get(key), int):
+            return payload[key]
+    for key in TOTAL_KEYS:
+        if isinstance(payload.get(key), int):
+            return math.ceil(payload[key] / page_size)
+    return None
+
+
+async def paginate(
+    fetch_page: Callable[[int], Awaitable[Any]],
+    *,
+    page_size: int,
+    concurrency: int = 4,
+    max_pages: int = 1000,
+    stop: Callable[[list], bool] | None = None,
+) -> AsyncIterator[tuple[int, list]]:
+    """Yield ``(page, rows)`` for every page of a list endpoint, in arrival order.
+
+    Page 1 comes first and tells how many pages there are, if the endpoint
+    says. The rest are fetched ``concurrency`` at a time. Without a count,
+    pages are requested ahead until one comes back short, which marks the
+    last page. A page for which ``stop(rows)`` is true is the last one too;
+    later pages already requested are cancelled. Empty pages are not
+    yielded. An error in any page is raised and cancels the requests still
+    in flight.
+    """
+    first = await fetch_page(1)
+    rows = page_items(first)
+    if rows:
+        yield 1, rows
+    last = page_count(first, page_size)
+    if (last is None and len(rows) < page_size) or (stop is not None and stop(rows)):
+        last = 1
+    last = min(last or max_pages, max_pages)
+
+    next_page = 2
+    inflight: dict[asyncio.Task, int] = {}
+    try:
+        while True:
+            while next_page <= last and len(inflight) < max(1, concurrency):
+                inflight[asyncio.ensure_future(fetch_page(next_page))] = next_page
+                next_page += 1
+            if not inflight:
+                return
+            done, _ = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=inflight.__getitem__):
+                page = inflight.pop(task)
+                if page > last:
+                    task.exception()  # finished alongside the page that ended the listing
+                    continue
+                rows = page_items(task.result())
+                if len(rows) < page_size or (stop is not None and stop(rows)):
+                    last = min(last, page)
+                if rows:
+                    yield page, rows
+            for task in [task for task, page in inflight.items() if page > last]:
+                task.cancel()
+                del inflight[task]
+    finally:
+        for task in inflight:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # already failing on another page; don't log it as unretrieved
+
+
+async def map_unordered(
+    fn: Callable[[T], Awaitable[R]],
+    items: Iterable[T],
+    concurrency: int,
+) -> AsyncIterator[tuple[T, R]]:
+    """Yield ``(item, await fn(item))`` as each finishes, with at most ``concurrency`` running.
+
+    Items are started lazily, so a slow consumer holds back new work instead
+    of piling up results.
+    """
+    pending = iter(items)
+    inflight: dict[asyncio.Task, T] = {}
+    try:
+        while True:
+            for item in pending:
+                inflight[asyncio.ensure_future(fn(item))] = item
+                if len(inflight) >= max(1, concurrency):
+                    break
+            if not inflight:
+                return
+            done, _ = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield inflight.pop(task), task.result()
+    finally:
+        for task in inflight:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()
@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Generic, Hashable, Iterable, Sequence, TypeVar
+
+import numpy as np
+
+from .config import get_settings
+
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+
+
+@dataclass
+class Stage(Generic[K]):
+    """One candidate source; ``generate(limit)`` returns keys best first.
+
+    A stage that raises or runs past ``budget`` seconds contributes nothing.
+    It is cancelled at the budget unless ``cancel`` is False; then it is left
+    to finish in the background and its keys are dropped, for sources that
+    must not be interrupted mid-query. A ``budget`` of None waits for the
+    stage however long it takes, for the source a feed can't do without.
+    Stages in the same ``lane`` run one after another; separate lanes run
+    concurrently.
+    """
+
+    name: str
+    generate: Callable[[int], Awaitable[Sequence[K]]]
+    limit: int = 200
+    budget: float | None = 0.05
+    weight: float = 1.0
+    lane: str | None = None
+    cancel: bool = True
+
+
+def make_stage(
+    name: str,
+    generate: Callable[[int], Awaitable[Sequence[K]]],
+    *,
+    weight: float = 1.0,
+    lane: str | None = None,
+    limit: int | None = None,
+    cancel: bool = True,
+    required: bool = False,
+) -> Stage[K]:
+    """Stage with the limit and budget configured for ``name``; ``required`` stages have none."""
+    budget_ms = settings.PIPELINE_STAGE_BUDGETS_MS.get(name, settings.PIPELINE_STAGE_BUDGET_MS)
+    return Stage(
+        name=name,
+        generate=generate,
+        limit=limit or settings.PIPELINE_SOURCE_LIMIT,
+        budget=None if required else budget_ms / 1000,
+        weight=weight,
+        lane=lane,
+        cancel=cancel,
+    )
+
+
+@dataclass
+class StageReport:
+    name: str
+    status: str  # "ok", "timeout", "error" or "skipped"
+    count: int
+    elapsed: float
+
+
+@dataclass
+class Candidates(Generic[K]):
+    """Deduplicated union of all stage outputs.
+
+    ``prior`` is the best weighted rank score any source gave each key:
+    ``weight * (1 - rank / len(source))``. ``sources`` lists the stages that
+    found each key, the one behind its prior first.
+    """
+
+    keys: list[K]
+    prior: np.ndarray
+    sources: dict[K, list[str]] = field(default_factory=dict)
+    report: list[StageReport] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+Ranker = Callable[[Candidates[K]], Awaitable[Sequence[float] | np.ndarray]]
+
+
+def _drop_late(stage: Stage) -> Callable[[asyncio.Future], None]:
+    def done(task: asyncio.Future) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Candidate stage %s failed after its budget: %s", stage.name, task.exception())
+
+    return done
+
+
+async def _run_stage(stage: Stage[K], deadline: float | None) -> tuple[list[K], StageReport]:
+    budget = stage.budget
+    if budget is not None and deadline is not None:
+        budget = min(budget, deadline - time.monotonic())
+    if budget is not None and budget <= 0:
+        return [], StageReport(stage.name, "skipped", 0, 0.0)
+    started = time.perf_counter()
+    try:
+        task = asyncio.ensure_future(stage.generate(stage.limit))
+        if stage.cancel or budget is None:
+            keys = await asyncio.wait_for(task, budget)
+        else:
+            done, _ = await asyncio.wait({task}, timeout=budget)
+            if not done:
+                task.add_done_callback(_drop_late(stage))
+                raise asyncio.TimeoutError
+            keys = task.result()
+        keys = list(keys)[: stage.limit]
+        status = "ok"
+    except asyncio.TimeoutError:
+        keys, status = [], "timeout"
+        logger.warning("Candidate stage %s exceeded its %.0f ms budget", stage.name, budget * 1000)
+    except Exception:
+        keys, status = [], "error"
+        logger.exception("Candidate stage %s failed", stage.name)
+    return keys, StageReport(stage.name, status, len(keys), time.perf_counter() - started)
+
+
+async def _run_lane(stages: list[Stage[K]], deadline: float | None) -> list[tuple[list[K], StageReport]]:
+    return [await _run_stage(stage, deadline) for stage in stages]
+
+
+async def gather_candidates(
+    stages: Sequence[Stage[K]],
+    *,
+    exclude: Iterable[K] = (),
+    total_budget: float | None = None,
+) -> Candidates[K]:
+    """Run every stage within its budget and merge the results."""
+    deadline = time.monotonic() + total_budget if total_budget is not None else None
+    lanes: dict[object, list[Stage[K]]] = defaultdict(list)
+    for i, stage in enumerate(stages):
+        lanes[stage.lane if stage.lane is not None else ("stage", i)].append(stage)
+    lane_results = await asyncio.gather(*(_run_lane(lane, deadline) for lane in lanes.values()))
+    by_name = {report.name: keys for results in lane_results for keys, report in results}
+    reports = {report.name: report for results in lane_results for _, report in results}
+
+    excluded = set(exclude)
+    prior: dict[K, float] = {}
+    sources: dict[K, list[str]] = defaultdict(list)
+    for stage in stages:
+        keys = by_name.get(stage.name, [])
+        for rank, key in enumerate(keys):
+            if key in excluded:
+                continue
+            score = stage.weight * (1.0 - rank / len(keys))
+            if score > prior.get(key, -1.0):
+                prior[key] = score
+                sources[key].insert(0, stage.name)
+            else:
+                sources[key].append(stage.name)
+    keys = list(prior)
+    return Candidates(
+        keys=keys,
+        prior=np.fromiter((prior[k] for k in keys), dtype=np.float64, count=len(keys)),
+        sources=dict(sources),
+        report=[reports[stage.name] for stage in stages],
+    )
+
+
+def rank_candidates(
+    keys: Sequence[K],
+    scores: Sequence[float] | np.ndarray,
+    k: int,
+    after: tuple[float, K] | None = None,
+) -> list[tuple[float, K]]:
+    """Best ``k`` of ``(score, key)`` descending, strictly below ``after`` if given.
+
+    A bounded heap selects them, so only the ``k`` kept are ever sorted.
+    """
+    entries = zip(np.asarray(scores, dtype=np.float64).tolist(), keys)
+    if after is not None:
+        entries = (e for e in entries if e < after)
+    return heapq.nlargest(k, entries)
+
+
+class Pipeline(Generic[K]):
+    """Candidate generation followed by a single vectorized ranking pass.
+
+    ``total_budget`` (seconds) caps candidate generation as a whole, stages
+    without a budget aside, and defaults to PIPELINE_TOTAL_BUDGET_MS.
+    """
+
+    def __init__(self, stages: Sequence[Stage[K]], ranker: Ranker[K], total_budget: float | None = None) -> None:
+        self.stages = list(stages)
+        self.ranker = ranker
+        self.total_budget = settings.PIPELINE_TOTAL_BUDGET_MS / 1000 if total_budget is None else total_budget
+
+    async def run(
+        self,
+        k: int,
+        *,
+        exclude: Iterable[K] = (),
+        after: tuple[float, K] | None = None,
+    ) -> tuple[list[tuple[float, K]], Candidates[K]]:
+        candidates = await gather_candidates(self.stages, exclude=exclude, total_budget=self.total_budget)
+        if not candidates.keys:
+            return [], candidates
+        scores = await self.ranker(candidates)
+        ranked = rank_candidates(candidates.keys, scores, k, after)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Pipeline ranked %d of %d candidates: %s",
+                len(ranked),
+                len(candidates),
+                ", ".join(f"{r.name}={r.status}/{r.count}/{r.elapsed * 1000:.1f}ms" for r in candidates.report),
+            )
+        return ranked, candidates
+
+
+async def prior_ranker(candidates: Candidates) -> np.ndarray:
+    """Rank by retrieval score alone, for requests without a user model."""
+    return candidates.prior
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from typing import Iterable, Mapping
+
+
+def engagement_weight(type: str, rating_score: int | None = None) -> float:
+    # ``type`` is an EngagementType or its plain string value
+    type = str(getattr(type, "value", type)).lower()
+    weight = 0.5
+    if type == "view":
+        weight = 0.5
+    elif type == "like":
+        weight = 1.0
+    elif type == "inspire":
+        weight = 1.2
+    elif type == "rating":
+        weight = 0.8 + 0.4 * ((rating_score or 3) / 5.0)
+    return weight
+
+
+def apply_engagement(
+    vector: Mapping[str, float],
+    features: Mapping[str, float],
+    weight: float,
+) -> dict[str, float]:
+    """Return ``vector`` with one weighted engagement folded in."""
+    updated = dict(vector)
+    for k, v in features.items():
+        updated[k] = updated.get(k, 0.0) + weight * v
+    return updated
+
+
+def merge_seen(seen: Iterable[int] | None, post_id: int) -> list[int]:
+    ids = list(seen or [])
+    if post_id not in ids:
+        ids.append(post_id)
+    return ids
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import base64
+import bisect
+import heapq
+import json
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Generic, Sequence, TypeVar
+
+import numpy as np
+
+
+T = TypeVar("T")
+
+
+class TopK(Generic[T]):
+    """Bounded partial top-k selection ordered by ``(score, id)`` descending.
+
+    Chunks are pre-filtered with ``np.partition`` so only items that can
+    still make the cut reach the Python heap. ``after`` restricts selection
+    to items ranked strictly below a cursor position.
+    """
+
+    def __init__(self, k: int, after: tuple[float, int] | None = None) -> None:
+        self.k = k
+        self.after = after
+        self._heap: list[tuple[float, int, T | None]] = []
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, scores: Sequence[float] | np.ndarray, ids: Sequence[int], items: Sequence[T] | None = None) -> None:
+        if self.k <= 0 or len(ids) == 0:
+            return
+        scores = np.asarray(scores, dtype=np.float64)
+        id_arr = np.asarray(ids, dtype=np.int64)
+        idx = np.arange(len(scores))
+        if self.after is not None:
+            after_score, after_id = self.after
+            idx = idx[(scores < after_score) | ((scores == after_score) & (id_arr < after_id))]
+        if len(self._heap) == self.k:
+            idx = idx[scores[idx] >= self._heap[0][0]]
+        if len(idx) > self.k:
+            kth = np.partition(scores[idx], len(idx) - self.k)[len(idx) - self.k]
+            idx = idx[scores[idx] >= kth]
+        heap = self._heap
+        for i in idx.tolist():
+            entry = (float(scores[i]), int(id_arr[i]), items[i] if items is not None else None)
+            if len(heap) < self.k:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+
+    def ranked(self) -> list[tuple[float, int, T | None]]:
+        return sorted(self._heap, key=lambda e: (e[0], e[1]), reverse=True)
+
+
+@dataclass
+class Cursor:
+    score: float
+    post_id: int
+    snapshot: str | None = None
+
+    @property
+    def key(self) -> tuple[float, int]:
+        return (self.score, self.post_id)
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    payload = json.dumps({"s": cursor.score, "i": cursor.post_id, "n": cursor.snapshot}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Cursor:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        return Cursor(score=float(payload["s"]), post_id=int(payload["i"]), snapshot=payload.get("n"))
+    except Exception as exc:
+        raise ValueError("Invalid pagination cursor") from exc
+
+
+@dataclass
+class RankedSnapshot:
+    """Ranked ``(score, post_id)`` list for one user, best first.
+
+    ``complete`` is False when ranking stopped at the snapshot depth, so
+    pages past the end must be ranked again from the last position.
+    """
+
+    owner: str
+    entries: list[tuple[float, int]]
+    complete: bool
+    id: str = field(default_factory=lambda: secrets.token_urlsafe(8))
+    created_at: float = field(default_factory=time.monotonic)
+
+    def position_after(self, key: tuple[float, int]) -> int:
+        # entries are sorted descending, so bisect over negated keys
+        return bisect.bisect_right(self.entries, (-key[0], -key[1]), key=lambda e: (-e[0], -e[1]))
+
+    def window(self, start: int, limit: int) -> tuple[list[tuple[float, int]], bool]:
+        """Entries in ``[start, start + limit)`` and whether more may follow."""
+        page = self.entries[start : start + limit]
+        more = start + limit < len(self.entries) or not self.complete
+        return page, more
+
+
+class SnapshotStore:
+    """Small in-process LRU of ranked snapshots with a TTL."""
+
+    def __init__(self, max_snapshots: int = 1000, ttl_seconds: float = 600.0) -> None:
+        self.max_snapshots = max_snapshots
+        self.ttl_seconds = ttl_seconds
+        self._items: OrderedDict[str, RankedSnapshot] = OrderedDict()
+
+    def put(self, snapshot: RankedSnapshot) -> None:
+        self._items[snapshot.id] = snapshot
+        self._items.move_to_end(snapshot.id)
+        while len(self._items) > self.max_snapshots:
+            self._items.popitem(last=False)
+
+    def get(self, snapshot_id: str | None, owner: str) -> RankedSnapshot | None:
+        if not snapshot_id:
+            return None
+        snapshot = self._items.get(snapshot_id)
+        if snapshot is None:
+            return None
+        if snapshot.owner != owner:
+            return None
+        if time.monotonic() - snapshot.created_at > self.ttl_seconds:
+            self._items.pop(snapshot_id, None)
+            return None
+        self._items.move_to_end(snapshot_id)
+        return snapshot
+
+
+def next_cursor(page: list[tuple[float, int]], more: bool, snapshot: RankedSnapshot | None) -> str | None:
+    if not page or not more:
+        return None
+    score, post_id = page[-1]
+    return encode_cursor(Cursor(score=score, post_id=post_id, snapshot=snapshot.id if snapshot else None))
+
+
+def feed_window(
+    feed: dict,
+    limit: int,
+    offset: int = 0,
+    after: Cursor | None = None,
+) -> tuple[list[dict], str | None] | None:
+    """One page of a cached feed (``recommendation.get_ranked_feed``) and the cursor after it.
+
+    Returns None when the page is not fully inside the cached feed.
+    """
+    items, keys = feed["items"], feed["keys"]
+    start = offset
+    if after is not None:
+        positions = [i for i, (_, pid) in enumerate(keys or ()) if pid == after.post_id]
+        if not positions:
+            return None
+        start = positions[0] + 1
+    page = items[start : start + limit]
+    more = start + limit < len(items) or not feed["complete"]
+    if len(page) < limit and not feed["complete"]:
+        return None
+    cursor = None
+    if keys and page and more:
+        score, post_id = keys[start + len(page) - 1]
+        cursor = encode_cursor(Cursor(score=score, post_id=post_id))
+    return page, cursor
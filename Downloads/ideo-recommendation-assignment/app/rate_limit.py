@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+class AdaptiveTokenBucket:
+    """Token bucket whose rate follows the upstream's tolerance (AIMD).
+
+    ``acquire`` waits for a token at ``rate`` per second with bursts of up
+    to ``burst``. Each ``on_throttled`` (a 429) halves the rate, at most once
+    per second so one burst of 429s counts once, and with a ``retry_after``
+    holds every caller until it has passed. Each ``on_success`` adds
+    ``increase`` back, up to ``max_rate``.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        *,
+        burst: int | None = None,
+        min_rate: float = 1.0,
+        max_rate: float | None = None,
+        increase: float = 0.5,
+    ) -> None:
+        self.max_rate = max_rate or rate
+        self.min_rate = min(min_rate, self.max_rate)
+        self.rate = rate
+        self.capacity = float(burst or max(1, int(rate)))
+        self.increase = increase
+        self.tokens = self.capacity
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self._updated = time.monotonic()
+        self._decreased_at = float("-inf")
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        # reserve a token now; a negative balance is the queue ahead of us
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        wait = max(-self.tokens / self.rate, self.blocked_until - now)
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.blocked_until - time.monotonic()
+
+    def on_success(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttled(self, retry_after: float | None = None) -> None:
+        now = time.monotonic()
+        self.throttled += 1
+        if now - self._decreased_at >= 1.0:
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._decreased_at = now
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds to wait from a Retry-After header: delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(
+    attempt: int,
+    *,
+    base: float = 0.5,
+    cap: float = 30.0,
+    retry_after: float | None = None,
+    rng: random.Random | None = None,
+) -> float:
+    """Delay before retry ``attempt`` (0-based): full-jitter exponential backoff.
+
+    A server-sent ``retry_after`` replaces the exponential part and is not
+    capped. It still gets up to ``base`` of jitter, so clients that were
+    throttled together don't all retry at the same moment.
+    """
+    rng = rng or random
+    if retry_after is not None:
+        return retry_after + rng.uniform(0, base)
+    return rng.uniform(0, min(cap, base * 2**attempt))
@@ -1,120 +1,393 @@
 from __future__ import annotations
 
-from collections import defaultdict
 from typing import Sequence
 
-import math
-
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from .crud import get_user_by_username, get_posts, get_user_engagements
-from .models import EngagementType, Post
+from .cache import RefreshingCache
+from .config import get_settings
+from .crud import (
+    get_popular_post_ids,
+    get_post_ids_in_categories,
+    get_posts,
+    get_posts_by_ids,
+    get_recent_post_ids,
+    get_user_by_username,
+    get_user_profile,
+    has_engagements,
+    iter_post_chunks,
+    rebuild_user_profile,
+)
+from .dependencies import AsyncSessionLocal
+from .feature_index import post_feature_index
+from .http_cache import content_version
+from .models.posts import Post
+from .pipeline import Candidates, Pipeline, Stage, make_stage, prior_ranker
+from .ranking import RankedSnapshot, SnapshotStore, TopK, decode_cursor, next_cursor
+from .services.als import get_als_model
+from .services.ann import get_ann_index
+from .services.item_item import get_item_neighbours
+from .trending import TrendingFeed, get_trending_store
+
+
+settings = get_settings()
+# Part of every feed cache key; bump it when a ranking change should retire cached feeds.
+RANKING_VERSION = 1
+_snapshots = SnapshotStore(
+    max_snapshots=settings.FEED_SNAPSHOT_MAX_COUNT,
+    ttl_seconds=settings.FEED_SNAPSHOT_TTL_SECONDS,
+)
 
 
-def _cosine_similarity(a: dict[str, float], b: dict[str, float]) -> float:
-    if not a or not b:
-        return 0.0
-    dot = sum(a.get(k, 0.0) * b.get(k, 0.0) for k in set(a) | set(b))
-    na = math.sqrt(sum(v * v for v in a.values()))
-    nb = math.sqrt(sum(v * v for v in b.values()))
-    if na == 0 or nb == 0:
-        return 0.0
-    return dot / (na * nb)
+async def _trending_items(ranked: list[tuple[str, float]]) -> list[dict]:
+    async with AsyncSessionLocal() as db:
+        posts = {p.id: p for p in await get_posts_by_ids(db, [int(key) for key, _ in ranked])}
+    return [
+        {
+            "id": p.id,
+            "title": p.title,
+            "category": p.category,
+            "metadata": p.post_metadata,
+            "reason": "trending",
+        }
+        for p in (posts.get(int(key)) for key, _ in ranked)
+        if p is not None
+    ]
 
 
-def _vectorize_post(post: Post) -> dict[str, float]:
-    vector: dict[str, float] = defaultdict(float)
-    if post.category:
-        vector[f"cat:{post.category.lower()}"] = 1.0
-    if isinstance(post.metadata, dict):
-        for k, v in post.metadata.items():
-            key = f"m:{k}:{str(v).lower()}"
-            vector[key] += 1.0
-    return dict(vector)
+_trending = TrendingFeed(
+    get_trending_store("posts"),
+    _trending_items,
+    size=settings.TRENDING_LIST_SIZE,
+    refresh_seconds=settings.TRENDING_REFRESH_SECONDS,
+)
 
 
 async def get_cold_start_recommendations(db: AsyncSession, username: str, limit: int = 20, offset: int = 0) -> list[dict]:
-    posts = await get_posts(db, limit=limit, offset=offset)
-    return [
+    # Served from the ranked trending list in memory. Only when too little has
+    # trended to fill the page does it continue with the newest posts.
+    trending = await _trending.ranked()
+    items = [dict(item) for item in trending[offset : offset + limit]]
+    if len(items) == limit:
+        return items
+    posts = await get_posts(
+        db,
+        limit=limit - len(items),
+        offset=max(offset - len(trending), 0),
+        exclude_ids=[item["id"] for item in trending],
+    )
+    return items + [
         {
             "id": p.id,
             "title": p.title,
             "category": p.category,
-            "metadata": p.metadata,
+            "metadata": p.post_metadata,
             "reason": "cold_start",
         }
         for p in posts
     ]
 
 
-async def get_personalized_recommendations(db: AsyncSession, username: str, limit: int = 20, offset: int = 0) -> list[dict]:
+async def _user_preferences(db: AsyncSession, username: str) -> tuple[int, dict[str, float], list[int]] | None:
     user = await get_user_by_username(db, username)
     if not user:
-        return await get_cold_start_recommendations(db, username, limit=limit, offset=offset)
+        return None
 
-    engagements = await get_user_engagements(db, user.id)
-    all_posts = await get_posts(db, limit=1000, offset=0)
+    post_feature_index.refresh_if_stale()
+    profile = await get_user_profile(db, user.id)
+    if profile is None:
+        profile = await rebuild_user_profile(db, user.id)
 
-    if not engagements:
-        return await get_cold_start_recommendations(db, username, limit=limit, offset=offset)
+    if profile is None or not profile.engagement_count:
+        return None
+    return user.id, dict(profile.vector), list(profile.seen_post_ids)
 
-    # Build user preference vector
-    user_vec: dict[str, float] = defaultdict(float)
-    engaged_post_ids = {e.post_id for e in engagements}
-    for e in engagements:
-        weight = 0.5
-        if e.type == EngagementType.view:
-            weight = 0.5
-        elif e.type == EngagementType.like:
-            weight = 1.0
-        elif e.type == EngagementType.inspire:
-            weight = 1.2
-        elif e.type == EngagementType.rating:
-            weight = 0.8 + 0.4 * ((e.rating_score or 3) / 5.0)
-        # Accumulate vector
-        post = next((p for p in all_posts if p.id == e.post_id), None)
-        if not post:
-            continue
-        vec = _vectorize_post(post)
-        for k, v in vec.items():
-            user_vec[k] += weight * v
-
-    # Score all posts not yet engaged
-    scored: list[tuple[Post, float]] = []
-    for p in all_posts:
-        if p.id in engaged_post_ids:
-            continue
-        vec = _vectorize_post(p)
-        score = _cosine_similarity(user_vec, vec)
-        scored.append((p, score))
-
-    scored.sort(key=lambda x: x[1], reverse=True)
-    sliced = scored[offset : offset + limit]
-    return [
-        {
-            "id": p.id,
-            "title": p.title,
-            "category": p.category,
-            "metadata": p.metadata,
-            "reason": "personalized",
-            "score": round(score, 4),
-        }
-        for p, score in sliced
+
+def _top_categories(user_vec: dict[str, float], n: int = 3) -> list[str]:
+    weights = sorted(((w, f[4:]) for f, w in user_vec.items() if f.startswith("cat:")), reverse=True)
+    return [name for _, name in weights[:n]]
+
+
+def _post_ids(scored: Sequence[tuple[str, float]]) -> list[int]:
+    # collaborative models are keyed by str(post_id) when trained with --source posts
+    return [int(key) for key, _ in scored if key.isdigit()]
+
+
+def _candidate_stages(
+    user_id: int | None,
+    user_vec: dict[str, float],
+    seen: list[int],
+    category: str | None = None,
+    depth: int = 0,
+) -> list[Stage[int]]:
+    # SQL sources over-fetch by the number of seen posts that will be filtered
+    # out. Each opens its own session and is never cancelled mid-query: one
+    # past its budget finishes in the background and its ids are dropped.
+    extra = min(len(seen), 1000)
+    limit = max(settings.PIPELINE_SOURCE_LIMIT, depth)
+    categories = _top_categories(user_vec)
+    recent_seeds = {str(pid): 1.0 for pid in seen[-50:]}
+    user_key = str(user_id)
+
+    async def recent(limit: int) -> list[int]:
+        async with AsyncSessionLocal() as db:
+            return await get_recent_post_ids(db, limit=limit + extra, category=category)
+
+    async def in_categories(limit: int) -> list[int]:
+        async with AsyncSessionLocal() as db:
+            return await get_post_ids_in_categories(db, categories, limit=limit + extra)
+
+    async def popular(limit: int) -> list[int]:
+        trending = await get_trending_store("posts").top(limit + extra, category)
+        if trending:
+            return [int(key) for key, _ in trending]
+        async with AsyncSessionLocal() as db:
+            return await get_popular_post_ids(db, limit=limit + extra, category=category)
+
+    async def item_item(limit: int) -> list[int]:
+        model = get_item_neighbours()
+        if model is None or not recent_seeds:
+            return []
+        return _post_ids(model.recommend(recent_seeds, limit, exclude=recent_seeds))
+
+    async def embedding(limit: int) -> list[int]:
+        als, ann = get_als_model(), get_ann_index()
+        if als is None or ann is None or ann.model_version != als.version or not als.has_user(user_key):
+            return []
+        return _post_ids(ann.search(als.user_vector(user_key), limit, exclude=(str(pid) for pid in seen)))
+
+    # recent is the one source every feed has, so it runs without a budget
+    stages = [
+        make_stage("recent", recent, limit=limit, required=True),
+        make_stage("popular", popular, limit=limit, cancel=False),
     ]
+    if category is None:
+        stages.append(make_stage("category", in_categories, limit=limit, cancel=False))
+        stages.append(make_stage("item_item", item_item, limit=limit))
+        stages.append(make_stage("ann", embedding, limit=max(settings.ANN_CANDIDATES, depth)))
+    return stages
+
+
+def _content_ranker(db: AsyncSession, user_vec: dict[str, float]):
+    async def rank(candidates: Candidates[int]):
+        missing = [pid for pid in candidates.keys if pid not in post_feature_index]
+        for p in await get_posts_by_ids(db, missing):
+            post_feature_index.upsert(p.id, p.category, p.post_metadata)
+        return post_feature_index.score(user_vec, candidates.keys)
+
+    return rank
+
+
+async def _scan_catalog(
+    user_vec: dict[str, float],
+    k: int,
+    exclude: Sequence[int] = (),
+    after: tuple[float, int] | None = None,
+    category: str | None = None,
+) -> list[tuple[float, int]]:
+    """Best ``k`` posts of the whole catalog (or one category) by content score.
+
+    Posts stream in FEED_SCORING_CHUNK_SIZE keyset pages into a bounded
+    top-k, so memory stays flat however large the catalog is.
+    """
+    excluded = set(exclude)
+    top: TopK[None] = TopK(k, after=after)
+    async with AsyncSessionLocal() as db:
+        async for chunk in iter_post_chunks(db, category=category, chunk_size=settings.FEED_SCORING_CHUNK_SIZE):
+            ids = []
+            for p in chunk:
+                if p.id in excluded:
+                    continue
+                if p.id not in post_feature_index:
+                    post_feature_index.upsert(p.id, p.category, p.post_metadata)
+                ids.append(p.id)
+            top.push(post_feature_index.score(user_vec, ids), ids)
+    return [(score, pid) for score, pid, _ in top.ranked()]
+
+
+async def _rank_candidates(
+    db: AsyncSession,
+    prefs: tuple[int, dict[str, float], list[int]],
+    k: int,
+    after: tuple[float, int] | None = None,
+) -> tuple[list[tuple[float, int]], bool]:
+    """Best ``k`` posts for the user below ``after``, and whether the catalog ran out before ``k``."""
+    user_id, user_vec, seen = prefs
+    pipeline = Pipeline(_candidate_stages(user_id, user_vec, seen, depth=k), _content_ranker(db, user_vec))
+    ranked, _ = await pipeline.run(k, exclude=seen, after=after)
+    if len(ranked) >= k:
+        return ranked, False
+    # the sources ran dry before k: the whole catalog is ranked instead,
+    # with the same scores, so a feed is never capped by retrieval
+    ranked = await _scan_catalog(user_vec, k, seen, after)
+    return ranked, len(ranked) < k
+
+
+def _personalized_item(p: Post, score: float) -> dict:
+    return {
+        "id": p.id,
+        "title": p.title,
+        "category": p.category,
+        "metadata": p.post_metadata,
+        "reason": "personalized",
+        "score": round(score, 4),
+    }
+
+
+async def get_personalized_recommendations(db: AsyncSession, username: str, limit: int = 20, offset: int = 0) -> list[dict]:
+    prefs = await _user_preferences(db, username)
+    if prefs is None:
+        return await get_cold_start_recommendations(db, username, limit=limit, offset=offset)
+
+    ranked, _ = await _rank_candidates(db, prefs, offset + limit)
+    ranked = ranked[offset:]
+    posts = {p.id: p for p in await get_posts_by_ids(db, [pid for _, pid in ranked])}
+    return [_personalized_item(posts[pid], score) for score, pid in ranked if pid in posts]
+
+
+async def _snapshot_page(
+    db: AsyncSession,
+    snapshot: RankedSnapshot,
+    start: int,
+    limit: int,
+    posts: dict[int, Post] | None = None,
+) -> tuple[list[dict], str | None]:
+    page, more = snapshot.window(start, limit)
+    if posts is None:
+        posts = {p.id: p for p in await get_posts_by_ids(db, [pid for _, pid in page])}
+    items = [_personalized_item(posts[pid], score) for score, pid in page if pid in posts]
+    return items, next_cursor(page, more, snapshot)
+
+
+async def get_personalized_page(
+    db: AsyncSession,
+    username: str,
+    *,
+    limit: int = 20,
+    offset: int = 0,
+    cursor: str | None = None,
+) -> tuple[list[dict], str | None]:
+    """One page of the ranked feed plus an opaque cursor for the next page.
+
+    The first request ranks FEED_SNAPSHOT_SIZE candidates into a snapshot;
+    later cursors page through it without re-scoring. Past the end of the
+    snapshot the candidates are ranked again, strictly below the cursor.
+    Raises ValueError for a malformed cursor.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    if after is not None:
+        snapshot = _snapshots.get(after.snapshot, username)
+        if snapshot is not None:
+            start = snapshot.position_after(after.key)
+            if start < len(snapshot.entries) or snapshot.complete:
+                return await _snapshot_page(db, snapshot, start, limit)
+
+    prefs = await _user_preferences(db, username)
+    if prefs is None:
+        if after is not None:
+            return [], None
+        return await get_cold_start_recommendations(db, username, limit=limit, offset=offset), None
+
+    depth = max(settings.FEED_SNAPSHOT_SIZE, offset + limit)
+    ranked, complete = await _rank_candidates(db, prefs, depth, after=after.key if after else None)
+    snapshot = RankedSnapshot(owner=username, entries=ranked, complete=complete)
+    _snapshots.put(snapshot)
+    return await _snapshot_page(db, snapshot, 0 if after else offset, limit)
 
 
 async def get_category_recommendations(db: AsyncSession, username: str, project_code: str, limit: int = 20, offset: int = 0) -> list[dict]:
-    posts = await get_posts(db, category=project_code, limit=1000, offset=0)
-    result = [
+    prefs = await _user_preferences(db, username)
+    return await _category_items(db, prefs, project_code, limit, offset)
+
+
+async def _category_items(
+    db: AsyncSession,
+    prefs: tuple[int, dict[str, float], list[int]] | None,
+    project_code: str,
+    limit: int,
+    offset: int = 0,
+) -> list[dict]:
+    # personal taste orders the category when we have it; otherwise the
+    # retrieval scores of the recent and popular sources do
+    user_id, user_vec, _ = prefs if prefs is not None else (None, {}, [])
+    ranker = _content_ranker(db, user_vec) if user_vec else prior_ranker
+    stages = _candidate_stages(user_id, user_vec, [], category=project_code, depth=offset + limit)
+    pipeline = Pipeline(stages, ranker)
+    ranked, _ = await pipeline.run(offset + limit)
+    if user_vec and len(ranked) < offset + limit:
+        ranked = await _scan_catalog(user_vec, offset + limit, category=project_code)
+    ranked = ranked[offset:]
+    posts = {p.id: p for p in await get_posts_by_ids(db, [pid for _, pid in ranked])}
+    return [
         {
             "id": p.id,
             "title": p.title,
             "category": p.category,
-            "metadata": p.metadata,
+            "metadata": p.post_metadata,
             "reason": "category",
         }
-        for p in posts
+        for p in (posts[pid] for _, pid in ranked if pid in posts)
     ]
-    return result[offset : offset + limit]
 
 
+def feed_model_version() -> str:
+    als = get_als_model()
+    return f"{RANKING_VERSION}.{als.version if als is not None else 0}"
+
+
+async def get_ranked_feed(db: AsyncSession, username: str, project_code: str | None = None) -> dict:
+    """The first FEED_SNAPSHOT_SIZE items of a feed, as one cacheable value.
+
+    ``keys`` holds the ``(score, post_id)`` ranking positions of personalized
+    feeds, for cursors. ``complete`` is False when ranking stopped at the
+    depth, so windows past the end have to be computed directly. ``version``
+    changes whenever the content does and backs the HTTP ETag. Users
+    without engagements get the shared feed.
+    """
+    prefs = await _user_preferences(db, username)
+    if prefs is None:
+        return await shared_feeds.get(project_code)
+    depth = settings.FEED_SNAPSHOT_SIZE
+    if project_code:
+        items = await _category_items(db, prefs, project_code, limit=depth)
+        return _feed_value(items, None, len(items) < depth)
+    ranked, complete = await _rank_candidates(db, prefs, depth)
+    posts = {p.id: p for p in await get_posts_by_ids(db, [pid for _, pid in ranked])}
+    ranked = [(score, pid) for score, pid in ranked if pid in posts]
+    return _feed_value(
+        [_personalized_item(posts[pid], score) for score, pid in ranked],
+        [[score, pid] for score, pid in ranked],
+        complete,
+    )
+
+
+def _feed_value(items: list[dict], keys: list[list] | None, complete: bool) -> dict:
+    return {
+        "items": items,
+        "keys": keys,
+        "complete": complete,
+        "version": content_version([items, keys]),
+    }
+
+
+async def _shared_feed(project_code: str | None) -> dict:
+    depth = settings.FEED_SNAPSHOT_SIZE
+    async with AsyncSessionLocal() as db:
+        if project_code:
+            items = await _category_items(db, None, project_code, limit=depth)
+        else:
+            items = await get_cold_start_recommendations(db, "", limit=depth)
+    return _feed_value(items, None, len(items) < depth)
+
+
+# Non-personalized feeds (cold start, and categories for users without
+# history) are the same for everyone, so each is built once per worker.
+shared_feeds: RefreshingCache[str | None, dict] = RefreshingCache(
+    _shared_feed, refresh_seconds=settings.SHARED_FEED_REFRESH_SECONDS
+)
+
+
+async def is_known_user(db: AsyncSession, username: str) -> bool:
+    """Whether ``username`` has engagements; users without any get shared feeds."""
+    return await has_engagements(db, username)
+
@@ -1,15 +1,20 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..dependencies import get_db
-from ..cache import get_cached_feed, cache_user_feed, paginate
+from ..dependencies import AsyncSessionLocal, get_db
+from ..cache import feed_cache
+from ..http_cache import content_version, etag_matches, feed_cache_control, make_etag, not_modified
+from ..ranking import decode_cursor, feed_window
 from ..recommendation import (
-    get_cold_start_recommendations,
-    get_personalized_recommendations,
+    feed_model_version,
+    get_personalized_page,
     get_category_recommendations,
+    get_ranked_feed,
+    is_known_user,
+    shared_feeds,
 )
 
 
@@ -18,29 +23,66 @@ router = APIRouter(tags=["feed"])
 
 @router.get("/feed")
 async def get_feed(
+    response: Response,
     username: str = Query(..., min_length=3),
     project_code: str | None = Query(None, min_length=1),
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
+    cursor: str | None = Query(None, description="Opaque cursor from the X-Next-Cursor header"),
+    if_none_match: str | None = Header(None),
     db: AsyncSession = Depends(get_db),
 ):
-    try:
-        cached = await get_cached_feed(username)
-        if cached is not None and not project_code:
-            return paginate(cached, limit, offset)
+    after = None
+    if cursor and not project_code:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-        if project_code:
-            feed = await get_category_recommendations(db, username, project_code, limit=limit, offset=offset)
-            return feed
+    try:
+        async def build() -> dict:
+            # may refresh a stale entry after this request has finished,
+            # so it cannot use the request's session
+            async with AsyncSessionLocal() as session:
+                return await get_ranked_feed(session, username, project_code)
 
-        # try personalized, fallback to cold start
-        feed = await get_personalized_recommendations(db, username, limit=limit, offset=offset)
-        if not feed:
-            feed = await get_cold_start_recommendations(db, username, limit=limit, offset=offset)
+        # one entry holds the whole ranked feed; any window is sliced from it
+        feed_cache.start_listener()
+        personalized = await is_known_user(db, username)
+        if personalized:
+            key = f"{username}:{project_code or ''}:{feed_model_version()}"
+            feed = await feed_cache.get_or_compute(key, build, group=username)
+        else:
+            feed = await shared_feeds.get(project_code)
+        window = feed_window(feed, limit, offset, after)
+        if window is not None:
+            items, next_cursor = window
+            # the same window of the same feed version is the same body
+            etag = make_etag(feed.get("version") or content_version(feed), offset, limit, cursor or "")
+        else:
+            if project_code:
+                items, next_cursor = await get_category_recommendations(db, username, project_code, limit=limit, offset=offset), None
+            else:
+                # past the cached depth: rank further down directly
+                items, next_cursor = await get_personalized_page(db, username, limit=limit, offset=offset, cursor=cursor)
+            # not next_cursor: it names a fresh snapshot on every request
+            etag = make_etag(content_version(items), offset, limit)
 
-        await cache_user_feed(username, feed)
-        return feed
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag, headers, private=personalized)
+        response.headers.update({**headers, "ETag": etag, "Cache-Control": feed_cache_control(private=personalized)})
+        return items
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/feed/cache-stats")
+async def get_feed_cache_stats():
+    breaker = feed_cache.breaker
+    return {
+        **feed_cache.stats.as_dict(),
+        "local_entries": len(feed_cache.local),
+        "redis_circuit": breaker.state if breaker else "none",
+        "redis_short_circuited": breaker.rejected if breaker else 0,
+    }
@@ -7,9 +7,10 @@ import logging
 from typing import Optional
 from uuid import UUID
 
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Header, Query, Depends
 from fastapi.responses import JSONResponse
 
+from app.http_cache import conditional_json
 from app.models.recommendation import RecommendationResponse, ErrorResponse
 from app.services.recommendation import recommendation_service
 
@@ -26,7 +27,8 @@ router = APIRouter(prefix="/api/v1", tags=["recommendations"])
 )
 async def get_personalized_feed(
     username: str = Query(..., min_length=1, max_length=100, description="Username for personalized recommendations"),
-    limit: int = Query(5, ge=1, le=20, description="Maximum number of recommendations to return")
+    limit: int = Query(5, ge=1, le=20, description="Maximum number of recommendations to return"),
+    if_none_match: Optional[str] = Header(None)
 ) -> RecommendationResponse:
     """
     Get personalized video recommendations for a user.
@@ -38,6 +40,8 @@ async def get_personalized_feed(
     - Engagement patterns (likes, inspires, ratings)
     
     For new users (cold start), returns motivational content inspired by Empowerverse App.
+    
+    Responses carry an ETag; a matching If-None-Match gets 304 Not Modified.
     """
     try:
         if not username or username.strip() == "":
@@ -54,7 +58,8 @@ async def get_personalized_feed(
         )
         
         logger.info(f"Generated {len(recommendations.recommendations)} recommendations for {username}")
-        return recommendations
+        # serialized once here, both for the ETag and as the body
+        return conditional_json(recommendations.model_dump_json().encode(), if_none_match)
         
     except ValueError as e:
         logger.error(f"Validation error for user {username}: {str(e)}")
@@ -77,7 +82,8 @@ async def get_personalized_feed(
 async def get_category_feed(
     username: str = Query(..., min_length=1, max_length=100, description="Username for recommendations"),
     project_code: str = Query(..., min_length=1, max_length=50, description="Category or project code to filter by"),
-    limit: int = Query(5, ge=1, le=20, description="Maximum number of recommendations to return")
+    limit: int = Query(5, ge=1, le=20, description="Maximum number of recommendations to return"),
+    if_none_match: Optional[str] = Header(None)
 ) -> RecommendationResponse:
     """
     Get category-specific video recommendations for a user.
@@ -113,7 +119,7 @@ async def get_category_feed(
         )
         
         logger.info(f"Generated {len(recommendations.recommendations)} {project_code} recommendations for {username}")
-        return recommendations
+        return conditional_json(recommendations.model_dump_json().encode(), if_none_match)
         
     except ValueError as e:
         logger.error(f"Validation error for user {username}, category {project_code}: {str(e)}")
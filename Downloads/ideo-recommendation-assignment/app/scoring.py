@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from typing import Iterable, Mapping, Sequence
+
+import numpy as np
+
+
+class FeatureVocabulary:
+    """Append-only mapping of feature names to matrix columns.
+
+    Columns are never reassigned, so a matrix built earlier stays valid when
+    new features appear later.
+    """
+
+    def __init__(self, names: Iterable[str] = ()) -> None:
+        self._names: list[str] = []
+        self._index: dict[str, int] = {}
+        for name in names:
+            self.add(name)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._index
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._names)
+
+    def add(self, name: str) -> int:
+        col = self._index.get(name)
+        if col is None:
+            col = len(self._names)
+            self._index[name] = col
+            self._names.append(name)
+        return col
+
+    def get(self, name: str) -> int | None:
+        return self._index.get(name)
+
+
+def _l2_normalise(values: np.ndarray) -> np.ndarray:
+    norm = float(np.sqrt(np.dot(values, values)))
+    if norm == 0.0:
+        return np.zeros_like(values)
+    return values / norm
+
+
+class PostFeatureMatrix:
+    """L2-normalised post feature vectors stored as one CSR matrix.
+
+    Row ``r`` holds the features of ``post_ids[r]``; because every row has
+    unit length, the cosine similarity against a normalised query is just the
+    row dot product.
+    """
+
+    def __init__(
+        self,
+        vocab: FeatureVocabulary,
+        post_ids: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        data: np.ndarray,
+    ) -> None:
+        self.vocab = vocab
+        self.post_ids = np.asarray(post_ids, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.data = np.asarray(data, dtype=np.float32)
+        self._rows = {int(pid): r for r, pid in enumerate(self.post_ids)}
+
+    def __len__(self) -> int:
+        return len(self.post_ids)
+
+    @classmethod
+    def from_vectors(
+        cls,
+        items: Iterable[tuple[int, Mapping[str, float]]],
+        vocab: FeatureVocabulary | None = None,
+    ) -> "PostFeatureMatrix":
+        vocab = vocab if vocab is not None else FeatureVocabulary()
+        post_ids: list[int] = []
+        indptr: list[int] = [0]
+        indices: list[int] = []
+        data: list[float] = []
+        for post_id, vector in items:
+            cols = [vocab.add(k) for k in vector]
+            vals = _l2_normalise(np.fromiter(vector.values(), dtype=np.float64, count=len(cols)))
+            post_ids.append(post_id)
+            indices.extend(cols)
+            data.extend(vals.tolist())
+            indptr.append(len(indices))
+        return cls(vocab, np.array(post_ids), np.array(indptr), np.array(indices), np.array(data))
+
+    def row_of(self, post_id: int) -> int | None:
+        return self._rows.get(int(post_id))
+
+    def query(self, vector: Mapping[str, float]) -> np.ndarray:
+        """Dense, normalised query over the vocabulary.
+
+        Features unknown to the vocabulary still count towards the norm so
+        scores match a plain cosine similarity over the union of keys.
+        """
+        q = np.zeros(len(self.vocab), dtype=np.float64)
+        norm_sq = 0.0
+        for name, value in vector.items():
+            norm_sq += value * value
+            col = self.vocab.get(name)
+            if col is not None:
+                q[col] += value
+        if norm_sq == 0.0:
+            return q
+        return q / np.sqrt(norm_sq)
+
+    def score(self, q: np.ndarray) -> np.ndarray:
+        """Cosine score of every row against a query built by ``query``."""
+        if len(self.post_ids) == 0 or not q.any():
+            return np.zeros(len(self.post_ids), dtype=np.float64)
+        row_of_nnz = np.repeat(np.arange(len(self.post_ids)), np.diff(self.indptr))
+        return np.bincount(row_of_nnz, weights=self.data * q[self.indices], minlength=len(self.post_ids))
+
+    def score_rows(self, q: np.ndarray, rows: Sequence[int] | np.ndarray) -> np.ndarray:
+        """Cosine score for a subset of rows, touching only their non-zeros."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0 or not q.any():
+            return np.zeros(len(rows), dtype=np.float64)
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.zeros(len(rows), dtype=np.float64)
+        local_row = np.repeat(np.arange(len(rows)), lengths)
+        offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        nnz = starts[local_row] + offsets
+        return np.bincount(local_row, weights=self.data[nnz] * q[self.indices[nnz]], minlength=len(rows))
@@ -0,0 +1,257 @@
+"""
+Implicit-feedback ALS matrix factorization.
+Trains user and video factors offline and serves them from memory-mapped .npy files,
+so every uvicorn worker shares one copy of the model through the page cache.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.services.interactions import Interactions
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = "CURRENT"
+
+
+def _csr(rows: np.ndarray, cols: np.ndarray, values: np.ndarray, n_rows: int):
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, cols[order], values[order]
+
+
+def _solve_side(
+    fixed: np.ndarray,
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    confidence: np.ndarray,
+    regularization: float,
+) -> np.ndarray:
+    """
+    One ALS half-step: solve every row against the fixed factors.
+
+    With preference p = 1 for observed pairs and confidence c = 1 + alpha * w,
+    each row solves (YtY + Yu^T (Cu - I) Yu + reg * I) x = Yu^T Cu p.
+    """
+    n_rows, n_factors = len(indptr) - 1, fixed.shape[1]
+    gram = fixed.T @ fixed + regularization * np.eye(n_factors)
+    solved = np.zeros((n_rows, n_factors), dtype=np.float64)
+    for r in range(n_rows):
+        start, end = indptr[r], indptr[r + 1]
+        if start == end:
+            continue
+        y = fixed[indices[start:end]]
+        c = confidence[start:end]
+        a = gram + (y.T * c) @ y
+        b = y.T @ (1.0 + c)
+        solved[r] = np.linalg.solve(a, b)
+    return solved
+
+
+def train_als(
+    interactions: Interactions,
+    factors: int = 64,
+    regularization: float = 0.05,
+    alpha: float = 40.0,
+    iterations: int = 15,
+    seed: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Train implicit ALS over aggregated engagement weights.
+
+    Engagement weights (view < like < inspire, ratings scaled by score) become
+    confidences ``alpha * weight``. Returns float32 (user_factors, video_factors).
+    """
+    rng = np.random.default_rng(seed)
+    user_idx = interactions.user_idx.astype(np.int64)
+    item_idx = interactions.item_idx.astype(np.int64)
+    confidence = alpha * interactions.weight.astype(np.float64)
+
+    by_user = _csr(user_idx, item_idx, confidence, interactions.n_users)
+    by_item = _csr(item_idx, user_idx, confidence, interactions.n_items)
+
+    users = rng.normal(scale=0.01, size=(interactions.n_users, factors))
+    items = rng.normal(scale=0.01, size=(interactions.n_items, factors))
+    for iteration in range(iterations):
+        started = time.perf_counter()
+        users = _solve_side(items, *by_user, regularization)
+        items = _solve_side(users, *by_item, regularization)
+        logger.info(f"ALS iteration {iteration + 1}/{iterations} took {time.perf_counter() - started:.2f}s")
+    return users.astype(np.float32), items.astype(np.float32)
+
+
+def save_factors(
+    directory: str,
+    user_keys: np.ndarray,
+    video_keys: np.ndarray,
+    user_factors: np.ndarray,
+    video_factors: np.ndarray,
+) -> str:
+    """
+    Write a new model version under ``directory`` and point CURRENT at it.
+
+    Versions are immutable directories, so workers that still have an older
+    version mapped keep reading consistent files while the pointer moves on.
+    """
+    os.makedirs(directory, exist_ok=True)
+    version = f"{time.time_ns():020d}"
+    staging = tempfile.mkdtemp(dir=directory, prefix=".staging-")
+    try:
+        np.save(os.path.join(staging, "user_factors.npy"), np.ascontiguousarray(user_factors, dtype=np.float32))
+        np.save(os.path.join(staging, "video_factors.npy"), np.ascontiguousarray(video_factors, dtype=np.float32))
+        np.save(os.path.join(staging, "user_keys.npy"), np.asarray(user_keys, dtype=str))
+        np.save(os.path.join(staging, "video_keys.npy"), np.asarray(video_keys, dtype=str))
+        os.replace(staging, os.path.join(directory, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".current-")
+    with os.fdopen(fd, "w") as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(directory, CURRENT_FILE))
+    _prune_versions(directory, keep=3)
+    return version
+
+
+def _prune_versions(directory: str, keep: int) -> None:
+    """Delete all but the newest ``keep`` versions; mapped files stay readable until unmapped."""
+    versions = sorted(
+        name for name in os.listdir(directory)
+        if not name.startswith(".") and os.path.isdir(os.path.join(directory, name))
+    )
+    for name in versions[:-keep]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+class ALSModel:
+    """Read-only ALS factors backed by np.memmap."""
+
+    def __init__(self, version: str, user_keys: np.ndarray, video_keys: np.ndarray,
+                 user_factors: np.ndarray, video_factors: np.ndarray):
+        self.version = version
+        self.user_factors = user_factors
+        self.video_factors = video_factors
+        self.video_keys = video_keys
+        self._users = {key: i for i, key in enumerate(user_keys.tolist())}
+        self._videos = {key: i for i, key in enumerate(video_keys.tolist())}
+
+    @classmethod
+    def load(cls, directory: str) -> "ALSModel":
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            version = f.read().strip()
+        path = os.path.join(directory, version)
+        return cls(
+            version=version,
+            user_keys=np.load(os.path.join(path, "user_keys.npy")),
+            video_keys=np.load(os.path.join(path, "video_keys.npy")),
+            user_factors=np.load(os.path.join(path, "user_factors.npy"), mmap_mode="r"),
+            video_factors=np.load(os.path.join(path, "video_factors.npy"), mmap_mode="r"),
+        )
+
+    def has_user(self, user_key: str) -> bool:
+        return user_key in self._users
+
+    def user_vector(self, user_key: str) -> Optional[np.ndarray]:
+        row = self._users.get(user_key)
+        return None if row is None else np.asarray(self.user_factors[row])
+
+    def video_vector(self, video_key: str) -> Optional[np.ndarray]:
+        row = self._videos.get(video_key)
+        return None if row is None else np.asarray(self.video_factors[row])
+
+    def score_videos(self, user_key: str, video_keys: Iterable[str]) -> np.ndarray:
+        """Predicted preference of one user for each video; unknown pairs score 0."""
+        video_keys = list(video_keys)
+        scores = np.zeros(len(video_keys), dtype=np.float32)
+        user = self.user_vector(user_key)
+        if user is None:
+            return scores
+        positions = [i for i, key in enumerate(video_keys) if key in self._videos]
+        rows = [self._videos[video_keys[i]] for i in positions]
+        if rows:
+            scores[positions] = self.video_factors[rows] @ user
+        return scores
+
+    def recommend(self, user_key: str, limit: int, exclude: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """Top videos for a user by a single dot product against all video factors."""
+        user = self.user_vector(user_key)
+        if user is None or limit <= 0:
+            return []
+        scores = np.asarray(self.video_factors @ user)
+        excluded = [self._videos[key] for key in (exclude or ()) if key in self._videos]
+        if excluded:
+            scores[excluded] = -np.inf
+        limit = min(limit, len(scores) - len(excluded))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(str(self.video_keys[i]), float(scores[i])) for i in top]
+
+
+_model: Optional[ALSModel] = None
+_model_version: Optional[str] = None
+
+
+def get_als_model() -> Optional[ALSModel]:
+    """Current ALS model, remapping when CURRENT points at a new version."""
+    global _model, _model_version
+    directory = settings.ALS_MODEL_DIR
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            version = f.read().strip()
+    except (FileNotFoundError, TypeError):
+        return _model
+    if version != _model_version:
+        _model = ALSModel.load(directory)
+        _model_version = version
+        logger.info(f"Mapped ALS model {version} ({len(_model.video_keys)} videos)")
+    return _model
+
+
+async def _load(source: str) -> Interactions:
+    from app.services.db import get_session_factory
+    from app.services.interactions import load_interactions
+
+    async with get_session_factory()() as session:
+        return await load_interactions(session, source)
+
+
+def main() -> None:
+    from app.services.ann import build_ivf
+
+    parser = argparse.ArgumentParser(description="Train implicit ALS factors from engagements")
+    parser.add_argument("--source", choices=["videos", "posts"], default="videos")
+    parser.add_argument("--factors", type=int, default=64)
+    parser.add_argument("--regularization", type=float, default=0.05)
+    parser.add_argument("--alpha", type=float, default=40.0)
+    parser.add_argument("--iterations", type=int, default=15)
+    parser.add_argument("--output", default=settings.ALS_MODEL_DIR)
+    parser.add_argument("--ann-index", default=settings.ANN_INDEX_PATH, help="rebuild this ANN index; empty to skip")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    interactions = asyncio.run(_load(args.source))
+    user_factors, video_factors = train_als(
+        interactions, args.factors, args.regularization, args.alpha, args.iterations
+    )
+    version = save_factors(args.output, interactions.user_keys, interactions.item_keys, user_factors, video_factors)
+    print(f"Wrote ALS model {version} ({interactions.n_users} users, {interactions.n_items} videos) to {args.output}")
+    if args.ann_index:
+        build_ivf(interactions.item_keys, video_factors, model_version=version).save(args.ann_index)
+        print(f"Wrote ANN index for model {version} to {args.ann_index}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Approximate nearest-neighbour retrieval over dense video vectors.
+An inverted-file (IVF) index: k-means centroids partition the catalog and a query
+only scores the vectors in the few partitions whose centroids match it best.
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+    """Nearest centroid (L2) of every vector."""
+    half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch_size):
+        block = vectors[start : start + batch_size]
+        labels[start : start + len(block)] = np.argmax(block @ centroids.T - half_norms, axis=1)
+    return labels
+
+
+def kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    iterations: int = 10,
+    seed: int = 0,
+    max_points_per_cluster: int = 256,
+) -> np.ndarray:
+    """Lloyd's k-means on a sample of ``vectors``; returns float32 centroids."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), n_clusters * max_points_per_cluster)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)].astype(np.float32)
+    centroids = sample[rng.choice(sample_size, n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(sample, centroids)
+        counts = np.bincount(labels, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # re-seed empty clusters from random points so no partition is wasted
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+    return centroids
+
+
+class IVFIndex:
+    """
+    IVF-flat index for maximum inner product search.
+
+    Vectors are stored grouped by partition so a probe reads contiguous rows.
+    Inserts go to a small pending buffer that is scored exhaustively and merged
+    into the partitions once it reaches ``merge_threshold``.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        keys: Iterable[str],
+        vectors: np.ndarray,
+        labels: Optional[np.ndarray] = None,
+        model_version: str = "",
+        nprobe: int = 8,
+        merge_threshold: int = 1024,
+    ):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.model_version = model_version
+        self.nprobe = nprobe
+        self.merge_threshold = merge_threshold
+        self._pending: Dict[str, np.ndarray] = {}
+        self._dirty = False
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if labels is None:
+            labels = _assign(vectors, self.centroids)
+        self._pack(np.asarray(list(keys), dtype=str), vectors, np.asarray(labels, dtype=np.int64))
+
+    @property
+    def dim(self) -> int:
+        return self.centroids.shape[1]
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self) -> int:
+        return len(self._rows) + len(self._pending)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows or key in self._pending
+
+    def _pack(self, keys: np.ndarray, vectors: np.ndarray, labels: np.ndarray) -> None:
+        order = np.argsort(labels, kind="stable")
+        self.keys = keys[order]
+        self.vectors = np.ascontiguousarray(vectors[order])
+        self.labels = labels[order]
+        self.list_ptr = np.zeros(self.n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=self.n_lists), out=self.list_ptr[1:])
+        self._alive = np.ones(len(self.keys), dtype=bool)
+        self._key_list = self.keys.tolist()
+        self._rows = {key: i for i, key in enumerate(self._key_list)}
+
+    def vector(self, key: str) -> Optional[np.ndarray]:
+        if key in self._pending:
+            return self._pending[key]
+        row = self._rows.get(key)
+        return None if row is None else self.vectors[row]
+
+    def mean_vector(self, keys: Iterable[str]) -> Optional[np.ndarray]:
+        """Average vector of the indexed ``keys``; used to place items with no history."""
+        found = [v for v in (self.vector(key) for key in keys) if v is not None]
+        return np.mean(found, axis=0).astype(np.float32) if found else None
+
+    def add(self, key: str, vector: np.ndarray) -> None:
+        """Insert or replace one vector."""
+        row = self._rows.pop(key, None)
+        if row is not None:
+            self._alive[row] = False
+        self._pending[key] = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        self._dirty = True
+        if len(self._pending) >= self.merge_threshold:
+            self.compact()
+
+    def compact(self) -> None:
+        """Merge pending inserts into the partitions and drop replaced rows."""
+        if not self._pending and self._alive.all():
+            return
+        keys, vectors, labels = self.keys[self._alive], self.vectors[self._alive], self.labels[self._alive]
+        if self._pending:
+            extra = np.stack(list(self._pending.values()))
+            keys = np.concatenate([keys, np.asarray(list(self._pending), dtype=str)])
+            vectors = np.concatenate([vectors, extra])
+            labels = np.concatenate([labels, _assign(extra, self.centroids).astype(np.int64)])
+            self._pending.clear()
+        self._pack(keys, vectors, labels)
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None,
+        exclude: Optional[Iterable[str]] = None,
+    ) -> List[Tuple[str, float]]:
+        """Top ``k`` keys by inner product with ``query``, best first."""
+        if k <= 0 or len(self) == 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        nprobe = max(1, min(nprobe or self.nprobe, self.n_lists))
+
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        starts = self.list_ptr[probe]
+        lengths = self.list_ptr[probe + 1] - starts
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        rows = np.repeat(starts, lengths) + offsets
+
+        scores = self.vectors[rows] @ query
+        keep = self._alive[rows]
+        excluded = set(exclude or ())
+        if excluded:
+            dropped = [self._rows[key] for key in excluded if key in self._rows]
+            keep &= ~np.isin(rows, dropped)
+        rows, scores = rows[keep], scores[keep]
+
+        # pending inserts get negative ids: -1 is the first pending key
+        pending = [key for key in self._pending if key not in excluded]
+        if pending:
+            rows = np.concatenate([rows, -1 - np.arange(len(pending))])
+            scores = np.concatenate([scores, np.stack([self._pending[key] for key in pending]) @ query])
+
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return [
+            (self._key_list[r] if r >= 0 else pending[-1 - r], s)
+            for r, s in zip(rows[order].tolist(), scores[order].tolist())
+        ]
+
+    def save(self, path: str) -> None:
+        """Atomically write the compacted index to ``path``."""
+        self.compact()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    centroids=self.centroids,
+                    keys=self.keys,
+                    vectors=self.vectors,
+                    labels=self.labels,
+                    model_version=np.array(self.model_version),
+                )
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._dirty = False
+
+    @classmethod
+    def load(cls, path: str, nprobe: int = 8) -> "IVFIndex":
+        with np.load(path, allow_pickle=False) as npz:
+            return cls(
+                npz["centroids"],
+                npz["keys"],
+                npz["vectors"],
+                npz["labels"],
+                model_version=str(npz["model_version"]),
+                nprobe=nprobe,
+            )
+
+
+def build_ivf(
+    keys: Iterable[str],
+    vectors: np.ndarray,
+    n_lists: Optional[int] = None,
+    iterations: int = 10,
+    seed: int = 0,
+    model_version: str = "",
+    nprobe: int = 8,
+) -> IVFIndex:
+    """Cluster ``vectors`` into ``n_lists`` partitions (default sqrt(n)) and index them."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    n_lists = n_lists or int(np.sqrt(len(vectors)))
+    n_lists = max(1, min(n_lists, len(vectors)))
+    centroids = kmeans(vectors, n_lists, iterations, seed)
+    return IVFIndex(centroids, keys, vectors, model_version=model_version, nprobe=nprobe)
+
+
+_index: Optional[IVFIndex] = None
+_index_mtime: float = 0.0
+
+
+def get_ann_index() -> Optional[IVFIndex]:
+    """
+    Load the ANN index from disk, reloading when another process rewrites it.
+
+    A rewrite means a new vector space, so local inserts not yet saved are dropped.
+    """
+    global _index, _index_mtime
+    path = settings.ANN_INDEX_PATH
+    try:
+        mtime = os.stat(path).st_mtime
+    except (FileNotFoundError, TypeError):
+        return _index
+    if _index is None or mtime != _index_mtime:
+        _index = IVFIndex.load(path, nprobe=settings.ANN_NPROBE)
+        _index_mtime = mtime
+        logger.info(f"Loaded ANN index over {len(_index)} videos ({_index.n_lists} lists) from {path}")
+    return _index
+
+
+def save_ann_index_if_dirty() -> None:
+    """Persist inserts made through ``get_ann_index().add`` unless the file was rebuilt meanwhile."""
+    global _index_mtime
+    if _index is None or not _index._dirty:
+        return
+    path = settings.ANN_INDEX_PATH
+    try:
+        if os.stat(path).st_mtime != _index_mtime:
+            logger.info(f"ANN index at {path} was rebuilt; skipping save of local inserts")
+            return
+    except FileNotFoundError:
+        pass
+    _index.save(path)
+    _index_mtime = os.stat(path).st_mtime
+
+
+def main() -> None:
+    from app.services.als import ALSModel
+
+    parser = argparse.ArgumentParser(description="ANN index over ALS video factors")
+    parser.add_argument("command", choices=["build", "info"])
+    parser.add_argument("--als-dir", default=settings.ALS_MODEL_DIR)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--output", default=settings.ANN_INDEX_PATH)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "build":
+        model = ALSModel.load(args.als_dir)
+        index = build_ivf(model.video_keys, model.video_factors, args.lists, model_version=model.version)
+        index.save(args.output)
+    else:
+        index = IVFIndex.load(args.output)
+    print(f"videos={len(index)} lists={index.n_lists} dim={index.dim} model={index.model_version} path={args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,19 +5,18 @@ Handles data collection from Socialverse APIs with proper authentication and cac
 
 import asyncio
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 from uuid import UUID
 
 import httpx
-from cachetools import TTLCache
 
+from app.cache import upstream_cache
 from app.config import settings
+from app.http_client import get_with_retries
+from app.pagination import paginate
 
 logger = logging.getLogger(__name__)
 
-# Cache configuration - 5 minutes TTL for API responses
-api_cache = TTLCache(maxsize=1000, ttl=300)
-
 
 class ExternalAPIService:
     """Service for interacting with external Socialverse APIs."""
@@ -48,37 +47,36 @@ class ExternalAPIService:
         params: Optional[Dict[str, Any]] = None,
         use_cache: bool = True
     ) -> Dict[str, Any]:
-        """Make HTTP request to external API with caching and error handling."""
+        """Make HTTP request to external API with caching and error handling.
+        
+        Responses are cached in Redis for every worker; concurrent identical
+        requests share one upstream call.
+        """
         
         if params is None:
             params = {}
             
-        cache_key = self._get_cache_key(endpoint, params)
-        
-        # Check cache first
-        if use_cache and cache_key in api_cache:
-            logger.info(f"Cache hit for {cache_key}")
-            return api_cache[cache_key]
+        if not use_cache:
+            return await self._fetch(endpoint, params)
         
+        cache_key = self._get_cache_key(endpoint, params)
+        return await upstream_cache.get_or_compute(
+            cache_key, lambda: self._fetch(endpoint, params)
+        )
+    
+    async def _fetch(self, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Fetch one API response, bypassing the cache."""
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(
-                    url,
-                    headers=self._get_headers(),
-                    params=params
-                )
-                response.raise_for_status()
-                
-                data = response.json()
-                
-                # Cache successful response
-                if use_cache:
-                    api_cache[cache_key] = data
-                    logger.info(f"Cached response for {cache_key}")
-                
-                return data
+            response = await get_with_retries(
+                url,
+                headers=self._get_headers(),
+                params=params,
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            return response.json()
                 
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error for {url}: {e.response.status_code} - {e.response.text}")
@@ -173,6 +171,58 @@ class ExternalAPIService:
         }
         return await self._make_request("users/get_all", params)
     
+    async def iter_pages(
+        self,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+        page_size: int = settings.UPSTREAM_PAGE_SIZE,
+        use_cache: bool = True
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield the rows of every page of a list endpoint as each page arrives.
+        
+        Page 1 reports the page count when the API provides it; the other pages
+        are fetched concurrently, UPSTREAM_PAGE_CONCURRENCY at a time. Syncs
+        pass use_cache=False so they never read cached pages.
+        """
+        async def fetch_page(page: int) -> Dict[str, Any]:
+            return await self._make_request(
+                endpoint, {**(params or {}), "page": page, "page_size": page_size}, use_cache=use_cache
+            )
+        
+        pages = paginate(
+            fetch_page,
+            page_size=page_size,
+            concurrency=settings.UPSTREAM_PAGE_CONCURRENCY,
+            max_pages=settings.UPSTREAM_MAX_PAGES
+        )
+        async for _, rows in pages:
+            yield rows
+    
+    def iter_viewed_posts(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Every page of viewed posts."""
+        return self.iter_pages("posts/view", {"resonance_algorithm": self.resonance_algorithm})
+    
+    def iter_liked_posts(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Every page of liked posts."""
+        return self.iter_pages("posts/like", {"resonance_algorithm": self.resonance_algorithm})
+    
+    def iter_inspired_posts(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Every page of inspired posts."""
+        return self.iter_pages("posts/inspire", {"resonance_algorithm": self.resonance_algorithm})
+    
+    def iter_rated_posts(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Every page of rated posts."""
+        return self.iter_pages("posts/rating", {"resonance_algorithm": self.resonance_algorithm})
+    
+    def iter_all_posts(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Every page of the posts summary."""
+        return self.iter_pages("posts/summary/get")
+    
+    def iter_all_users(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Every page of users."""
+        return self.iter_pages("users/get_all")
+    
     async def sync_data_to_database(self) -> Dict[str, int]:
         """Sync external API data to local database."""
         # This would integrate with database operations
@@ -0,0 +1,31 @@
+"""
+Database session management for the service layer.
+The engine is created lazily so importing the services never requires a database driver.
+"""
+
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from app.config import settings
+
+_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[async_sessionmaker] = None
+
+
+def get_session_factory() -> async_sessionmaker:
+    """Get the shared async session factory, creating the engine on first use."""
+    global _engine, _session_factory
+    if _session_factory is None:
+        _engine = create_async_engine(settings.DATABASE_URL, echo=settings.DEBUG, future=True)
+        _session_factory = async_sessionmaker(_engine, expire_on_commit=False, class_=AsyncSession)
+    return _session_factory
+
+
+async def dispose_engine() -> None:
+    """Close all pooled database connections."""
+    global _engine, _session_factory
+    if _engine is not None:
+        await _engine.dispose()
+    _engine = None
+    _session_factory = None
@@ -0,0 +1,103 @@
+"""
+User-video interaction loading for offline model builds.
+Streams the user_engagements table into compact NumPy arrays.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, List
+
+import numpy as np
+from sqlalchemy import column, select, table
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.database import UserEngagement
+from app.profiles import engagement_weight
+
+logger = logging.getLogger(__name__)
+
+# Integer-keyed engagements written by the /feed stack (app.crud)
+_post_engagements = table("engagements", column("user_id"), column("post_id"), column("type"), column("rating_score"))
+
+
+@dataclass
+class Interactions:
+    """Aggregated user-item interaction weights in coordinate form."""
+
+    user_keys: np.ndarray  # str, one per user index
+    item_keys: np.ndarray  # str, one per item index
+    user_idx: np.ndarray  # int32, one per (user, item) pair
+    item_idx: np.ndarray  # int32
+    weight: np.ndarray  # float32, summed engagement weight of the pair
+
+    @property
+    def n_users(self) -> int:
+        return len(self.user_keys)
+
+    @property
+    def n_items(self) -> int:
+        return len(self.item_keys)
+
+    @classmethod
+    def from_triples(cls, users: List[str], items: List[str], weights: List[float]) -> "Interactions":
+        """Build from parallel lists, summing duplicate (user, item) pairs."""
+        user_keys, user_idx = np.unique(np.asarray(users, dtype=str), return_inverse=True)
+        item_keys, item_idx = np.unique(np.asarray(items, dtype=str), return_inverse=True)
+        pair = user_idx.astype(np.int64) * len(item_keys) + item_idx
+        unique_pairs, inverse = np.unique(pair, return_inverse=True)
+        summed = np.bincount(inverse, weights=np.asarray(weights, dtype=np.float64))
+        return cls(
+            user_keys=user_keys,
+            item_keys=item_keys,
+            user_idx=(unique_pairs // len(item_keys)).astype(np.int32),
+            item_idx=(unique_pairs % len(item_keys)).astype(np.int32),
+            weight=summed.astype(np.float32),
+        )
+
+
+async def load_interactions(session: AsyncSession, source: str = "videos", batch_size: int = 50_000) -> Interactions:
+    """
+    Stream every engagement row and aggregate it into weighted pairs.
+    
+    ``source`` is "videos" for the user_engagements table or "posts" for the
+    engagements table.
+    """
+    if source == "videos":
+        stmt = select(
+            UserEngagement.user_id,
+            UserEngagement.video_id,
+            UserEngagement.engagement_type,
+            UserEngagement.rating_score,
+        )
+    elif source == "posts":
+        stmt = select(
+            _post_engagements.c.user_id,
+            _post_engagements.c.post_id,
+            _post_engagements.c.type,
+            _post_engagements.c.rating_score,
+        )
+    else:
+        raise ValueError(f"Unknown interaction source: {source}")
+    stmt = stmt.execution_options(yield_per=batch_size)
+
+    users: List[str] = []
+    items: List[str] = []
+    weights: List[float] = []
+    result = await session.stream(stmt)
+    async for partition in result.partitions(batch_size):
+        for user_id, item_id, engagement_type, rating_score in partition:
+            users.append(str(user_id))
+            items.append(str(item_id))
+            weights.append(engagement_weight(engagement_type, rating_score))
+
+    logger.info(f"Loaded {len(users)} engagements for model build")
+    return Interactions.from_triples(users, items, weights)
+
+
+def seed_weights(engagements: List[Dict]) -> Dict[str, float]:
+    """Sum engagement weights per video for one user's history."""
+    seeds: Dict[str, float] = {}
+    for e in engagements:
+        video_id = str(e["video_id"])
+        seeds[video_id] = seeds.get(video_id, 0.0) + engagement_weight(e["engagement_type"], e.get("rating_score"))
+    return seeds
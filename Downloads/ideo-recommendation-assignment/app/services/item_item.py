@@ -0,0 +1,264 @@
+"""
+Item-item collaborative filtering over user engagements.
+Neighbour lists are built offline from a sparse co-engagement matrix and served with a few array lookups.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.services.interactions import Interactions
+
+logger = logging.getLogger(__name__)
+
+
+class ItemNeighbours:
+    """Top-N cosine neighbours per item, padded with -1."""
+
+    def __init__(self, item_keys: np.ndarray, neighbours: np.ndarray, scores: np.ndarray):
+        self.item_keys = np.asarray(item_keys, dtype=str)
+        self.neighbours = np.asarray(neighbours, dtype=np.int32)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self._index = {key: i for i, key in enumerate(self.item_keys.tolist())}
+
+    def __len__(self) -> int:
+        return len(self.item_keys)
+
+    def neighbours_of(self, item_key: str) -> List[Tuple[str, float]]:
+        """Neighbour list of one item, best first."""
+        row = self._index.get(item_key)
+        if row is None:
+            return []
+        return [
+            (str(self.item_keys[j]), float(s))
+            for j, s in zip(self.neighbours[row], self.scores[row])
+            if j >= 0
+        ]
+
+    def recommend(
+        self,
+        seeds: Dict[str, float],
+        limit: int,
+        exclude: Optional[Iterable[str]] = None,
+    ) -> List[Tuple[str, float]]:
+        """
+        Merge the neighbour lists of a user's engaged items.
+
+        Each candidate scores the seed-weighted average of its similarity
+        to the seeds, so scores stay within [0, 1].
+        """
+        rows = [self._index[key] for key in seeds if key in self._index]
+        if not rows or limit <= 0:
+            return []
+        weights = np.array([seeds[self.item_keys[r]] for r in rows], dtype=np.float64)
+        neighbours = self.neighbours[rows]
+        contrib = self.scores[rows].astype(np.float64) * weights[:, None]
+        mask = neighbours >= 0
+        candidates, inverse = np.unique(neighbours[mask], return_inverse=True)
+        totals = np.bincount(inverse, weights=contrib[mask]) / weights.sum()
+
+        excluded = set(rows)
+        excluded.update(self._index[key] for key in (exclude or ()) if key in self._index)
+        keep = ~np.isin(candidates, list(excluded))
+        candidates, totals = candidates[keep], totals[keep]
+        if len(candidates) > limit:
+            top = np.argpartition(-totals, limit - 1)[:limit]
+            candidates, totals = candidates[top], totals[top]
+        order = np.argsort(-totals, kind="stable")
+        return [(str(self.item_keys[candidates[i]]), float(totals[i])) for i in order]
+
+    def save(self, path: str) -> None:
+        """Atomically write the neighbour lists to ``path``."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, item_keys=self.item_keys, neighbours=self.neighbours, scores=self.scores)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "ItemNeighbours":
+        with np.load(path, allow_pickle=False) as npz:
+            return cls(npz["item_keys"], npz["neighbours"], npz["scores"])
+
+
+def _group(keys: np.ndarray, values: np.ndarray, weights: np.ndarray, n: int):
+    """Group ``values`` by ``keys`` into CSR arrays, heaviest weight first."""
+    order = np.lexsort((-weights, keys))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n), out=indptr[1:])
+    return indptr, values[order], weights[order]
+
+
+def _gather(indptr: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Flat positions of all entries in ``rows`` and the row length of each."""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets, lengths
+
+
+# Arrays shared with worker processes; set once per process by _init_worker.
+_shared: Dict[str, np.ndarray] = {}
+
+
+def _init_worker(shared: Dict[str, np.ndarray]) -> None:
+    global _shared
+    _shared = shared
+
+
+def _neighbours_for_range(bounds: Tuple[int, int]) -> Tuple[int, np.ndarray, np.ndarray]:
+    start, end = bounds
+    item_ptr, item_users, item_w = _shared["item_ptr"], _shared["item_users"], _shared["item_w"]
+    user_ptr, user_items, user_w = _shared["user_ptr"], _shared["user_items"], _shared["user_w"]
+    norms, top_n, min_support = _shared["norms"], int(_shared["top_n"]), int(_shared["min_support"])
+
+    neighbours = np.full((end - start, top_n), -1, dtype=np.int32)
+    scores = np.zeros((end - start, top_n), dtype=np.float32)
+    for i in range(start, end):
+        users = item_users[item_ptr[i] : item_ptr[i + 1]]
+        if len(users) == 0 or norms[i] == 0:
+            continue
+        positions, lengths = _gather(user_ptr, users)
+        co_items = user_items[positions]
+        contrib = np.repeat(item_w[item_ptr[i] : item_ptr[i + 1]], lengths) * user_w[positions]
+        candidates, inverse = np.unique(co_items, return_inverse=True)
+        dots = np.bincount(inverse, weights=contrib)
+        keep = candidates != i
+        if min_support > 1:
+            keep &= np.bincount(inverse) >= min_support
+        candidates, dots = candidates[keep], dots[keep]
+        if len(candidates) == 0:
+            continue
+        sims = dots / (norms[i] * norms[candidates])
+        if len(candidates) > top_n:
+            top = np.argpartition(-sims, top_n - 1)[:top_n]
+            candidates, sims = candidates[top], sims[top]
+        order = np.argsort(-sims, kind="stable")
+        neighbours[i - start, : len(order)] = candidates[order]
+        scores[i - start, : len(order)] = sims[order]
+    return start, neighbours, scores
+
+
+def build_item_neighbours(
+    interactions: Interactions,
+    top_n: int = 50,
+    max_user_items: int = 500,
+    min_support: int = 1,
+    workers: Optional[int] = None,
+) -> ItemNeighbours:
+    """
+    Build per-item top-N cosine neighbour lists from weighted engagements.
+
+    Work is sharded by item range across ``workers`` processes. Users with more
+    than ``max_user_items`` engagements keep only their heaviest items, which
+    bounds the quadratic blow-up of co-engagement pairs.
+    """
+    n_users, n_items = interactions.n_users, interactions.n_items
+    user_idx = interactions.user_idx.astype(np.int64)
+    item_idx = interactions.item_idx.astype(np.int64)
+    weight = interactions.weight.astype(np.float64)
+
+    user_ptr, user_items, user_w = _group(user_idx, item_idx, weight, n_users)
+    rank = np.arange(len(user_items)) - np.repeat(user_ptr[:-1], np.diff(user_ptr))
+    capped = rank < max_user_items
+    capped_users = np.repeat(np.arange(n_users), np.diff(user_ptr))[capped]
+    user_ptr, user_items, user_w = _group(capped_users, user_items[capped], user_w[capped], n_users)
+    entry_users = np.repeat(np.arange(n_users), np.diff(user_ptr))
+    item_ptr, item_users, item_w = _group(user_items, entry_users, user_w, n_items)
+    norms = np.sqrt(np.bincount(user_items, weights=user_w * user_w, minlength=n_items))
+
+    shared = {
+        "item_ptr": item_ptr, "item_users": item_users, "item_w": item_w,
+        "user_ptr": user_ptr, "user_items": user_items, "user_w": user_w,
+        "norms": norms, "top_n": np.int64(top_n), "min_support": np.int64(min_support),
+    }
+    workers = workers or os.cpu_count() or 1
+    shard = max(1, min(2048, -(-n_items // (workers * 4))))
+    ranges = [(s, min(s + shard, n_items)) for s in range(0, n_items, shard)]
+
+    neighbours = np.full((n_items, top_n), -1, dtype=np.int32)
+    scores = np.zeros((n_items, top_n), dtype=np.float32)
+    started = time.perf_counter()
+    if workers == 1 or len(ranges) <= 1:
+        _init_worker(shared)
+        results = map(_neighbours_for_range, ranges)
+        for start, block_neighbours, block_scores in results:
+            neighbours[start : start + len(block_neighbours)] = block_neighbours
+            scores[start : start + len(block_scores)] = block_scores
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared,)) as pool:
+            for start, block_neighbours, block_scores in pool.map(_neighbours_for_range, ranges):
+                neighbours[start : start + len(block_neighbours)] = block_neighbours
+                scores[start : start + len(block_scores)] = block_scores
+    logger.info(
+        f"Built item neighbours for {n_items} items from {len(interactions.weight)} pairs "
+        f"in {time.perf_counter() - started:.1f}s using {workers} workers"
+    )
+    return ItemNeighbours(interactions.item_keys, neighbours, scores)
+
+
+_model: Optional[ItemNeighbours] = None
+_model_mtime: float = 0.0
+
+
+def get_item_neighbours() -> Optional[ItemNeighbours]:
+    """Load the neighbour lists from disk, reloading when the file changes."""
+    global _model, _model_mtime
+    path = settings.ITEM_NEIGHBOURS_PATH
+    try:
+        mtime = os.stat(path).st_mtime
+    except (FileNotFoundError, TypeError):
+        return _model
+    if _model is None or mtime != _model_mtime:
+        _model = ItemNeighbours.load(path)
+        _model_mtime = mtime
+        logger.info(f"Loaded item neighbours for {len(_model)} videos from {path}")
+    return _model
+
+
+async def _build_from_database(
+    source: str, top_n: int, max_user_items: int, min_support: int, workers: Optional[int]
+) -> ItemNeighbours:
+    from app.services.db import get_session_factory
+    from app.services.interactions import load_interactions
+
+    async with get_session_factory()() as session:
+        interactions = await load_interactions(session, source)
+    return build_item_neighbours(interactions, top_n, max_user_items, min_support, workers)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build item-item neighbour lists from engagements")
+    parser.add_argument("--source", choices=["videos", "posts"], default="videos")
+    parser.add_argument("--top-n", type=int, default=settings.ITEM_NEIGHBOURS_TOP_N)
+    parser.add_argument("--max-user-items", type=int, default=500)
+    parser.add_argument("--min-support", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default=settings.ITEM_NEIGHBOURS_PATH)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    model = asyncio.run(
+        _build_from_database(args.source, args.top_n, args.max_user_items, args.min_support, args.workers)
+    )
+    model.save(args.output)
+    print(f"Wrote neighbours for {len(model)} videos to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
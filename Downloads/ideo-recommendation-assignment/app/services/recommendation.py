@@ -5,21 +5,49 @@ Handles cold start problems with mood-based recommendations inspired by Empowerv
 
 import logging
 import random
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable, Tuple
 from uuid import UUID
 
+from sqlalchemy import func, select
+
+from app.cache import feed_cache
+from app.config import settings
 from app.models.database import User, Video, UserEngagement, EngagementType
 from app.models.recommendation import VideoRecommendation, RecommendationResponse
+from app.pipeline import Candidates, Pipeline, Stage, make_stage, prior_ranker
+from app.services.als import ALSModel, get_als_model
+from app.services.ann import get_ann_index
 from app.services.data_collection import external_api_service
+from app.services.db import get_session_factory
+from app.services.interactions import seed_weights
+from app.services.item_item import get_item_neighbours
+from app.trending import TrendingFeed, get_trending_store
 
 logger = logging.getLogger(__name__)
 
+# Why a video was recommended, by the candidate source that ranked it highest
+SOURCE_REASONS = {
+    "ann": "Matches the taste profile learned from your engagement",
+    "item_item": "Viewers who engaged with your videos also watched this",
+    "category": "More from categories you engage with",
+    "popular": "Popular with the community",
+    "recent": "Fresh from creators you may like",
+}
+
 
 class RecommendationService:
     """Service for generating video recommendations using collaborative filtering."""
     
     def __init__(self):
         self.cold_start_category = "motivational"  # Inspired by Empowerverse App
+        self.history_limit = 500  # most recent engagements used as seeds
+        self.feed_depth = 20  # largest page the API serves; smaller ones are sliced from it
+        self.trending = TrendingFeed(
+            get_trending_store("videos"),
+            self._trending_videos,
+            size=settings.TRENDING_LIST_SIZE,
+            refresh_seconds=settings.TRENDING_REFRESH_SECONDS,
+        )
         
     async def get_personalized_recommendations(
         self, 
@@ -37,29 +65,74 @@ class RecommendationService:
             RecommendationResponse with personalized video recommendations
         """
         try:
-            # Mock user data for demonstration
-            # In production, this would query the database
-            user_engagements = await self._get_user_engagements(username)
-            
-            if not user_engagements:
-                # Cold start - no user data available
-                logger.info(f"Cold start for user {username}")
-                return await self._get_cold_start_recommendations(username, limit)
-            
-            # Collaborative filtering algorithm
-            recommendations = await self._collaborative_filtering(username, user_engagements, limit)
-            
-            return RecommendationResponse(
-                recommendations=recommendations,
-                total_count=len(recommendations),
-                user_id=UUID("12345678-1234-1234-1234-123456789012"),  # Mock UUID
-                algorithm_used="collaborative_filtering"
-            )
-            
+            feed = await self.get_cached_feed(username)
         except Exception as e:
             logger.error(f"Error generating personalized recommendations: {str(e)}")
-            # Fallback to cold start
+            feed = None
+        
+        if feed is None:
+            # Cold start - no user data available
             return await self._get_cold_start_recommendations(username, limit)
+        
+        response = RecommendationResponse(**feed)
+        response.recommendations = response.recommendations[:limit]
+        response.total_count = len(response.recommendations)
+        return response
+    
+    def feed_version(self) -> str:
+        """Version of the model cached feeds were ranked with."""
+        als = get_als_model()
+        return als.version if als is not None else "0"
+    
+    async def get_cached_feed(self, username: str) -> Optional[Dict[str, Any]]:
+        """
+        The user's personalized feed, ``feed_depth`` items deep, through the feed cache.
+        
+        Entries are keyed by model version, so a rebuilt model starts new ones, and
+        grouped by username, so new engagements invalidate them. None for cold start;
+        that is cached too, for FEED_CACHE_COLD_START_TTL_SECONDS, so unknown users
+        don't query their engagements on every request.
+        """
+        # the listener stops while Redis is down; requests restart it
+        feed_cache.start_listener()
+        return await feed_cache.get_or_compute(
+            f"api:{username}:{self.feed_version()}",
+            lambda: self._personalized_feed(username),
+            group=username,
+            none_ttl=settings.FEED_CACHE_COLD_START_TTL_SECONDS,
+        )
+    
+    async def _personalized_feed(self, username: str) -> Optional[Dict[str, Any]]:
+        """Rank the user's feed; None when there is nothing personal to rank."""
+        user_engagements = await self._get_user_engagements(username)
+        if not user_engagements:
+            logger.info(f"Cold start for user {username}")
+            return None
+        
+        # Collaborative filtering algorithm
+        recommendations = await self._collaborative_filtering(username, user_engagements, self.feed_depth)
+        if not recommendations:
+            logger.info(f"No collaborative candidates for user {username}")
+            return None
+        
+        return RecommendationResponse(
+            recommendations=recommendations,
+            total_count=len(recommendations),
+            user_id=UUID("12345678-1234-1234-1234-123456789012"),  # Mock UUID
+            algorithm_used="collaborative_filtering"
+        ).model_dump(mode="json")
+    
+    async def recent_usernames(self, limit: int) -> List[str]:
+        """Usernames of the ``limit`` users who engaged most recently."""
+        stmt = (
+            select(User.username)
+            .join(UserEngagement, UserEngagement.user_id == User.id)
+            .group_by(User.id, User.username)
+            .order_by(func.max(UserEngagement.timestamp).desc())
+            .limit(limit)
+        )
+        async with get_session_factory()() as session:
+            return list((await session.execute(stmt)).scalars())
     
     async def get_category_recommendations(
         self, 
@@ -79,8 +152,13 @@ class RecommendationService:
             RecommendationResponse with category-filtered recommendations
         """
         try:
-            # Mock category-based recommendations
-            recommendations = await self._get_category_videos(project_code, limit)
+            user_engagements = await self._get_user_engagements(username)
+            user_key = str(user_engagements[0]["user_id"]) if user_engagements else ""
+            recommendations = await self._run_pipeline(
+                self._candidate_stages(user_key, {}, category=project_code, depth=limit), user_key, limit
+            )
+            if not recommendations:
+                recommendations = await self._get_category_videos(project_code, limit)
             
             return RecommendationResponse(
                 recommendations=recommendations,
@@ -95,24 +173,42 @@ class RecommendationService:
             return await self._get_cold_start_recommendations(username, limit)
     
     async def _get_user_engagements(self, username: str) -> List[Dict[str, Any]]:
-        """Get user engagement data (mock implementation)."""
-        # Mock user engagement data
-        # In production, this would query the database
+        """Get the user's most recent engagements from the database."""
+        stmt = (
+            select(
+                UserEngagement.user_id,
+                UserEngagement.video_id,
+                UserEngagement.engagement_type,
+                UserEngagement.rating_score,
+                UserEngagement.timestamp,
+            )
+            .join(User, User.id == UserEngagement.user_id)
+            .where(User.username == username)
+            .order_by(UserEngagement.timestamp.desc())
+            .limit(self.history_limit)
+        )
+        async with get_session_factory()() as session:
+            rows = (await session.execute(stmt)).all()
         return [
             {
-                "video_id": "11111111-1111-1111-1111-111111111111",
-                "engagement_type": "like",
-                "rating_score": 5,
-                "timestamp": "2024-01-01T10:00:00Z"
-            },
-            {
-                "video_id": "22222222-2222-2222-2222-222222222222",
-                "engagement_type": "view",
-                "rating_score": None,
-                "timestamp": "2024-01-02T10:00:00Z"
+                "user_id": str(user_id),
+                "video_id": str(video_id),
+                "engagement_type": engagement_type,
+                "rating_score": rating_score,
+                "timestamp": timestamp,
             }
+            for user_id, video_id, engagement_type, rating_score, timestamp in rows
         ]
     
+    async def _get_videos(self, video_ids: List[str]) -> Dict[str, Video]:
+        """Load videos by id, keyed by the string form of their UUID."""
+        if not video_ids:
+            return {}
+        stmt = select(Video).where(Video.video_id.in_([UUID(v) for v in video_ids]))
+        async with get_session_factory()() as session:
+            videos = (await session.execute(stmt)).scalars().all()
+        return {str(v.video_id): v for v in videos}
+    
     async def _collaborative_filtering(
         self, 
         username: str, 
@@ -120,52 +216,154 @@ class RecommendationService:
         limit: int
     ) -> List[VideoRecommendation]:
         """
-        Implement collaborative filtering algorithm.
+        Two-stage retrieval and ranking over the candidate pipeline.
         
-        This is a simplified version. In production, this would:
-        1. Find users with similar preferences
-        2. Calculate similarity scores
-        3. Recommend videos liked by similar users
-        4. Apply machine learning models for better accuracy
+        Recent, popular, same-category, item-item and ANN sources each propose
+        candidates within their own time budget. The merged set is ranked in one
+        pass: ALS scores for users the model covers, retrieval scores otherwise.
+        Videos already seen are excluded.
         """
-        # Mock collaborative filtering results
-        mock_videos = [
-            {
-                "video_id": UUID("33333333-3333-3333-3333-333333333333"),
-                "title": "Motivational Success Story",
-                "category": "motivational",
-                "description": "An inspiring story about overcoming challenges",
-                "posted_at": "2024-01-15T10:00:00Z",
-                "recommendation_score": 0.95,
-                "recommendation_reason": "Similar users who liked your videos also enjoyed this"
-            },
-            {
-                "video_id": UUID("44444444-4444-4444-4444-444444444444"),
-                "title": "Productivity Tips for Success",
-                "category": "productivity",
-                "description": "Practical tips to boost your productivity",
-                "posted_at": "2024-01-14T10:00:00Z",
-                "recommendation_score": 0.87,
-                "recommendation_reason": "Based on your viewing history and similar user preferences"
-            }
+        seeds = seed_weights(user_engagements)
+        user_key = str(user_engagements[0]["user_id"]) if user_engagements else ""
+        return await self._run_pipeline(
+            self._candidate_stages(user_key, seeds, depth=limit), user_key, limit, exclude=seeds
+        )
+    
+    def _candidate_stages(
+        self,
+        user_key: str,
+        seeds: Dict[str, float],
+        category: Optional[str] = None,
+        depth: int = 0,
+    ) -> List[Stage[str]]:
+        """Candidate sources for one request; each query opens its own session, so all run concurrently."""
+        extra = min(len(seeds), self.history_limit)
+        limit = max(settings.PIPELINE_SOURCE_LIMIT, depth)
+        
+        async def video_ids(stmt) -> List[str]:
+            async with get_session_factory()() as session:
+                return [str(v) for v in (await session.execute(stmt)).scalars()]
+        
+        async def recent(n: int) -> List[str]:
+            stmt = select(Video.video_id).order_by(Video.posted_at.desc()).limit(n + extra)
+            if category:
+                stmt = stmt.where(Video.category == category)
+            return await video_ids(stmt)
+        
+        async def popular(n: int) -> List[str]:
+            trending = await get_trending_store("videos").top(n + extra, category)
+            if trending:
+                return [key for key, _ in trending]
+            stmt = (
+                select(UserEngagement.video_id)
+                .group_by(UserEngagement.video_id)
+                .order_by(func.count(UserEngagement.id).desc())
+                .limit(n + extra)
+            )
+            if category:
+                stmt = stmt.join(Video, Video.video_id == UserEngagement.video_id).where(Video.category == category)
+            return await video_ids(stmt)
+        
+        async def same_category(n: int) -> List[str]:
+            seed_ids = [UUID(v) for v in list(seeds)[:50]]
+            categories = select(Video.category).where(Video.video_id.in_(seed_ids)).distinct()
+            stmt = (
+                select(Video.video_id)
+                .where(Video.category.in_(categories.scalar_subquery()))
+                .order_by(Video.posted_at.desc())
+                .limit(n + extra)
+            )
+            return await video_ids(stmt)
+        
+        async def item_item(n: int) -> List[str]:
+            neighbours = get_item_neighbours()
+            if neighbours is None:
+                return []
+            return [key for key, _ in neighbours.recommend(seeds, n, exclude=seeds)]
+        
+        async def ann(n: int) -> List[str]:
+            als = get_als_model()
+            if als is None or not als.has_user(user_key):
+                return []
+            return [key for key, _ in self._als_candidates(als, user_key, n, seeds)]
+        
+        # queries past their budget finish in the background rather than being
+        # cancelled mid-query; recent, which every feed has, has no budget
+        stages = [
+            make_stage("recent", recent, limit=limit, required=True),
+            make_stage("popular", popular, limit=limit, cancel=False),
         ]
+        if seeds:
+            stages.append(make_stage("category", same_category, limit=limit, cancel=False))
+            stages.append(make_stage("item_item", item_item, limit=limit))
+        if user_key and category is None:
+            stages.append(make_stage("ann", ann, limit=max(settings.ANN_CANDIDATES, depth)))
+        return stages
+    
+    async def _run_pipeline(
+        self,
+        stages: List[Stage[str]],
+        user_key: str,
+        limit: int,
+        exclude: Iterable[str] = (),
+    ) -> List[VideoRecommendation]:
+        """Rank the merged candidates and load the top videos."""
+        als = get_als_model()
+        if als is not None and als.has_user(user_key):
+            async def ranker(candidates: Candidates[str]):
+                return als.score_videos(user_key, candidates.keys)
+        else:
+            ranker = prior_ranker
+        
+        ranked, candidates = await Pipeline(stages, ranker).run(limit, exclude=exclude)
+        videos = await self._get_videos([video_id for _, video_id in ranked])
         
         recommendations = []
-        for video_data in mock_videos[:limit]:
-            recommendations.append(VideoRecommendation(**video_data))
+        for score, video_id in ranked:
+            video = videos.get(video_id)
+            if video is None:
+                continue
+            recommendations.append(VideoRecommendation(
+                video_id=video.video_id,
+                title=video.title,
+                category=video.category,
+                description=video.description,
+                posted_at=video.posted_at,
+                recommendation_score=round(min(max(score, 0.0), 1.0), 4),
+                recommendation_reason=SOURCE_REASONS[candidates.sources[video_id][0]]
+            ))
         
         return recommendations
     
+    def _als_candidates(
+        self, als: ALSModel, user_key: str, limit: int, seen: Iterable[str]
+    ) -> List[Tuple[str, float]]:
+        """Top videos for an ALS user; a few hundred ANN candidates, or an exact scan."""
+        ann = get_ann_index()
+        if ann is None or ann.model_version != als.version:
+            return als.recommend(user_key, limit, exclude=seen)
+        return ann.search(als.user_vector(user_key), limit, exclude=seen)
+    
     async def _get_cold_start_recommendations(
         self, 
         username: str, 
         limit: int
     ) -> RecommendationResponse:
         """
-        Generate cold start recommendations using mood-based approach.
-        Inspired by Empowerverse App's motivational content.
+        Generate cold start recommendations from the ranked trending list.
+        
+        Served from memory without a database query; falls back to mood-based
+        motivational picks, inspired by Empowerverse App, until anything trends.
         """
-        # Mock cold start recommendations
+        recommendations = await self.trending.page(limit)
+        if recommendations:
+            return RecommendationResponse(
+                recommendations=recommendations,
+                total_count=len(recommendations),
+                user_id=None,  # Cold start - no user data
+                algorithm_used="cold_start_trending"
+            )
+        
         motivational_videos = [
             {
                 "video_id": UUID("55555555-5555-5555-5555-555555555555"),
@@ -207,6 +405,24 @@ class RecommendationService:
             algorithm_used="cold_start_mood_based"
         )
     
+    async def _trending_videos(self, ranked: List[Tuple[str, float]]) -> List[VideoRecommendation]:
+        """Build the trending list; scores are relative to the hottest video."""
+        videos = await self._get_videos([video_id for video_id, _ in ranked])
+        top_score = ranked[0][1] if ranked else 1.0
+        return [
+            VideoRecommendation(
+                video_id=video.video_id,
+                title=video.title,
+                category=video.category,
+                description=video.description,
+                posted_at=video.posted_at,
+                recommendation_score=round(score / top_score, 4),
+                recommendation_reason="Trending with the community right now"
+            )
+            for video, score in ((videos.get(video_id), score) for video_id, score in ranked)
+            if video is not None
+        ]
+    
     async def _get_category_videos(
         self, 
         project_code: str, 
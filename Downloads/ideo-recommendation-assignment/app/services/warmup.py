@@ -0,0 +1,68 @@
+"""
+Feed cache warm-up for Video Recommendation Engine.
+Precomputes the feeds of the most recently active users after startup and model rebuilds.
+
+    python -m app.services.warmup --users 1000 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+from typing import List
+
+from app.cache import close_redis, init_redis
+from app.config import settings
+from app.services.recommendation import recommendation_service
+from app.warmup import Warmup
+
+logger = logging.getLogger(__name__)
+
+
+async def warmup_usernames(limit: int = settings.WARMUP_USERS) -> List[str]:
+    """Users to warm; also builds the shared trending list cold-start feeds come from."""
+    await recommendation_service.trending.page(1)
+    return await recommendation_service.recent_usernames(limit)
+
+
+async def warm_user(username: str) -> None:
+    await recommendation_service.get_cached_feed(username)
+
+
+def make_warmup(users: int = settings.WARMUP_USERS, concurrency: int = settings.WARMUP_CONCURRENCY) -> Warmup:
+    return Warmup(
+        lambda: warmup_usernames(users),
+        warm_user,
+        concurrency=concurrency,
+        threshold=settings.WARMUP_READY_COVERAGE,
+        version=recommendation_service.feed_version,
+    )
+
+
+# Global warm-up, started from the app lifespan
+feed_warmup = make_warmup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Precompute cached feeds for recently active users")
+    parser.add_argument("--users", type=int, default=settings.WARMUP_USERS)
+    parser.add_argument("--concurrency", type=int, default=settings.WARMUP_CONCURRENCY)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    async def run() -> bool:
+        # feeds land in Redis, where every worker reads them
+        init_redis()
+        try:
+            warmup = make_warmup(args.users, args.concurrency)
+            await warmup.run()
+            print(json.dumps(warmup.status(), indent=2))
+            return warmup.ready
+        finally:
+            await close_redis()
+
+    raise SystemExit(0 if asyncio.run(run()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,509 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import math
+import os
+import tempfile
+import time
+from collections import OrderedDict, defaultdict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Generic, TypeVar, Union
+
+try:
+    import redis.asyncio as redis
+except Exception:  # pragma: no cover - optional dependency
+    redis = None  # type: ignore
+
+from .cache import CircuitBreaker, _text, get_redis, redis_breaker
+from .config import get_settings
+
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Forward decay: an event of weight w at time t adds w * 2 ** ((t - epoch) / half_life).
+# Every counter decays at the same rate, so old entries never need touching
+# and ranking by the stored value is ranking by the decayed value. Epochs
+# advance every GENERATION_HALF_LIVES half-lives to keep values finite.
+GENERATION_HALF_LIVES = 256
+# Counters below this many (decayed) engagements are dropped when an epoch advances.
+MIN_COUNT = 1e-3
+# Engagements a worker recorded itself, replayed over each snapshot it reloads.
+LOCAL_REPLAY_LIMIT = 10_000
+
+
+def _category_key(category: str | None) -> str | None:
+    return category.lower() if category else None
+
+
+def _timestamp(ts: float | datetime | None) -> float:
+    if ts is None:
+        return time.time()
+    if isinstance(ts, datetime):
+        # naive datetimes come from utcnow() columns
+        return (ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)).timestamp()
+    return float(ts)
+
+
+class DecayingCounters:
+    """In-process time-decayed engagement counters per item and per category."""
+
+    def __init__(self, half_life: float, epoch: float = 0.0) -> None:
+        self.half_life = half_life
+        self.epoch = epoch
+        self.items: dict[str, float] = {}
+        self.categories: dict[str, float] = {}
+        self.by_category: dict[str, dict[str, float]] = defaultdict(dict)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _boost(self, ts: float) -> float:
+        generation = self.half_life * GENERATION_HALF_LIVES
+        if ts - self.epoch >= generation:
+            self.advance(self.epoch + generation * math.floor((ts - self.epoch) / generation))
+        return 2.0 ** ((ts - self.epoch) / self.half_life)
+
+    def record(self, key: str, category: str | None, weight: float, ts: float | datetime | None = None) -> None:
+        """Add one engagement; a constant number of dict updates."""
+        boost = weight * self._boost(_timestamp(ts))
+        self.items[key] = self.items.get(key, 0.0) + boost
+        category = _category_key(category)
+        if category:
+            self.categories[category] = self.categories.get(category, 0.0) + boost
+            ranked = self.by_category[category]
+            ranked[key] = ranked.get(key, 0.0) + boost
+
+    def advance(self, epoch: float) -> None:
+        """Move the epoch forward, rescaling every counter and pruning faded ones."""
+        factor = 2.0 ** (-(epoch - self.epoch) / self.half_life)
+        floor = MIN_COUNT
+
+        def rescale(counters: dict[str, float]) -> dict[str, float]:
+            return {k: v * factor for k, v in counters.items() if v * factor >= floor}
+
+        self.items = rescale(self.items)
+        self.categories = rescale(self.categories)
+        self.by_category = defaultdict(dict, {c: rescale(r) for c, r in self.by_category.items()})
+        self.by_category = defaultdict(dict, {c: r for c, r in self.by_category.items() if r})
+        self.epoch = epoch
+
+    def decayed(self, value: float, now: float | None = None) -> float:
+        return value * 2.0 ** (-(_timestamp(now) - self.epoch) / self.half_life)
+
+    def top(self, n: int, category: str | None = None) -> list[tuple[str, float]]:
+        counters = self.by_category.get(_category_key(category), {}) if category else self.items
+        return heapq.nlargest(n, counters.items(), key=lambda kv: kv[1])
+
+    def top_categories(self, n: int) -> list[tuple[str, float]]:
+        return heapq.nlargest(n, self.categories.items(), key=lambda kv: kv[1])
+
+    # Snapshots
+
+    def to_dict(self) -> dict:
+        return {
+            "half_life": self.half_life,
+            "epoch": self.epoch,
+            "items": self.items,
+            "categories": self.categories,
+            "by_category": self.by_category,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DecayingCounters":
+        counters = cls(float(data["half_life"]), float(data["epoch"]))
+        counters.items = {str(k): float(v) for k, v in data["items"].items()}
+        counters.categories = {str(k): float(v) for k, v in data["categories"].items()}
+        counters.by_category = defaultdict(
+            dict, {c: {str(k): float(v) for k, v in r.items()} for c, r in data["by_category"].items()}
+        )
+        return counters
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.to_dict(), f, separators=(",", ":"))
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "DecayingCounters":
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+class MemoryTrendingStore:
+    """Trending counters held in this process and snapshotted to a JSON file.
+
+    Only the process that writes engagements in bulk (the sync job, or a
+    replay) saves the snapshot; every other process reloads it when the
+    file changes. Engagements recorded here since the last save are
+    replayed over the reloaded counters, the latest LOCAL_REPLAY_LIMIT of
+    them.
+    """
+
+    def __init__(self, namespace: str, half_life: float, snapshot_path: str | None = None) -> None:
+        self.namespace = namespace
+        self.snapshot_path = snapshot_path
+        self.half_life = half_life
+        self.counters = DecayingCounters(half_life)
+        self._dirty = False
+        self._snapshot_mtime: float | None = None
+        self._local: deque[tuple[str, str | None, float, float]] = deque(maxlen=LOCAL_REPLAY_LIMIT)
+        self.reload_if_changed()
+
+    def reload_if_changed(self) -> None:
+        if not self.snapshot_path:
+            return
+        try:
+            mtime = os.stat(self.snapshot_path).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._snapshot_mtime:
+            return
+        self._snapshot_mtime = mtime
+        try:
+            counters = DecayingCounters.load(self.snapshot_path)
+        except Exception as exc:  # corrupt snapshot: keep what we have
+            logger.warning("Could not load trending snapshot %s: %s", self.snapshot_path, exc)
+            return
+        counters.half_life = self.half_life
+        for event in self._local:
+            counters.record(*event)
+        self.counters = counters
+
+    async def record(self, key: str, category: str | None, weight: float, ts: float | datetime | None = None) -> None:
+        ts = _timestamp(ts)
+        self.counters.record(key, category, weight, ts)
+        self._local.append((key, category, weight, ts))
+        self._dirty = True
+
+    async def top(self, n: int, category: str | None = None) -> list[tuple[str, float]]:
+        self.reload_if_changed()
+        return self.counters.top(n, category)
+
+    async def top_categories(self, n: int) -> list[tuple[str, float]]:
+        self.reload_if_changed()
+        return self.counters.top_categories(n)
+
+    async def clear(self) -> None:
+        self.counters = DecayingCounters(self.half_life)
+        self._local.clear()
+        self._dirty = True
+
+    def save_snapshot(self) -> None:
+        """Write the counters for other processes; only the writer process calls this."""
+        if self._dirty and self.snapshot_path:
+            self.counters.save(self.snapshot_path)
+            self._snapshot_mtime = os.stat(self.snapshot_path).st_mtime
+            self._local.clear()
+            self._dirty = False
+
+
+class RedisTrendingStore:
+    """Trending counters in Redis sorted sets, shared by every worker.
+
+    Keys carry the epoch generation. The first writer or reader of a new
+    generation copies the previous one in, rescaled by ZUNIONSTORE weights,
+    under a short lock, so workers never need to agree on a mutable epoch.
+
+    Calls go through the app's Redis pool and circuit breaker. While Redis
+    fails or the breaker is open, engagements are counted in and served
+    from a per-worker ``fallback`` store instead.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        half_life: float,
+        *,
+        client_factory: Callable[[], Awaitable[Any]] = get_redis,
+        breaker: CircuitBreaker | None = redis_breaker,
+        fallback: "MemoryTrendingStore | None" = None,
+    ) -> None:
+        self.prefix = f"trending:{namespace}"
+        self.half_life = half_life
+        self.breaker = breaker
+        self.fallback = fallback or MemoryTrendingStore(namespace, half_life)
+        self._client_factory = client_factory
+        self._migrated: int | None = None
+
+    async def _client(self) -> Any:
+        if self.breaker is not None and not self.breaker.allow():
+            return None
+        return await self._client_factory()
+
+    def _redis_ok(self) -> None:
+        if self.breaker is not None:
+            self.breaker.record_success()
+
+    def _redis_failed(self, action: str, exc: Exception) -> None:
+        if self.breaker is not None:
+            self.breaker.record_failure()
+        logger.warning("Trending %s in Redis failed, using this worker's counters: %s", action, exc)
+
+    def _generation(self, ts: float) -> int:
+        return int(ts // (self.half_life * GENERATION_HALF_LIVES))
+
+    def _key(self, generation: int, name: str) -> str:
+        return f"{self.prefix}:{generation}:{name}"
+
+    async def _ensure_generation(self, client: Any, generation: int) -> None:
+        if self._migrated == generation:
+            return
+        done = self._key(generation, "ready")
+        if not await client.exists(done):
+            if await client.set(self._key(generation, "lock"), "1", nx=True, ex=60):
+                await self._migrate(client, generation)
+                await client.set(done, "1")
+            else:
+                for _ in range(50):
+                    await asyncio.sleep(0.1)
+                    if await client.exists(done):
+                        break
+        self._migrated = generation
+
+    async def _migrate(self, client: Any, generation: int) -> None:
+        factor = 2.0 ** -GENERATION_HALF_LIVES
+        previous = generation - 1
+        categories = await client.zrange(self._key(previous, "categories"), 0, -1)
+        names = ["items", "categories"] + [f"cat:{_text(c)}" for c in categories]
+        ttl = int(self.half_life * GENERATION_HALF_LIVES)
+        for name in names:
+            old, new = self._key(previous, name), self._key(generation, name)
+            # new keys may already hold increments from this generation
+            await client.zunionstore(new, {old: factor, new: 1.0})
+            await client.zremrangebyscore(new, "-inf", f"({MIN_COUNT}")
+            await client.expire(old, ttl)
+
+    def _boost(self, ts: float, generation: int) -> float:
+        epoch = generation * self.half_life * GENERATION_HALF_LIVES
+        return 2.0 ** ((ts - epoch) / self.half_life)
+
+    async def record(self, key: str, category: str | None, weight: float, ts: float | datetime | None = None) -> None:
+        ts = _timestamp(ts)
+        generation = self._generation(ts)
+        client = await self._client()
+        if client is None:
+            await self.fallback.record(key, category, weight, ts)
+            return
+        try:
+            await self._ensure_generation(client, generation)
+            boost = weight * self._boost(ts, generation)
+            pipe = client.pipeline(transaction=False)
+            pipe.zincrby(self._key(generation, "items"), boost, key)
+            category_key = _category_key(category)
+            if category_key:
+                pipe.zincrby(self._key(generation, "categories"), boost, category_key)
+                pipe.zincrby(self._key(generation, f"cat:{category_key}"), boost, key)
+            await pipe.execute()
+        except Exception as exc:
+            self._redis_failed("record", exc)
+            await self.fallback.record(key, category, weight, ts)
+            return
+        self._redis_ok()
+
+    async def _zset_top(self, name: str, n: int) -> list[tuple[str, float]] | None:
+        """Top of one sorted set, or None when Redis can't be used."""
+        client = await self._client()
+        if client is None:
+            return None
+        generation = self._generation(time.time())
+        try:
+            await self._ensure_generation(client, generation)
+            rows = await client.zrevrange(self._key(generation, name), 0, n - 1, withscores=True)
+        except Exception as exc:
+            self._redis_failed("read", exc)
+            return None
+        self._redis_ok()
+        return [(_text(k), float(v)) for k, v in rows]
+
+    async def top(self, n: int, category: str | None = None) -> list[tuple[str, float]]:
+        name = f"cat:{_category_key(category)}" if category else "items"
+        rows = await self._zset_top(name, n)
+        return rows if rows is not None else await self.fallback.top(n, category)
+
+    async def top_categories(self, n: int) -> list[tuple[str, float]]:
+        rows = await self._zset_top("categories", n)
+        return rows if rows is not None else await self.fallback.top_categories(n)
+
+    async def clear(self) -> None:
+        await self.fallback.clear()
+        client = await self._client()
+        if client is None:
+            return
+        async for key in client.scan_iter(match=f"{self.prefix}:*"):
+            await client.delete(key)
+        self._migrated = None
+
+    def save_snapshot(self) -> None:
+        # Redis persists itself
+        return None
+
+
+TrendingStore = Union[MemoryTrendingStore, RedisTrendingStore]
+
+_stores: dict[str, TrendingStore] = {}
+
+
+def create_trending_store(namespace: str) -> TrendingStore:
+    half_life = settings.TRENDING_HALF_LIFE_HOURS * 3600
+    if settings.TRENDING_BACKEND == "redis" and redis is not None:
+        return RedisTrendingStore(namespace, half_life)
+    path = os.path.join(settings.TRENDING_SNAPSHOT_DIR, f"{namespace}.json")
+    return MemoryTrendingStore(namespace, half_life, path)
+
+
+def get_trending_store(namespace: str) -> TrendingStore:
+    """Shared store for ``namespace`` ("posts" for /feed, "videos" for the video service)."""
+    store = _stores.get(namespace)
+    if store is None:
+        store = _stores[namespace] = create_trending_store(namespace)
+    return store
+
+
+@dataclass
+class _RankedList(Generic[T]):
+    items: list[T]
+    built_at: float = field(default_factory=time.monotonic)
+
+
+class TrendingFeed(Generic[T]):
+    """Ready-ranked trending items for cold-start feeds.
+
+    ``build`` turns ranked ``(key, score)`` pairs into response items (one
+    batched load). Lists are rebuilt in the background at most every
+    ``refresh_seconds``, so requests only slice a list already in memory.
+    """
+
+    def __init__(
+        self,
+        store: TrendingStore,
+        build: Callable[[list[tuple[str, float]]], Awaitable[list[T]]],
+        size: int = 500,
+        refresh_seconds: float = 30.0,
+        max_lists: int = 256,
+    ) -> None:
+        self.store = store
+        self.build = build
+        self.size = size
+        self.refresh_seconds = refresh_seconds
+        self.max_lists = max_lists
+        self._lists: OrderedDict[str | None, _RankedList[T]] = OrderedDict()
+        self._refreshing: dict[str | None, asyncio.Task] = {}
+
+    async def _rebuild(self, category: str | None) -> _RankedList[T]:
+        ranked = await self.store.top(self.size, category)
+        entry = _RankedList(await self.build(ranked))
+        self._lists[category] = entry
+        self._lists.move_to_end(category)
+        while len(self._lists) > self.max_lists:
+            self._lists.popitem(last=False)
+        return entry
+
+    def _refresh_in_background(self, category: str | None) -> None:
+        if category in self._refreshing:
+            return
+        task = asyncio.create_task(self._rebuild(category))
+        self._refreshing[category] = task
+
+        def done(t: asyncio.Task) -> None:
+            self._refreshing.pop(category, None)
+            if not t.cancelled() and t.exception() is not None:
+                logger.warning("Trending refresh failed: %s", t.exception())
+
+        task.add_done_callback(done)
+
+    async def ranked(self, category: str | None = None) -> list[T]:
+        """The whole ranked list; do not mutate it."""
+        category = _category_key(category)
+        entry = self._lists.get(category)
+        if entry is None:
+            entry = await self._rebuild(category)
+        elif time.monotonic() - entry.built_at > self.refresh_seconds:
+            self._refresh_in_background(category)
+        return entry.items
+
+    async def page(self, limit: int, offset: int = 0, category: str | None = None) -> list[T]:
+        return (await self.ranked(category))[offset : offset + limit]
+
+    def invalidate(self) -> None:
+        self._lists.clear()
+
+
+async def replay_engagements(store: TrendingStore, source: str = "posts", batch_size: int = 10_000) -> int:
+    """Rebuild counters from engagement history; returns the number replayed."""
+    from sqlalchemy import column, select, table
+
+    from .profiles import engagement_weight
+    from .services.db import get_session_factory
+
+    if source == "posts":
+        engagements = table("engagements", column("post_id"), column("type"), column("rating_score"), column("timestamp"))
+        items = table("posts", column("id"), column("category"))
+        stmt = select(
+            engagements.c.post_id, items.c.category, engagements.c.type, engagements.c.rating_score, engagements.c.timestamp
+        ).join(items, items.c.id == engagements.c.post_id).order_by(engagements.c.timestamp)
+    elif source == "videos":
+        engagements = table(
+            "user_engagements", column("video_id"), column("engagement_type"), column("rating_score"), column("timestamp")
+        )
+        items = table("videos", column("video_id"), column("category"))
+        stmt = select(
+            engagements.c.video_id,
+            items.c.category,
+            engagements.c.engagement_type,
+            engagements.c.rating_score,
+            engagements.c.timestamp,
+        ).join(items, items.c.video_id == engagements.c.video_id).order_by(engagements.c.timestamp)
+    else:
+        raise ValueError(f"Unknown engagement source: {source}")
+
+    count = 0
+    async with get_session_factory()() as session:
+        result = await session.stream(stmt.execution_options(yield_per=batch_size))
+        async for key, category, type, rating_score, ts in result:
+            await store.record(str(key), category, engagement_weight(type, rating_score), ts)
+            count += 1
+    store.save_snapshot()
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Trending counters maintenance")
+    parser.add_argument("command", choices=["rebuild", "top"])
+    parser.add_argument("--source", choices=["posts", "videos"], default="posts")
+    parser.add_argument("--category", default=None)
+    parser.add_argument("-n", type=int, default=20)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    store = get_trending_store(args.source)
+    if args.command == "rebuild":
+
+        async def rebuild() -> int:
+            await store.clear()
+            return await replay_engagements(store, args.source)
+
+        count = asyncio.run(rebuild())
+        print(f"Replayed {count} engagements into trending:{args.source}")
+    else:
+        for key, score in asyncio.run(store.top(args.n, args.category)):
+            print(f"{key}\t{score:.6g}")
+
+
+if __name__ == "__main__":
+    main()
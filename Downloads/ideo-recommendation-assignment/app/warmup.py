@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Hashable, Sequence, TypeVar
+
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+
+
+@dataclass
+class WarmupProgress:
+    target: int = 0
+    warmed: int = 0
+    failed: int = 0
+    version: str | None = None
+    started_at: float | None = None
+    finished_at: float | None = None
+
+    @property
+    def coverage(self) -> float:
+        return self.warmed / self.target if self.target else 1.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {**asdict(self), "coverage": round(self.coverage, 4)}
+
+
+async def warm_keys(
+    keys: Sequence[K],
+    warm_one: Callable[[K], Awaitable[Any]],
+    *,
+    concurrency: int,
+    progress: WarmupProgress | None = None,
+) -> WarmupProgress:
+    """Run ``warm_one`` for every key, at most ``concurrency`` at a time.
+
+    A key that raises counts as failed; the others carry on.
+    """
+    progress = progress or WarmupProgress()
+    progress.target = len(keys)
+    pending = iter(keys)
+
+    async def worker() -> None:
+        for key in pending:
+            try:
+                await warm_one(key)
+                progress.warmed += 1
+            except Exception as exc:
+                progress.failed += 1
+                logger.debug("Warming %r failed: %s", key, exc)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(keys))))))
+    return progress
+
+
+class Warmup:
+    """Precomputes cache entries after startup and again after model rebuilds.
+
+    ``load_keys`` returns what to warm, e.g. the most recently active users,
+    and ``warm_one`` computes and stores one of them. ``version`` names the
+    model the cached values depend on; when it changes, the next check runs
+    a new pass. The process is ``ready`` once a pass has covered
+    ``threshold`` of its keys and stays ready through later passes, which
+    refresh entries the old ones keep serving until then.
+    """
+
+    def __init__(
+        self,
+        load_keys: Callable[[], Awaitable[Sequence[K]]],
+        warm_one: Callable[[K], Awaitable[Any]],
+        *,
+        concurrency: int = 8,
+        threshold: float = 0.9,
+        version: Callable[[], str] | None = None,
+    ) -> None:
+        self.load_keys = load_keys
+        self.warm_one = warm_one
+        self.concurrency = concurrency
+        self.threshold = threshold
+        self.version = version or (lambda: "")
+        self.progress = WarmupProgress()
+        self.ready = False
+        self._task: asyncio.Task | None = None
+
+    async def run(self) -> WarmupProgress:
+        """One warm-up pass over the current keys."""
+        progress = WarmupProgress(version=self.version(), started_at=time.time())
+        self.progress = progress
+        try:
+            keys = list(await self.load_keys())
+        except Exception:
+            logger.exception("Could not load the keys to warm")
+            progress.finished_at = time.time()
+            return progress
+        await warm_keys(keys, self.warm_one, concurrency=self.concurrency, progress=progress)
+        progress.finished_at = time.time()
+        if progress.coverage >= self.threshold:
+            self.ready = True
+        logger.info(
+            "Warmed %d of %d cache entries (%d failed) in %.1fs",
+            progress.warmed,
+            progress.target,
+            progress.failed,
+            progress.finished_at - progress.started_at,
+        )
+        return progress
+
+    async def watch(self, interval: float) -> None:
+        """Warm now, then again whenever the model version changes or the last pass fell short."""
+        while True:
+            if not self.ready or self.progress.version != self.version():
+                await self.run()
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.watch(interval))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict[str, Any]:
+        return {"ready": self.ready, "threshold": self.threshold, **self.progress.as_dict()}
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Iterable, Sequence
+
+
+# (timestamp, id) of a row; either part is 0 when the row lacks it
+Mark = tuple[float, float]
+
+
+def _timestamp(value: Any) -> float | None:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        # epoch seconds, or milliseconds as many JSON APIs send them
+        return value / 1000 if value > 1e11 else float(value)
+    if isinstance(value, str) and value:
+        try:
+            when = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return when.timestamp()
+    return None
+
+
+def _number(value: Any) -> float | None:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str) and value.isdigit():
+        return float(value)
+    return None
+
+
+def as_mark(value: Sequence[float] | None) -> Mark | None:
+    """A mark as stored (a JSON list) back to a comparable tuple."""
+    return tuple(value) if value else None
+
+
+@dataclass(frozen=True)
+class MarkFields:
+    """Where rows of one upstream list keep their timestamp and id.
+
+    A row's mark is ``(timestamp, id)`` from the first of ``timestamps`` and
+    ``ids`` it has; marks compare by time, then id. A list's watermark is the
+    highest mark written so far, and only rows above it are new. Rows with
+    neither field can't be placed against a watermark and always count as
+    new.
+    """
+
+    timestamps: tuple[str, ...] = ()
+    ids: tuple[str, ...] = ()
+
+    def time_of(self, row: Any) -> float | None:
+        """Epoch seconds of ``row``'s first timestamp field, if it has one."""
+        if not isinstance(row, dict):
+            return None
+        return next((t for t in map(_timestamp, (row.get(k) for k in self.timestamps)) if t is not None), None)
+
+    def of(self, row: Any) -> Mark | None:
+        if not isinstance(row, dict):
+            return None
+        ts = self.time_of(row)
+        ident = next((n for n in map(_number, (row.get(k) for k in self.ids)) if n is not None), None)
+        if ts is None and ident is None:
+            return None
+        return (ts or 0.0, ident or 0.0)
+
+    def newer(self, rows: Iterable[Any], watermark: Mark | None) -> list:
+        """Rows above ``watermark``, and rows without a mark."""
+        if watermark is None:
+            return list(rows)
+        watermark = as_mark(watermark)
+        return [row for row in rows if (mark := self.of(row)) is None or mark > watermark]
+
+    def high_water(self, rows: Iterable[Any], watermark: Mark | None) -> Mark | None:
+        """``watermark`` raised to the highest mark among ``rows``."""
+        marks = [mark for mark in map(self.of, rows) if mark is not None]
+        if watermark is not None:
+            marks.append(as_mark(watermark))
+        return max(marks, default=None)
+
+    def is_stale(self, rows: Sequence[Any], watermark: Mark | None) -> bool:
+        """Whether a page of a newest-first list is entirely at or below ``watermark``.
+
+        Only a page whose marks all exist and run newest first counts, so a
+        list in any other order is never cut short.
+        """
+        if watermark is None or not rows:
+            return False
+        marks = [self.of(row) for row in rows]
+        if any(mark is None for mark in marks):
+            return False
+        watermark = as_mark(watermark)
+        return all(a >= b for a, b in zip(marks, marks[1:])) and marks[0] <= watermark
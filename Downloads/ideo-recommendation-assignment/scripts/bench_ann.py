@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Recall vs latency benchmark for the IVF index in app/services/ann.py.
+Uses synthetic clustered vectors shaped like ALS factors; exact search is the baseline.
+
+    python scripts/bench_ann.py --videos 200000 --dim 64 --k 300
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.ann import build_ivf  # noqa: E402
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim))
+    points = centres[rng.integers(0, clusters, n)] + 0.5 * rng.normal(size=(n, dim))
+    # popularity skew: ALS factors of popular videos have larger norms
+    points *= rng.lognormal(sigma=0.3, size=(n, 1))
+    return points.astype(np.float32)
+
+
+def percentile_us(samples, q: float) -> float:
+    return float(np.percentile(samples, q)) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--k", type=int, default=300)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.videos, args.dim, clusters=200, seed=args.seed)
+    keys = [str(i) for i in range(args.videos)]
+    started = time.perf_counter()
+    index = build_ivf(keys, vectors, args.lists, seed=args.seed)
+    print(f"built {index.n_lists} lists over {len(index)} vectors in {time.perf_counter() - started:.2f}s")
+
+    rng = np.random.default_rng(args.seed + 1)
+    queries = synthetic_vectors(args.queries, args.dim, clusters=200, seed=args.seed)[rng.permutation(args.queries)]
+
+    exact_times, truth = [], []
+    for query in queries:
+        started = time.perf_counter()
+        scores = vectors @ query
+        top = np.argpartition(-scores, args.k - 1)[: args.k]
+        exact_times.append(time.perf_counter() - started)
+        truth.append(set(top.tolist()))
+    print(f"\n{'nprobe':>6} {'recall@k':>9} {'p50 us':>8} {'p99 us':>8}")
+    print(f"{'exact':>6} {1.0:>9.3f} {percentile_us(exact_times, 50):>8.0f} {percentile_us(exact_times, 99):>8.0f}")
+
+    nprobe = 1
+    while nprobe <= index.n_lists:
+        times, recall = [], []
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            found = index.search(query, args.k, nprobe=nprobe)
+            times.append(time.perf_counter() - started)
+            recall.append(len({int(key) for key, _ in found} & expected) / args.k)
+        print(f"{nprobe:>6} {np.mean(recall):>9.3f} {percentile_us(times, 50):>8.0f} {percentile_us(times, 99):>8.0f}")
+        nprobe *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Encode/decode time and stored bytes of cached feeds for every installed codec
+in app/codec.py, against the plain json.dumps/json.loads path it replaced.
+
+    python scripts/bench_codec.py --items 500 --repeat 200
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.codec import COMPRESSORS, SERIALIZERS, Codec  # noqa: E402
+
+WORDS = "calm focus morning run yoga breath sleep journal gratitude walk art music".split()
+
+
+def synthetic_feed(items: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    ranked = sorted(((rng.random(), i) for i in range(items)), reverse=True)
+    return {
+        "value": {
+            "items": [
+                {
+                    "id": post_id,
+                    "title": " ".join(rng.choices(WORDS, k=6)),
+                    "category": rng.choice(["fitness", "art", "mindfulness"]),
+                    "metadata": {
+                        "tags": rng.sample(WORDS, 4),
+                        "mood": rng.choice(WORDS),
+                        "duration": rng.randint(10, 600),
+                        "description": " ".join(rng.choices(WORDS, k=30)),
+                    },
+                    "reason": "personalized",
+                    "score": round(score, 4),
+                }
+                for score, post_id in ranked
+            ],
+            "keys": [[score, post_id] for score, post_id in ranked],
+            "complete": False,
+        },
+        "fresh_until": time.time() + 300,
+        "group": "alice",
+    }
+
+
+def timed_us(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--min-compress-bytes", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    feed = synthetic_feed(args.items, args.seed)
+    print(f"{'codec':>16} {'bytes':>9} {'encode us':>10} {'decode us':>10}")
+
+    text = json.dumps(feed)
+    encode = timed_us(lambda: json.dumps(feed), args.repeat)
+    decode = timed_us(lambda: json.loads(text), args.repeat)
+    print(f"{'json (before)':>16} {len(text.encode()):>9} {encode:>10.0f} {decode:>10.0f}")
+
+    for serializer in SERIALIZERS:
+        for compression in COMPRESSORS:
+            codec = Codec(serializer, compression, args.min_compress_bytes)
+            data = codec.encode(feed)
+            assert codec.decode(data) == json.loads(text)
+            encode = timed_us(lambda: codec.encode(feed), args.repeat)
+            decode = timed_us(lambda: codec.decode(data), args.repeat)
+            print(f"{serializer + '+' + compression:>16} {len(data):>9} {encode:>10.0f} {decode:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
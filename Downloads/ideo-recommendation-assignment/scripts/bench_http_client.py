@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Requests per second against a local mock Socialverse API: a fresh
+httpx.AsyncClient per call (before) against the shared pooled client in
+app/http_client.py (after), both through ExternalAPIService.
+
+    python scripts/bench_http_client.py --requests 2000 --concurrency 50 --latency-ms 5
+
+The mock speaks plain HTTP, so the gap shown is TCP setup alone; against the
+real API every fresh client also pays a TLS handshake.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.http_client import close_http_client, init_http_client  # noqa: E402
+from app.services.data_collection import ExternalAPIService  # noqa: E402
+
+
+async def serve_mock(latency: float, body: bytes) -> asyncio.base_events.Server:
+    """Minimal HTTP/1.1 keep-alive server answering every GET with ``body``."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                if not head:
+                    break
+                await asyncio.sleep(latency)
+                close = b"connection: close" in head.lower()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n".encode()
+                    + (b"Connection: close\r\n\r\n" if close else b"\r\n")
+                    + body
+                )
+                await writer.drain()
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0, backlog=1024)
+
+
+async def run(service: ExternalAPIService, requests: int, concurrency: int) -> float:
+    pending = iter(range(requests))
+
+    async def worker() -> None:
+        for page in pending:
+            await service._fetch("posts/summary/get", {"page": page, "page_size": 100})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return requests / (time.perf_counter() - started)
+
+
+async def fresh_client_fetch(service: ExternalAPIService, endpoint: str, params: dict) -> dict:
+    # the per-call client _fetch used before the shared pool
+    async with httpx.AsyncClient(timeout=service.timeout) as client:
+        response = await client.get(f"{service.base_url}/{endpoint}", headers=service._get_headers(), params=params)
+        response.raise_for_status()
+        return response.json()
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    body = json.dumps([{"id": i, "title": f"post {i}"} for i in range(args.items)]).encode()
+    server = await serve_mock(args.latency_ms / 1000, body)
+    port = server.sockets[0].getsockname()[1]
+
+    service = ExternalAPIService()
+    service.base_url = f"http://127.0.0.1:{port}"
+    pooled_fetch = service._fetch
+
+    print(f"{'client':>16} {'req/s':>10}")
+    service._fetch = lambda endpoint, params: fresh_client_fetch(service, endpoint, params)
+    before = await run(service, args.requests, args.concurrency)
+    print(f"{'fresh (before)':>16} {before:>10.0f}")
+
+    service._fetch = pooled_fetch
+    init_http_client()
+    try:
+        after = await run(service, args.requests, args.concurrency)
+    finally:
+        await close_http_client()
+    print(f"{'pooled (after)':>16} {after:>10.0f}   x{after / before:.1f}")
+
+    server.close()
+    await server.wait_closed()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="mock upstream response time")
+    parser.add_argument("--items", type=int, default=20, help="posts in each mock response")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
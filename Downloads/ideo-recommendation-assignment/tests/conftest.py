@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch):
+    """Session factory over a fresh SQLite posts database, with a fresh feature index."""
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+    from app import crud, data_collection, dependencies, feature_index, recommendation
+    from app.models.posts import Base
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'posts.db'}")
+
+    async def create():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create())
+    factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    monkeypatch.setattr(dependencies, "engine", engine)
+    monkeypatch.setattr(dependencies, "AsyncSessionLocal", factory)
+    monkeypatch.setattr(recommendation, "AsyncSessionLocal", factory)
+    path = str(tmp_path / "features.npz")
+    index = feature_index.PostFeatureIndex(path)
+    monkeypatch.setattr(feature_index.settings, "FEATURE_INDEX_PATH", path)
+    for module in (feature_index, crud, data_collection, recommendation):
+        monkeypatch.setattr(module, "post_feature_index", index)
+    yield factory
+    asyncio.run(engine.dispose())
@@ -0,0 +1,50 @@
+import numpy as np
+
+from app.services.als import ALSModel, save_factors, train_als
+from app.services.interactions import Interactions
+
+
+def _two_clusters():
+    # users 0-9 watch videos a*, users 10-19 watch videos b*; each user skips one.
+    # Tests train with two factors so the model has to generalise, not memorise.
+    users, videos = [], []
+    for u in range(20):
+        group = "a" if u < 10 else "b"
+        for v in range(6):
+            if v != u % 6:
+                users.append(f"u{u}")
+                videos.append(f"{group}{v}")
+    return Interactions.from_triples(users, videos, [1.0] * len(users))
+
+
+def test_training_separates_clusters():
+    interactions = _two_clusters()
+    users, videos = train_als(interactions, factors=2, iterations=10)
+    assert users.dtype == np.float32 and videos.shape == (12, 2)
+    scores = users @ videos.T
+    keys = interactions.item_keys.tolist()
+    a = [keys.index(f"a{v}") for v in range(6)]
+    b = [keys.index(f"b{v}") for v in range(6)]
+    row = interactions.user_keys.tolist().index("u0")
+    assert scores[row, a].min() > scores[row, b].max()
+
+
+def test_save_load_memmap_and_recommend(tmp_path):
+    interactions = _two_clusters()
+    users, videos = train_als(interactions, factors=2, iterations=10)
+    first = save_factors(str(tmp_path), interactions.user_keys, interactions.item_keys, users, videos)
+    model = ALSModel.load(str(tmp_path))
+    assert model.version == first
+    assert isinstance(model.video_factors, np.memmap)
+    assert not model.has_user("nobody") and model.recommend("nobody", 5) == []
+
+    seen = [f"a{v}" for v in range(1, 6)]
+    recs = model.recommend("u0", 3, exclude=seen)
+    assert recs[0][0] == "a0"
+    assert not set(seen) & {key for key, _ in recs}
+    assert np.allclose(model.score_videos("u0", ["a0", "zz"]), [recs[0][1], 0.0], atol=1e-5)
+
+    for _ in range(4):
+        save_factors(str(tmp_path), interactions.user_keys, interactions.item_keys, users, videos)
+    assert len([p for p in tmp_path.iterdir() if p.is_dir()]) == 3
+    assert ALSModel.load(str(tmp_path)).version != first
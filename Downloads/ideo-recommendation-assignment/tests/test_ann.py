@@ -0,0 +1,56 @@
+import numpy as np
+
+from app.services.ann import IVFIndex, build_ivf
+
+
+def _vectors(n=2000, dim=16, seed=5):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(20, dim))
+    points = centres[rng.integers(0, 20, n)] + 0.3 * rng.normal(size=(n, dim))
+    return [f"v{i}" for i in range(n)], points.astype(np.float32)
+
+
+def _exact(vectors, query, k):
+    return set(np.argsort(-(vectors @ query))[:k].tolist())
+
+
+def test_full_probe_is_exact_and_partial_probe_recalls():
+    keys, vectors = _vectors()
+    index = build_ivf(keys, vectors, n_lists=40)
+    rng = np.random.default_rng(1)
+    recall = []
+    for query in rng.normal(size=(20, 16)).astype(np.float32):
+        expected = _exact(vectors, query, 50)
+        full = index.search(query, 50, nprobe=40)
+        assert {int(key[1:]) for key, _ in full} == expected
+        partial = index.search(query, 50, nprobe=8)
+        recall.append(len({int(key[1:]) for key, _ in partial} & expected) / 50)
+    assert np.mean(recall) > 0.8
+
+
+def test_insert_replace_and_exclude():
+    keys, vectors = _vectors(500)
+    index = build_ivf(keys, vectors, n_lists=10)
+    query = vectors[0]
+    index.add("new", query * 10)
+    assert index.search(query, 1)[0][0] == "new"
+    assert "new" not in {key for key, _ in index.search(query, 5, exclude=["new"])}
+
+    index.add("v0", -query)
+    index.compact()
+    assert len(index) == 501
+    assert np.allclose(index.vector("v0"), -query)
+    assert index.search(query, 1, nprobe=10)[0][0] == "new"
+    assert index.mean_vector(["v1", "missing"]) is not None
+
+
+def test_save_and_load(tmp_path):
+    keys, vectors = _vectors(300)
+    index = build_ivf(keys, vectors, n_lists=8, model_version="m1")
+    index.add("extra", vectors[3])
+    path = str(tmp_path / "ann.npz")
+    index.save(path)
+    loaded = IVFIndex.load(path)
+    assert loaded.model_version == "m1" and len(loaded) == 301
+    query = vectors[7]
+    assert loaded.search(query, 10, nprobe=8) == index.search(query, 10, nprobe=8)
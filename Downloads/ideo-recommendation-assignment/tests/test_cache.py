@@ -0,0 +1,313 @@
+import asyncio
+
+import pytest
+
+from app.cache import CircuitBreaker, LRUCache, RefreshingCache, TieredCache
+from app.warmup import Warmup
+
+
+class DictRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None, px=None, nx=False):
+        if nx and key in self.data:
+            return False
+        self.data[key] = value
+        self.ttls[key] = px / 1000 if px is not None else ex
+        return True
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+
+def _cache(client=None, soft_ttl=None):
+    async def factory():
+        return client
+
+    return TieredCache("feed", local_size=2, local_ttl=60, ttl=300, soft_ttl=soft_ttl, client_factory=factory)
+
+
+def test_lru_evicts_least_recent_and_expires():
+    lru = LRUCache(maxsize=2, ttl=60)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+    assert lru.get("b") is None and lru.get("a") == 1
+    lru.set("d", 4, ttl=0)
+    assert lru.get("d") is None
+
+
+def test_concurrent_misses_compute_once():
+    cache = _cache()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return [1, 2]
+
+    async def run():
+        results = await asyncio.gather(*(cache.get_or_compute("u", compute) for _ in range(10)))
+        return results + [await cache.get_or_compute("u", compute)]
+
+    results = asyncio.run(run())
+    assert calls == 1
+    assert all(r == [1, 2] for r in results)
+    assert cache.stats.misses == 1 and cache.stats.coalesced == 9 and cache.stats.local_hits == 1
+
+
+def test_failed_fill_reaches_every_waiter_and_is_retried():
+    cache = _cache()
+
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("db down")
+
+    async def ok():
+        return [3]
+
+    async def run():
+        results = await asyncio.gather(*(cache.get_or_compute("u", boom) for _ in range(3)), return_exceptions=True)
+        return results, await cache.get_or_compute("u", ok)
+
+    results, retried = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert retried == [3]
+
+
+def test_sub_second_ttls_reach_redis_in_milliseconds():
+    client = DictRedis()
+    cache = _cache(client)
+    asyncio.run(cache.set("soon", [1], ttl=0.25))
+    asyncio.run(cache.set("tiny", [1], ttl=0.0001))
+    assert client.ttls == {"feed:soon": 0.25, "feed:tiny": 0.001}
+
+
+def test_none_is_cached_only_with_none_ttl():
+    cache = _cache(DictRedis())
+    calls = 0
+
+    async def cold():
+        nonlocal calls
+        calls += 1
+        return None
+
+    async def run():
+        for _ in range(2):
+            await cache.get_or_compute("cold", cold)
+        for _ in range(2):
+            assert await cache.get_or_compute("known-cold", cold, none_ttl=30) is None
+
+    asyncio.run(run())
+    assert calls == 3
+    assert cache.local.get("known-cold").value is None
+
+
+def test_redis_tier_refills_local():
+    client = DictRedis()
+    writer, reader = _cache(client), _cache(client)
+
+    async def run():
+        await writer.set("u", [{"id": 1}])
+        return await reader.get("u"), await reader.get("u")
+
+    assert asyncio.run(run()) == ([{"id": 1}], [{"id": 1}])
+    assert reader.stats.redis_hits == 1 and reader.stats.local_hits == 1
+    assert reader.stats.as_dict()["hit_ratio"] == pytest.approx(1.0)
+
+
+def test_stale_entry_served_while_refreshing():
+    cache = _cache(soft_ttl=0.05)
+    versions = iter(["v2", "v3"])
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        return next(versions)
+
+    async def run():
+        await cache.set("u", "v1")
+        await asyncio.sleep(0.06)
+        stale = await asyncio.gather(*(cache.get_or_compute("u", compute) for _ in range(3)))
+        await asyncio.sleep(0.02)
+        return stale, await cache.get_or_compute("u", compute)
+
+    stale, refreshed = asyncio.run(run())
+    assert stale == ["v1", "v1", "v1"]
+    assert refreshed == "v2"
+    assert cache.stats.refreshes == 1 and cache.stats.stale == 3
+
+
+def test_invalidate_drops_group_and_discards_running_fill():
+    cache = _cache()
+    cache.local.maxsize = 10
+    gate = asyncio.Event()
+
+    async def old():
+        await gate.wait()
+        return "old"
+
+    async def new():
+        return "new"
+
+    async def run():
+        await cache.set("alice:", "a", group="alice")
+        await cache.set("bob:", "b", group="bob")
+        running = asyncio.ensure_future(cache.get_or_compute("alice:art", old, group="alice"))
+        await asyncio.sleep(0)
+        await cache.invalidate("alice")
+        gate.set()
+        return await running, await cache.get_or_compute("alice:art", new, group="alice")
+
+    assert asyncio.run(run()) == ("old", "new")
+    assert cache.local.get("alice:") is None and cache.local.get("bob:") is not None
+    assert cache.stats.invalidations == 1
+
+
+def test_fill_lock_coalesces_across_workers():
+    client = DictRedis()
+
+    async def factory():
+        return client
+
+    workers = [
+        TieredCache("upstream", local_size=2, local_ttl=60, ttl=300, client_factory=factory,
+                    fill_lock_seconds=1, fill_poll_seconds=0.01)
+        for _ in range(3)
+    ]
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.03)
+        return {"page": 1}
+
+    async def run():
+        return await asyncio.gather(*(w.get_or_compute("posts/view?page=1", fetch) for w in workers))
+
+    assert asyncio.run(run()) == [{"page": 1}] * 3
+    assert calls == 1
+    assert "upstream:lock:posts/view?page=1" not in client.data
+    assert sum(w.stats.coalesced for w in workers) == 2
+
+
+def test_warmups_in_every_worker_compute_each_feed_once():
+    client = DictRedis()
+
+    async def factory():
+        return client
+
+    computed = []
+
+    def warmup():
+        cache = TieredCache("feed", local_size=10, local_ttl=60, ttl=300, client_factory=factory,
+                            fill_lock_seconds=1, fill_poll_seconds=0.01)
+
+        async def users():
+            return ["amy", "bob", "cat"]
+
+        async def feed(username):
+            computed.append(username)
+            await asyncio.sleep(0.03)
+            return [username]
+
+        return Warmup(users, lambda u: cache.get_or_compute(u, lambda: feed(u)), concurrency=3)
+
+    async def run():
+        return await asyncio.gather(*(warmup().run() for _ in range(4)))
+
+    passes = asyncio.run(run())
+    assert sorted(computed) == ["amy", "bob", "cat"]
+    assert all(p.warmed == 3 for p in passes)
+
+
+class DownRedis:
+    def __init__(self):
+        self.calls = 0
+
+    async def get(self, key):
+        self.calls += 1
+        raise ConnectionError("redis down")
+
+    set = get
+
+
+def test_open_circuit_skips_redis_until_probe_succeeds():
+    client, healthy = DownRedis(), False
+
+    async def probe():
+        return healthy
+
+    async def factory():
+        return client
+
+    breaker = CircuitBreaker("test", failure_threshold=3, retry_seconds=0.01, probe=probe)
+    cache = TieredCache("feed", local_size=2, local_ttl=60, ttl=300, breaker=breaker, client_factory=factory)
+
+    async def run():
+        nonlocal healthy
+        for _ in range(10):
+            await cache.get("u")
+        assert breaker.state == "open" and client.calls == 3 and breaker.rejected == 7
+        healthy = True
+        await asyncio.sleep(0.05)
+        assert breaker.state == "closed"
+        await cache.get("u")
+        assert client.calls == 4
+
+    asyncio.run(run())
+
+
+def test_shared_value_built_once_and_refreshed_in_background():
+    builds = []
+
+    async def build(key):
+        builds.append(key)
+        await asyncio.sleep(0.01)
+        if len(builds) == 3:
+            raise RuntimeError("db down")
+        return f"{key}-{len(builds)}"
+
+    shared = RefreshingCache(build, refresh_seconds=0.02)
+
+    async def run():
+        first = await asyncio.gather(*(shared.get("art") for _ in range(5)))
+        await asyncio.sleep(0.03)
+        stale = await shared.get("art")  # served while it is rebuilt
+        await asyncio.sleep(0.02)
+        refreshed = await shared.get("art")
+        await asyncio.sleep(0.03)
+        await shared.get("art")  # this rebuild fails
+        await asyncio.sleep(0.02)
+        return first, stale, refreshed, await shared.get("art")
+
+    first, stale, refreshed, kept = asyncio.run(run())
+    assert first == ["art-1"] * 5 and stale == "art-1" and refreshed == "art-2" and kept == "art-2"
+
+
+def test_app_lifespan_runs_the_invalidation_listener(monkeypatch):
+    from app import main
+
+    events = []
+
+    async def stop():
+        events.append("stop")
+
+    monkeypatch.setattr(main.feed_cache, "start_listener", lambda: events.append("start"))
+    monkeypatch.setattr(main.feed_cache, "stop_listener", stop)
+    monkeypatch.setattr(main.settings, "WARMUP_ON_STARTUP", False)
+    monkeypatch.setattr(main.feed_warmup, "ready", main.feed_warmup.ready)
+
+    async def run():
+        async with main.lifespan(main.app):
+            assert events == ["start"]
+
+    asyncio.run(run())
+    assert events[:2] == ["start", "stop"]
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from app.codec import COMPRESSORS, FORMAT_VERSION, SERIALIZERS, Codec
+
+FEED = {
+    "value": {
+        "items": [{"id": i, "title": f"post {i}", "metadata": {"tags": ["a", "b"], "mood": "calm"}} for i in range(50)],
+        "keys": [[0.5, i] for i in range(50)],
+        "complete": False,
+    },
+    "fresh_until": 1.5,
+    "group": "alice",
+}
+
+
+@pytest.mark.parametrize("serializer", sorted(SERIALIZERS))
+@pytest.mark.parametrize("compression", sorted(COMPRESSORS))
+def test_round_trip(serializer, compression):
+    codec = Codec(serializer, compression, min_compress_bytes=0)
+    data = codec.encode(FEED)
+    assert data[0] == FORMAT_VERSION
+    assert Codec("json", "none").decode(data) == FEED
+
+
+def test_small_values_stay_uncompressed():
+    codec = Codec("json", "zlib", min_compress_bytes=1 << 20)
+    assert codec.encode(FEED)[2] == COMPRESSORS["none"].id
+    assert len(Codec("json", "zlib", min_compress_bytes=0).encode(FEED)) < len(codec.encode(FEED))
+
+
+def test_reads_legacy_json_and_rejects_unknown_formats():
+    codec = Codec()
+    assert codec.decode(json.dumps(FEED)) == FEED
+    with pytest.raises(ValueError):
+        codec.decode(bytes((FORMAT_VERSION + 1, 0, 0)) + b"{}")
+    with pytest.raises(ValueError):
+        Codec("no-such-codec")
@@ -0,0 +1,71 @@
+import numpy as np
+
+from app.feature_index import PostFeatureIndex, post_features
+from app.scoring import PostFeatureMatrix
+
+
+def _index(path=None):
+    index = PostFeatureIndex(path, merge_threshold=2)
+    index.upsert(1, "Fitness", {"level": "Easy"})
+    index.upsert(2, "business", None)
+    index.upsert(3, "fitness", {"level": "hard"})
+    return index
+
+
+def test_post_features():
+    assert post_features("Fitness", {"level": "Easy"}) == {"cat:fitness": 1.0, "m:level:easy": 1.0}
+    assert post_features(None, "not a dict") == {}
+
+
+def test_upsert_only_changes_on_new_version():
+    index = _index()
+    assert index.upsert(1, "Fitness", {"level": "Easy"}) is False
+    assert index.upsert(1, "Fitness", {"level": "hard"}) is True
+    assert index.features(1) == {"cat:fitness": 1.0, "m:level:hard": 1.0}
+
+
+def test_scores_include_pending_and_compacted_rows():
+    index = _index()
+    user_vec = {"cat:fitness": 1.0, "m:level:hard": 0.5}
+    ids = [3, 2, 1, 99]
+    expected = PostFeatureMatrix.from_vectors((pid, index.features(pid) or {}) for pid in ids)
+    want = expected.score(expected.query(user_vec))
+    assert np.allclose(index.score(user_vec, ids), want, atol=1e-6)
+
+
+def test_save_load_and_refresh(tmp_path):
+    path = str(tmp_path / "features.npz")
+    writer = _index(path)
+    writer.save()
+    reader = PostFeatureIndex.load(path)
+    assert reader.version == writer.version
+    assert reader.features(3) == writer.features(3)
+
+    writer.upsert(4, "art", None)
+    writer.save()
+    assert reader.refresh_if_stale(min_interval=0) is True
+    assert reader.version == writer.version
+    assert 4 in reader
+    assert reader.refresh_if_stale(min_interval=0) is False
+
+
+def test_refresh_keeps_local_upserts_of_a_process_that_never_saves(tmp_path):
+    path = str(tmp_path / "features.npz")
+    writer = _index(path)
+    writer.save()
+    worker = PostFeatureIndex.load(path)
+    worker.upsert(5, "food", None)  # a post the writer hasn't indexed yet
+
+    writer.upsert(4, "art", None)
+    writer.save()
+    assert worker.refresh_if_stale(min_interval=0) is True
+    assert worker.version == writer.version
+    assert worker.features(4) == {"cat:art": 1.0}
+    assert worker.features(5) == {"cat:food": 1.0}
+    assert np.allclose(worker.score({"cat:food": 1.0}, [5, 4]), [1.0, 0.0])
+
+    # once the writer has the post too, the worker's copy is dropped
+    writer.upsert(5, "food", None)
+    writer.save()
+    assert worker.refresh_if_stale(min_interval=0) is True
+    assert worker._local == {} and not worker._dirty
@@ -0,0 +1,26 @@
+from app.http_cache import conditional_json, content_version, etag_matches, make_etag
+
+
+def test_etag_matching_follows_if_none_match_rules():
+    etag = make_etag("v1", 0, 20, "")
+    assert etag != make_etag("v1", 20, 20, "")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag) and not etag_matches('"other"', etag)
+
+
+def test_content_version_tracks_content():
+    items = [{"id": 1, "title": "a"}]
+    assert content_version(items) == content_version([{"title": "a", "id": 1}])
+    assert content_version(items) != content_version([{"id": 1, "title": "b"}])
+
+
+def test_conditional_json_returns_304_for_current_etag():
+    first = conditional_json(b'{"recommendations":[]}', None)
+    assert first.status_code == 200 and first.body == b'{"recommendations":[]}'
+    again = conditional_json(b'{"recommendations":[]}', first.headers["etag"])
+    assert again.status_code == 304 and again.body == b""
+    assert again.headers["cache-control"].startswith("private, max-age=")
+    shared = conditional_json(b'{"recommendations":[]}', None, private=False)
+    assert shared.headers["cache-control"].startswith("public, max-age=")
@@ -0,0 +1,17 @@
+import asyncio
+
+from app.http_client import close_http_client, get_http_client
+
+
+def test_shared_client_is_reused_until_closed():
+    async def run():
+        first = get_http_client()
+        assert get_http_client() is first
+        await close_http_client()
+        assert first.is_closed
+        second = get_http_client()
+        await close_http_client()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert second is not first
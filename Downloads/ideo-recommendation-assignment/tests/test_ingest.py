@@ -0,0 +1,168 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy import func, select, text  # noqa: E402
+
+from app import crud, data_collection, dependencies, feature_index, ingest, recommendation  # noqa: E402
+from app.services import ann  # noqa: E402
+from app.models.posts import Engagement, EngagementType, Post, User  # noqa: E402
+from app.trending import MemoryTrendingStore, TrendingFeed  # noqa: E402
+
+
+def test_post_metadata_round_trips_to_the_index_and_the_feed(sessions, monkeypatch):
+    # nothing has trended, so the cold-start feed lists the stored posts
+    empty = TrendingFeed(MemoryTrendingStore("posts", 3600.0), recommendation._trending_items)
+    monkeypatch.setattr(recommendation, "_trending", empty)
+
+    async def scenario():
+        async with sessions() as db:
+            ids = await crud.upsert_posts(db, [{"title": "squats", "category": "fitness", "metadata": {"level": "Easy"}}])
+            await db.commit()
+            post_id = ids["squats"][0]
+            index = await feature_index.rebuild_index()
+            saved = await crud.save_post(db, title="plank", category="fitness", metadata={"level": "hard"})
+            feed = await recommendation.get_cold_start_recommendations(db, "nobody", limit=5)
+        return post_id, index, saved, feed
+
+    post_id, index, saved, feed = asyncio.run(scenario())
+    assert index.features(post_id) == {"cat:fitness": 1.0, "m:level:easy": 1.0}
+    assert saved.post_metadata == {"level": "hard"}
+    assert {item["title"]: item["metadata"] for item in feed} == {"squats": {"level": "Easy"}, "plank": {"level": "hard"}}
+
+
+def test_databases_without_on_conflict_are_refused_at_startup():
+    dependencies.check_dialect("sqlite")
+    with pytest.raises(ValueError, match="mysql"):
+        dependencies.check_dialect("mysql")
+
+
+def test_upgrade_merges_duplicates_before_indexing_them(sessions):
+    async def scenario():
+        async with sessions() as db:
+            # a database from before the unique title and engagement indexes
+            await db.execute(text("DROP INDEX uq_posts_title"))
+            await db.execute(text("DROP INDEX uq_engagements_user_post_type"))
+            user = User(username="amy")
+            db.add_all([user, Post(id=1, title="squats"), Post(id=2, title="squats"), Post(id=3, title="plank")])
+            await db.flush()
+            db.add_all([
+                Engagement(user_id=user.id, post_id=2, type=EngagementType.like),
+                Engagement(user_id=user.id, post_id=3, type=EngagementType.view),
+                Engagement(user_id=user.id, post_id=3, type=EngagementType.view),
+            ])
+            await db.commit()
+        await dependencies.upgrade_db()
+        async with sessions() as db:
+            posts = (await db.execute(select(Post.id, Post.title).order_by(Post.id))).all()
+            engaged = (await db.execute(select(Engagement.post_id).order_by(Engagement.id))).scalars().all()
+            indexes = [row[1] for table in ("posts", "engagements") for row in
+                       (await db.execute(text(f"PRAGMA index_list({table})"))).all()]
+        return posts, engaged, indexes
+
+    posts, engaged, indexes = asyncio.run(scenario())
+    assert [tuple(row) for row in posts] == [(1, "squats"), (3, "plank")]
+    assert engaged == [1, 3]
+    assert {"uq_posts_title", "uq_engagements_user_post_type"} <= set(indexes)
+
+
+def test_ingest_keeps_upstream_times_and_leaves_backfill_out_of_trending(sessions, monkeypatch):
+    store = MemoryTrendingStore("posts", 3600.0)
+    monkeypatch.setattr(ingest, "get_trending_store", lambda namespace: store)
+    recent = datetime.utcnow().replace(microsecond=0) - timedelta(minutes=5)
+    backfill = recent - timedelta(days=30)
+    squats = {"title": "squats", "category": "fitness", "metadata": None}
+    plank = {"title": "plank", "category": "fitness", "metadata": None}
+
+    async def scenario():
+        async with sessions() as db:
+            async with ingest.BulkIngestor(db, invalidate_feeds=False) as bulk:
+                await bulk.add_engagement("amy", squats, EngagementType.like, timestamp=recent)
+                await bulk.add_engagement("amy", plank, EngagementType.like, timestamp=backfill)
+            stored = (await db.execute(select(Post.title, Engagement.timestamp).join(Post))).all()
+        return dict(stored), await store.top(5)
+
+    stored, top = asyncio.run(scenario())
+    assert stored == {"squats": recent, "plank": backfill}
+    assert len(top) == 1  # only squats trends
+
+
+UPSTREAM = {
+    "users/get_all": [{"id": 1, "username": "amy"}],
+    "posts/summary/get": [{"id": 1, "title": "squats", "category": "fitness"}],
+    "users/amy/viewed": [{"title": "squats", "category": "fitness", "viewed_at": "2026-01-01T00:00:00Z"}],
+    "users/amy/liked": [{"title": "squats", "category": "fitness"}],
+    "users/amy/inspired": [],
+    "users/amy/rated": [],
+}
+
+
+@pytest.fixture
+def upstream(sessions, tmp_path, monkeypatch):
+    """Sync against UPSTREAM; fails the test if anything reads the upstream cache."""
+    store = MemoryTrendingStore("posts", 3600.0)
+    monkeypatch.setattr(ingest, "get_trending_store", lambda namespace: store)
+    monkeypatch.setattr(data_collection, "get_trending_store", lambda namespace: store)
+    monkeypatch.setattr(ann.settings, "ANN_INDEX_PATH", str(tmp_path / "ann.npz"))
+
+    async def fetch(endpoint, params=None):
+        return UPSTREAM[endpoint] if (params or {}).get("page", 1) == 1 else []
+
+    async def cached(key, compute):
+        raise AssertionError(f"sync read {key} through the upstream cache")
+
+    monkeypatch.setattr(data_collection, "_fetch", fetch)
+    monkeypatch.setattr(data_collection.upstream_cache, "get_or_compute", cached)
+
+    async def sync():
+        async with sessions() as db:
+            await data_collection.sync_to_db(db)
+
+    return sync
+
+
+def test_sync_reads_upstream_past_the_cache(sessions, upstream):
+    asyncio.run(upstream())
+
+    async def stored():
+        async with sessions() as db:
+            return (await db.execute(select(Engagement.type, Engagement.timestamp))).all()
+
+    assert sorted(etype.value for etype, _ in asyncio.run(stored())) == ["like", "view"]
+
+
+def test_syncing_the_same_payload_again_adds_no_engagements(sessions, upstream):
+    async def state():
+        async with sessions() as db:
+            count = (await db.execute(select(func.count()).select_from(Engagement))).scalar_one()
+            profile = await crud.get_user_profile(db, 1)
+        return count, profile.engagement_count
+
+    asyncio.run(upstream())
+    first = asyncio.run(state())
+    # a new run, with no upstream field marking the engagements as seen
+    asyncio.run(upstream())
+    assert asyncio.run(state()) == first == (2, 2)
+
+
+def test_syncing_a_new_score_for_a_rating_updates_it_and_the_profile(sessions, upstream, monkeypatch):
+    async def state():
+        async with sessions() as db:
+            scores = (await db.execute(select(Engagement.rating_score).where(Engagement.type == EngagementType.rating))).scalars().all()
+            profile = await crud.get_user_profile(db, 1)
+        return scores, profile.vector, profile.engagement_count
+
+    monkeypatch.setitem(UPSTREAM, "users/amy/rated", [{"title": "squats", "category": "fitness", "rating": 1}])
+    asyncio.run(upstream())
+    scores, before, count = asyncio.run(state())
+    assert (scores, count) == ([1], 3)
+
+    monkeypatch.setitem(UPSTREAM, "users/amy/rated", [{"title": "squats", "category": "fitness", "rating": 5}])
+    asyncio.run(upstream())
+    scores, after, count = asyncio.run(state())
+    assert (scores, count) == ([5], 3)
+    # view + like + a rating of 5, as if it had been 5 all along
+    assert after["cat:fitness"] == pytest.approx(before["cat:fitness"] + 0.4 * 4 / 5)
@@ -0,0 +1,52 @@
+import numpy as np
+
+from app.services.interactions import Interactions
+from app.services.item_item import ItemNeighbours, build_item_neighbours
+
+
+def _interactions(seed=3, n_users=60, n_items=25, n_rows=400):
+    rng = np.random.default_rng(seed)
+    users = [f"u{u}" for u in rng.integers(0, n_users, n_rows)]
+    items = [f"v{i:02d}" for i in rng.integers(0, n_items, n_rows)]
+    weights = rng.choice([0.5, 1.0, 1.2], n_rows).tolist()
+    return Interactions.from_triples(users, items, weights)
+
+
+def _dense_cosine(interactions):
+    m = np.zeros((interactions.n_users, interactions.n_items))
+    m[interactions.user_idx, interactions.item_idx] = interactions.weight
+    norms = np.linalg.norm(m, axis=0)
+    sims = (m.T @ m) / np.outer(norms, norms)
+    np.fill_diagonal(sims, 0.0)
+    return sims
+
+
+def test_neighbours_match_dense_cosine():
+    interactions = _interactions()
+    model = build_item_neighbours(interactions, top_n=5, workers=1)
+    sims = _dense_cosine(interactions)
+    for i in range(interactions.n_items):
+        expected = np.sort(sims[i][sims[i] > 0])[::-1][:5]
+        got = model.scores[i][model.neighbours[i] >= 0]
+        assert np.allclose(got, expected, atol=1e-5)
+
+
+def test_parallel_build_matches_serial():
+    interactions = _interactions(n_items=300, n_rows=3000)
+    serial = build_item_neighbours(interactions, top_n=10, workers=1)
+    parallel = build_item_neighbours(interactions, top_n=10, workers=2)
+    assert np.allclose(serial.scores, parallel.scores, atol=1e-6)
+
+
+def test_recommend_merges_and_excludes_seeds(tmp_path):
+    model = ItemNeighbours(
+        np.array(["a", "b", "c", "d"]),
+        np.array([[1, 2], [0, 3], [0, -1], [1, -1]]),
+        np.array([[0.9, 0.5], [0.9, 0.4], [0.5, 0.0], [0.4, 0.0]]),
+    )
+    path = str(tmp_path / "nb.npz")
+    model.save(path)
+    model = ItemNeighbours.load(path)
+    recs = model.recommend({"a": 1.0, "b": 1.0}, limit=5)
+    assert [key for key, _ in recs] == ["c", "d"]
+    assert recs[0][1] == np.float32(0.5) / 2
@@ -0,0 +1,99 @@
+import asyncio
+
+from app.pagination import map_unordered, page_count, page_items, paginate
+
+
+def _collect(fetch_page, **kwargs):
+    async def run():
+        return [page async for page in paginate(fetch_page, **kwargs)]
+
+    return asyncio.run(run())
+
+
+def test_page_shapes():
+    assert page_items([1, 2]) == [1, 2]
+    assert page_items({"status": "ok", "posts": [1]}) == [1]
+    assert page_items({"data": {"users": [3]}}) == [3]
+    assert page_count({"total": 2001}, 1000) == 3
+    assert page_count({"max_page": 4, "total": 1}, 10) == 4
+    assert page_count([1], 10) is None
+
+
+def test_announced_pages_fetched_concurrently_and_yielded_as_they_arrive():
+    running = peak = 0
+    requested = []
+
+    async def fetch_page(page):
+        nonlocal running, peak
+        requested.append(page)
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05 if page == 2 else 0.01)
+        running -= 1
+        return {"total": 9, "posts": [page] * (2 if page < 5 else 1)}
+
+    pages = _collect(fetch_page, page_size=2, concurrency=3)
+    assert sorted(requested) == [1, 2, 3, 4, 5]
+    assert peak == 3
+    assert [p for p, _ in pages][0] == 1 and [p for p, _ in pages][-1] == 2  # the slow page last
+    assert sorted(row for _, rows in pages for row in rows) == [1, 1, 2, 2, 3, 3, 4, 4, 5]
+
+
+def test_unannounced_pages_stop_at_the_first_short_page():
+    requested = []
+
+    async def fetch_page(page):
+        requested.append(page)
+        await asyncio.sleep(0)
+        return list(range(3)) if page < 4 else ([0] if page == 4 else [])
+
+    pages = _collect(fetch_page, page_size=3, concurrency=2)
+    assert [p for p, _ in pages] == [1, 2, 3, 4]
+    assert max(requested) <= 5
+
+
+def test_single_short_first_page_makes_one_request():
+    requested = []
+
+    async def fetch_page(page):
+        requested.append(page)
+        return [1]
+
+    assert _collect(fetch_page, page_size=1000) == [(1, [1])]
+    assert requested == [1]
+
+
+def test_stop_ends_the_listing_and_cancels_later_pages():
+    requested, cancelled = [], []
+
+    async def fetch_page(page):
+        requested.append(page)
+        try:
+            await asyncio.sleep(0.05 if page > 3 else 0.01 * page)
+        except asyncio.CancelledError:
+            cancelled.append(page)
+            raise
+        return {"total_pages": 10, "data": [page, page]}
+
+    pages = _collect(fetch_page, page_size=2, concurrency=4, stop=lambda rows: rows[0] == 3)
+    assert [p for p, _ in pages] == [1, 2, 3]
+    assert requested == [1, 2, 3, 4, 5, 6] and sorted(cancelled) == [4, 5, 6]
+
+
+def test_map_unordered_bounds_concurrency_and_yields_as_done():
+    running = peak = 0
+
+    async def fetch(user):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.03 if user == "slow" else 0.005)
+        running -= 1
+        return user.upper()
+
+    async def run():
+        return [pair async for pair in map_unordered(fetch, ["slow", "a", "b", "c", "d"], concurrency=2)]
+
+    results = asyncio.run(run())
+    assert peak == 2
+    assert results[-1] == ("slow", "SLOW") and sorted(results) == sorted((u, u.upper()) for u in ["slow", "a", "b", "c", "d"])
@@ -0,0 +1,97 @@
+import asyncio
+
+import numpy as np
+
+from app.pipeline import Pipeline, Stage, gather_candidates, prior_ranker, rank_candidates
+
+
+def _source(keys, delay=0.0, log=None, name=None):
+    async def generate(limit):
+        if log is not None:
+            log.append(("start", name))
+        await asyncio.sleep(delay)
+        if log is not None:
+            log.append(("end", name))
+        return keys[:limit]
+
+    return generate
+
+
+def test_merge_dedupes_and_keeps_best_prior():
+    stages = [
+        Stage("recent", _source([1, 2, 3, 4]), weight=0.5),
+        Stage("popular", _source([3, 5]), weight=1.0),
+    ]
+    candidates = asyncio.run(gather_candidates(stages, exclude=[2]))
+    assert candidates.keys == [1, 3, 4, 5]
+    assert np.allclose(candidates.prior, [0.5, 1.0, 0.125, 0.5])
+    assert candidates.sources[3] == ["popular", "recent"]
+
+
+def test_slow_and_failing_stages_are_dropped():
+    async def broken(limit):
+        raise RuntimeError("boom")
+
+    stages = [
+        Stage("fast", _source([1, 2])),
+        Stage("slow", _source([3], delay=1.0), budget=0.01),
+        Stage("broken", broken),
+    ]
+    candidates = asyncio.run(gather_candidates(stages))
+    assert candidates.keys == [1, 2]
+    assert [(r.name, r.status) for r in candidates.report] == [("fast", "ok"), ("slow", "timeout"), ("broken", "error")]
+    assert candidates.report[1].elapsed < 0.5
+
+
+def test_lanes_run_sequentially_and_share_total_budget():
+    log = []
+    stages = [
+        Stage("a", _source([1], delay=0.01, log=log, name="a"), lane="db"),
+        Stage("b", _source([2], delay=0.01, log=log, name="b"), lane="db"),
+    ]
+    asyncio.run(gather_candidates(stages))
+    assert log == [("start", "a"), ("end", "a"), ("start", "b"), ("end", "b")]
+
+    stages = [Stage("a", _source([1], delay=0.05), lane="db"), Stage("b", _source([2]), lane="db")]
+    candidates = asyncio.run(gather_candidates(stages, total_budget=0.02))
+    assert [r.status for r in candidates.report] == ["timeout", "skipped"]
+
+
+def test_uncancelled_stage_finishes_in_background_and_required_stage_waits():
+    finished = []
+
+    async def query(limit):
+        await asyncio.sleep(0.05)
+        finished.append("query")
+        return [3]
+
+    async def run():
+        stages = [
+            Stage("soft", query, budget=0.01, cancel=False),
+            Stage("required", _source([1], delay=0.03), budget=None),
+        ]
+        candidates = await gather_candidates(stages, total_budget=0.01)
+        statuses = [r.status for r in candidates.report]
+        await asyncio.sleep(0.05)
+        return candidates.keys, statuses
+
+    keys, statuses = asyncio.run(run())
+    assert keys == [1] and statuses == ["timeout", "ok"]
+    assert finished == ["query"]  # dropped, not interrupted
+
+
+def test_pipeline_ranks_and_pages_below_cursor():
+    async def ranker(candidates):
+        return [float(k % 3) for k in candidates.keys]
+
+    pipeline = Pipeline([Stage("all", _source(list(range(1, 11))))], ranker)
+    ranked, _ = asyncio.run(pipeline.run(4))
+    assert ranked == [(2.0, 8), (2.0, 5), (2.0, 2), (1.0, 10)]
+    rest, _ = asyncio.run(pipeline.run(10, after=ranked[-1]))
+    assert rest == rank_candidates(range(1, 11), [k % 3 for k in range(1, 11)], 10)[4:]
+
+    assert rank_candidates([1, 2, 3], [0.5, 0.9, 0.1], 0) == []
+    assert rank_candidates([1, 2, 3], [0.5, 0.9, 0.1], 2, after=(0.9, 2)) == [(0.5, 1), (0.1, 3)]
+
+    ranked, _ = asyncio.run(Pipeline([Stage("all", _source([7, 8]))], prior_ranker).run(5))
+    assert [k for _, k in ranked] == [7, 8]
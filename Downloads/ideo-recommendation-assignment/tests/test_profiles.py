@@ -0,0 +1,26 @@
+import pytest
+
+from app.profiles import apply_engagement, engagement_weight, merge_seen
+
+
+def test_engagement_weights():
+    assert engagement_weight("view") == 0.5
+    assert engagement_weight("like") == 1.0
+    assert engagement_weight("inspire") == 1.2
+    assert engagement_weight("rating", 5) == pytest.approx(1.2)
+    assert engagement_weight("rating", None) == pytest.approx(1.04)
+
+
+def test_incremental_profile_matches_batch_aggregation():
+    history = [
+        ({"cat:fitness": 1.0}, "like", None, 1),
+        ({"cat:fitness": 1.0, "m:level:hard": 1.0}, "rating", 4, 2),
+        ({"cat:business": 1.0}, "view", None, 1),
+    ]
+    vector, seen = {}, []
+    for features, etype, rating, post_id in history:
+        vector = apply_engagement(vector, features, engagement_weight(etype, rating))
+        seen = merge_seen(seen, post_id)
+    assert seen == [1, 2]
+    assert vector["cat:fitness"] == pytest.approx(1.0 + engagement_weight("rating", 4))
+    assert vector["cat:business"] == 0.5
@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from app.ranking import Cursor, RankedSnapshot, SnapshotStore, TopK, decode_cursor, encode_cursor, feed_window
+
+
+def _items(n=500, seed=7):
+    rng = random.Random(seed)
+    # coarse scores so ties on score are common
+    return [(round(rng.random(), 1), i) for i in range(1, n + 1)]
+
+
+def test_topk_matches_full_sort_across_chunks():
+    items = _items()
+    top = TopK(25)
+    for start in range(0, len(items), 60):
+        chunk = items[start : start + 60]
+        top.push([s for s, _ in chunk], [i for _, i in chunk])
+    expected = sorted(items, reverse=True)[:25]
+    assert [(s, i) for s, i, _ in top.ranked()] == expected
+
+
+def test_topk_after_continues_below_cursor():
+    items = _items()
+    ranked = sorted(items, reverse=True)
+    top = TopK(10, after=ranked[9])
+    top.push([s for s, _ in items], [i for _, i in items])
+    assert [(s, i) for s, i, _ in top.ranked()] == ranked[10:20]
+
+
+def test_cursor_round_trip():
+    cursor = Cursor(score=0.123456789, post_id=42, snapshot="abc")
+    assert decode_cursor(encode_cursor(cursor)) == cursor
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_snapshot_paging():
+    entries = sorted(_items(50), reverse=True)
+    snapshot = RankedSnapshot(owner="alice", entries=entries, complete=True)
+    page, more = snapshot.window(0, 20)
+    assert more
+    start = snapshot.position_after(page[-1])
+    assert start == 20
+    page, more = snapshot.window(start, 40)
+    assert page == entries[20:] and not more
+
+
+def test_snapshot_store_scoped_to_owner():
+    store = SnapshotStore(max_snapshots=1)
+    first = RankedSnapshot(owner="alice", entries=[], complete=True)
+    store.put(first)
+    assert store.get(first.id, "bob") is None
+    assert store.get(first.id, "alice") is first
+    store.put(RankedSnapshot(owner="bob", entries=[], complete=True))
+    assert store.get(first.id, "alice") is None
+
+
+def test_feed_window_slices_cached_feed_and_resumes_from_cursor():
+    ranked = sorted(_items(10), reverse=True)
+    feed = {"items": [{"id": i} for _, i in ranked], "keys": [[s, i] for s, i in ranked], "complete": False}
+    page, cursor = feed_window(feed, 4, offset=2)
+    assert [item["id"] for item in page] == [i for _, i in ranked[2:6]]
+    after = decode_cursor(cursor)
+    assert after.key == ranked[5] and after.snapshot is None
+    page, _ = feed_window(feed, 4, after=after)
+    assert [item["id"] for item in page] == [i for _, i in ranked[6:10]]
+    # past the cached depth of an incomplete feed the caller must rank further
+    assert feed_window(feed, 4, offset=8) is None
+    assert feed_window({**feed, "complete": True}, 4, offset=8)[0] == feed["items"][8:]
+    assert feed_window({**feed, "complete": True}, 4, offset=8)[1] is None
@@ -0,0 +1,72 @@
+import asyncio
+import random
+import time
+from email.utils import formatdate
+
+import httpx
+
+import app.http_client as http_client
+from app.rate_limit import AdaptiveTokenBucket, backoff_delay, parse_retry_after
+
+
+def test_bucket_spaces_requests_after_the_burst():
+    bucket = AdaptiveTokenBucket(100, burst=5)
+
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(15)))
+        return time.monotonic() - started
+
+    assert 0.08 <= asyncio.run(run()) < 0.5
+
+
+def test_throttling_halves_rate_once_per_burst_and_recovers():
+    bucket = AdaptiveTokenBucket(16, min_rate=2, increase=1)
+    for _ in range(5):
+        bucket.on_throttled()
+    assert bucket.rate == 8 and bucket.throttled == 5
+    for _ in range(20):
+        bucket.on_success()
+    assert bucket.rate == 16
+
+
+def test_retry_after_holds_every_caller():
+    bucket = AdaptiveTokenBucket(1000, burst=100)
+    bucket.on_throttled(retry_after=0.05)
+
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(bucket.acquire(), bucket.acquire())
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.045
+
+
+def test_retry_after_and_backoff():
+    assert parse_retry_after("3") == 3.0
+    assert 50 < parse_retry_after(formatdate(time.time() + 60, usegmt=True)) <= 60
+    assert parse_retry_after("soon") is None and parse_retry_after(None) is None
+    rng = random.Random(0)
+    assert all(0 <= backoff_delay(3, base=0.5, cap=2, rng=rng) <= 2 for _ in range(100))
+    assert 7 <= backoff_delay(0, base=0.5, retry_after=7, rng=rng) <= 7.5
+
+
+def test_get_with_retries_waits_out_429s(monkeypatch):
+    responses = iter([
+        httpx.Response(429, headers={"Retry-After": "0"}),
+        httpx.Response(503),
+        httpx.Response(200, json={"ok": True}),
+    ])
+    monkeypatch.setattr(http_client.settings, "UPSTREAM_BACKOFF_BASE_SECONDS", 0.001)
+    monkeypatch.setattr(http_client, "upstream_limiter", AdaptiveTokenBucket(1000, min_rate=10))
+
+    async def run():
+        http_client._client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: next(responses)))
+        try:
+            return await http_client.get_with_retries("http://upstream/posts/view")
+        finally:
+            await http_client.close_http_client()
+
+    response = asyncio.run(run())
+    assert response.json() == {"ok": True}
+    assert http_client.upstream_limiter.throttled == 1 and http_client.upstream_limiter.rate < 1000
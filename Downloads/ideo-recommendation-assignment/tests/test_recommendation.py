@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app import crud, recommendation
+from app.models.posts import EngagementType
+from app.trending import MemoryTrendingStore
+
+
+@pytest.fixture
+def catalog(sessions, monkeypatch):
+    """40 posts, odd ids in fitness and even ids in food; retrieval limited to 5 per source."""
+    monkeypatch.setattr(recommendation.settings, "PIPELINE_SOURCE_LIMIT", 5)
+    monkeypatch.setattr(recommendation.settings, "FEED_SCORING_CHUNK_SIZE", 7)
+    store = MemoryTrendingStore("posts", 3600.0)
+    monkeypatch.setattr(recommendation, "get_trending_store", lambda namespace: store)
+
+    async def create():
+        async with sessions() as db:
+            posts = [{"title": f"post {i}", "category": "fitness" if i % 2 else "food", "metadata": None} for i in range(1, 41)]
+            await crud.upsert_posts(db, posts)
+            await db.commit()
+
+    asyncio.run(create())
+    return sessions
+
+
+def test_personalized_ranking_reaches_past_the_candidate_sources(catalog):
+    async def rank(k):
+        async with catalog() as db:
+            return await recommendation._rank_candidates(db, (1, {"cat:fitness": 1.0}, [39]), k)
+
+    ranked, complete = asyncio.run(rank(30))
+    assert len(ranked) == 30 and not complete
+    # every fitness post but the seen one, though the sources return 5 ids each
+    assert {pid for score, pid in ranked if score > 0} == set(range(1, 38, 2))
+    assert [pid for _, pid in ranked[:3]] == [37, 35, 33]
+
+
+def test_feed_pages_run_to_the_end_of_the_catalog(catalog, monkeypatch):
+    monkeypatch.setattr(recommendation.settings, "FEED_SNAPSHOT_SIZE", 10)
+    scans = []
+    scan = recommendation._scan_catalog
+
+    async def counted_scan(user_vec, k, *args, **kwargs):
+        scans.append(k)
+        return await scan(user_vec, k, *args, **kwargs)
+
+    monkeypatch.setattr(recommendation, "_scan_catalog", counted_scan)
+
+    async def scenario():
+        async with catalog() as db:
+            ids = await crud.upsert_users(db, ["amy"])
+            like = {"user_id": ids["amy"], "post_id": 39, "type": EngagementType.like, "rating_score": None}
+            await crud.insert_engagements(db, [like | {"timestamp": datetime.utcnow()}])
+            await db.commit()
+            feed = await recommendation.get_ranked_feed(db, "amy")
+            deep, _ = await recommendation.get_personalized_page(db, "amy", limit=5, offset=30)
+            # the sources were asked for the whole depth, so no scan was needed
+            assert scans == []
+            paged, cursor = [], None
+            while True:
+                page, cursor = await recommendation.get_personalized_page(db, "amy", limit=7, cursor=cursor)
+                paged += [item["id"] for item in page]
+                if cursor is None:
+                    return feed, deep, paged
+
+    feed, deep, paged = asyncio.run(scenario())
+    assert len(feed["items"]) == 10 and not feed["complete"]
+    assert len(deep) == 5
+    # paging runs past every snapshot to the bottom of the catalog: the food
+    # posts, which score lowest, all come before the cursor runs out
+    assert len(set(paged)) == len(paged) > 2 * 10
+    assert set(range(2, 41, 2)) <= set(paged)
+
+
+def test_known_users_are_looked_up_per_request(catalog):
+    async def scenario():
+        async with catalog() as db:
+            ids = await crud.upsert_users(db, ["amy", "bob"])
+            await db.commit()
+            before = await recommendation.is_known_user(db, "amy")
+            like = {"user_id": ids["amy"], "post_id": 3, "type": EngagementType.like, "rating_score": None}
+            await crud.insert_engagements(db, [like | {"timestamp": datetime.utcnow()}])
+            await db.commit()
+            after = [await recommendation.is_known_user(db, name) for name in ("amy", "bob", "nobody")]
+            return before, after
+
+    before, after = asyncio.run(scenario())
+    assert not before
+    assert after == [True, False, False]
@@ -0,0 +1,41 @@
+import math
+
+import numpy as np
+
+from app.scoring import FeatureVocabulary, PostFeatureMatrix
+
+
+POSTS = [
+    (1, {"cat:fitness": 1.0, "m:level:easy": 1.0}),
+    (2, {"cat:business": 1.0}),
+    (3, {}),
+    (4, {"cat:fitness": 1.0, "m:level:hard": 2.0}),
+]
+
+
+def test_vocabulary_is_stable():
+    vocab = FeatureVocabulary(["a", "b"])
+    assert vocab.add("c") == 2
+    assert vocab.add("a") == 0
+    assert vocab.names == ["a", "b", "c"]
+
+
+def test_scores_are_cosine_over_the_union_of_features():
+    matrix = PostFeatureMatrix.from_vectors(POSTS)
+    user_vec = {"cat:fitness": 2.2, "m:level:easy": 0.5, "m:unknown:x": 1.0}
+    scores = matrix.score(matrix.query(user_vec))
+    user_norm = math.sqrt(2.2**2 + 0.5**2 + 1.0**2)  # the unknown feature still counts
+    expected = [(2.2 + 0.5) / (math.sqrt(2) * user_norm), 0.0, 0.0, 2.2 / (math.sqrt(5) * user_norm)]
+    assert np.allclose(scores, expected, atol=1e-6)
+
+
+def test_score_rows_matches_full_score():
+    matrix = PostFeatureMatrix.from_vectors(POSTS)
+    q = matrix.query({"cat:fitness": 1.0, "m:level:hard": 1.0})
+    rows = [matrix.row_of(4), matrix.row_of(3), matrix.row_of(1)]
+    assert np.allclose(matrix.score_rows(q, rows), matrix.score(q)[rows])
+
+
+def test_empty_user_vector_scores_zero():
+    matrix = PostFeatureMatrix.from_vectors(POSTS)
+    assert not matrix.score(matrix.query({})).any()
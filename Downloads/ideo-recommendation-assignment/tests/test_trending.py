@@ -0,0 +1,111 @@
+import asyncio
+import os
+
+import pytest
+
+from app.cache import CircuitBreaker
+from app.trending import GENERATION_HALF_LIVES, DecayingCounters, MemoryTrendingStore, RedisTrendingStore, TrendingFeed
+
+HOUR = 3600.0
+
+
+def test_counts_decay_by_half_life():
+    counters = DecayingCounters(half_life=HOUR)
+    t0 = 1_700_000_000.0
+    counters.record("old", "Fitness", 1.0, t0)
+    counters.record("new", "fitness", 1.0, t0 + HOUR)
+    assert counters.decayed(counters.items["old"], t0 + HOUR) == pytest.approx(0.5)
+    assert counters.decayed(counters.items["new"], t0 + HOUR) == pytest.approx(1.0)
+    assert [k for k, _ in counters.top(2)] == ["new", "old"]
+    assert [k for k, _ in counters.top(5, category="FITNESS")] == ["new", "old"]
+    assert counters.decayed(counters.top_categories(1)[0][1], t0 + HOUR) == pytest.approx(1.5)
+
+
+def test_epoch_advance_keeps_values_and_prunes_faded():
+    counters = DecayingCounters(half_life=HOUR)
+    generation = GENERATION_HALF_LIVES * HOUR
+    t0 = generation * 1000 - HOUR  # an hour before the epoch moves
+    counters.record("a", None, 3.0, t0)
+    counters.record("faded", None, 1.0, t0 - 40 * HOUR)
+    epoch = counters.epoch
+    counters.record("b", None, 1.0, t0 + 2 * HOUR)
+    assert counters.epoch == epoch + generation
+    assert counters.decayed(counters.items["a"], t0 + 2 * HOUR) == pytest.approx(0.75)
+    assert counters.decayed(counters.items["b"], t0 + 2 * HOUR) == pytest.approx(1.0)
+    assert "faded" not in counters.items
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "posts.json")
+    store = MemoryTrendingStore("posts", HOUR, path)
+    asyncio.run(store.record("1", "art", 1.0))
+    store.save_snapshot()
+    loaded = MemoryTrendingStore("posts", HOUR, path)
+    assert asyncio.run(loaded.top(5, category="art")) == asyncio.run(store.top(5, category="art"))
+
+
+def test_workers_reload_the_writers_snapshot_and_keep_their_own_events(tmp_path):
+    path = str(tmp_path / "posts.json")
+    writer = MemoryTrendingStore("posts", HOUR, path)
+    worker = MemoryTrendingStore("posts", HOUR, path)
+    asyncio.run(worker.record("local", None, 1.0))
+    asyncio.run(writer.record("synced", None, 5.0))
+    writer.save_snapshot()
+    os.utime(path, (1, 1))  # coarse filesystem clocks: force a new mtime
+    assert [k for k, _ in asyncio.run(worker.top(5))] == ["synced", "local"]
+
+    async def build(ranked):
+        return [key for key, _ in ranked]
+
+    mtime = os.stat(path).st_mtime
+    asyncio.run(TrendingFeed(worker, build).page(5))
+    assert os.stat(path).st_mtime == mtime  # workers never write the snapshot
+
+
+def test_redis_store_falls_back_to_worker_counters_while_redis_is_down():
+    calls = 0
+
+    class DownRedis:
+        async def exists(self, key):
+            nonlocal calls
+            calls += 1
+            raise ConnectionError("redis down")
+
+    async def client():
+        return DownRedis()
+
+    breaker = CircuitBreaker("Redis", failure_threshold=2, retry_seconds=60)
+    store = RedisTrendingStore("posts", HOUR, client_factory=client, breaker=breaker)
+
+    async def run():
+        await store.record("a", "fitness", 1.0)
+        await store.record("b", "fitness", 2.0)
+        return await store.top(5), await store.top(5, "fitness"), await store.top_categories(1)
+
+    top, in_category, categories = asyncio.run(run())
+    assert [k for k, _ in top] == ["b", "a"] == [k for k, _ in in_category]
+    assert [c for c, _ in categories] == ["fitness"]
+    assert breaker.state == "open" and calls == 2  # reads skip Redis once the breaker opens
+
+
+def test_feed_serves_ranked_list_and_refreshes_in_background():
+    store = MemoryTrendingStore("posts", HOUR)
+    builds = []
+
+    async def build(ranked):
+        builds.append(len(ranked))
+        return [key for key, _ in ranked]
+
+    async def scenario():
+        for i, weight in enumerate([1.0, 3.0, 2.0]):
+            await store.record(str(i), None, weight)
+        feed = TrendingFeed(store, build, size=10, refresh_seconds=0.0)
+        assert await feed.page(2) == ["1", "2"]
+        await store.record("9", None, 10.0)
+        assert await feed.page(2, offset=1) == ["2", "0"]  # stale list served, refresh scheduled
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert (await feed.page(1))[0] == "9"
+
+    asyncio.run(scenario())
+    assert builds[:2] == [3, 4]
@@ -0,0 +1,53 @@
+import asyncio
+
+from app.warmup import Warmup, warm_keys
+
+
+def test_warm_keys_bounds_concurrency_and_counts_failures():
+    running = peak = 0
+
+    async def warm(key):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if key % 5 == 0:
+            raise RuntimeError("db down")
+
+    progress = asyncio.run(warm_keys(list(range(20)), warm, concurrency=3))
+    assert peak == 3
+    assert (progress.target, progress.warmed, progress.failed) == (20, 16, 4)
+    assert progress.coverage == 0.8
+
+
+def test_ready_after_coverage_and_rewarmed_on_new_version():
+    version = "v1"
+    failing = {"a", "b"}
+    warmed = []
+
+    async def load():
+        return ["a", "b", "c", "d"]
+
+    async def warm(key):
+        if key in failing:
+            raise RuntimeError("timeout")
+        warmed.append((version, key))
+
+    warmup = Warmup(load, warm, concurrency=2, threshold=0.75, version=lambda: version)
+
+    async def run():
+        warmup.start(interval=0.01)
+        await asyncio.sleep(0.005)
+        assert not warmup.ready  # 2 of 4 is below the threshold
+        failing.discard("a")
+        await asyncio.sleep(0.02)
+        assert warmup.ready
+        nonlocal version
+        version = "v2"
+        await asyncio.sleep(0.02)
+        await warmup.stop()
+
+    asyncio.run(run())
+    assert warmup.ready and warmup.progress.version == "v2"
+    assert ("v2", "c") in warmed and ("v2", "a") in warmed
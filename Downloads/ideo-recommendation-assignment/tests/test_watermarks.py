@@ -0,0 +1,31 @@
+from app.watermarks import MarkFields
+
+FIELDS = MarkFields(timestamps=("updated_at", "created_at"), ids=("id",))
+
+
+def test_marks_order_by_time_then_id():
+    assert FIELDS.of({"id": 7, "created_at": "2026-01-01T00:00:00Z"}) == (1767225600.0, 7.0)
+    assert FIELDS.of({"id": "7", "created_at": 1767225600000}) == (1767225600.0, 7.0)  # milliseconds
+    assert FIELDS.of({"id": 3}) == (0.0, 3.0)
+    assert FIELDS.of({"title": "no mark"}) is None
+    assert FIELDS.time_of({"id": 7, "created_at": "2026-01-01T00:00:00Z"}) == 1767225600.0
+    assert FIELDS.time_of({"id": 7}) is None
+    assert FIELDS.of({"id": 1, "updated_at": 20, "created_at": 10}) > FIELDS.of({"id": 9, "created_at": 10})
+
+
+def test_newer_rows_and_high_water():
+    rows = [{"id": 1}, {"id": 5}, {"id": 3}, {"title": "unmarked"}]
+    assert FIELDS.newer(rows, None) == rows
+    assert FIELDS.newer(rows, [0.0, 3.0]) == [{"id": 5}, {"title": "unmarked"}]  # as stored in JSON
+    assert FIELDS.high_water(rows, None) == (0.0, 5.0)
+    assert FIELDS.high_water(rows[:1], [0.0, 3.0]) == (0.0, 3.0)
+    assert FIELDS.high_water([{"title": "unmarked"}], None) is None
+
+
+def test_only_newest_first_pages_below_the_watermark_are_stale():
+    watermark = (0.0, 10.0)
+    assert FIELDS.is_stale([{"id": 10}, {"id": 9}], watermark)
+    assert not FIELDS.is_stale([{"id": 11}, {"id": 9}], watermark)
+    assert not FIELDS.is_stale([{"id": 8}, {"id": 9}], watermark)  # ascending: order unknown
+    assert not FIELDS.is_stale([{"id": 9}, {"title": "unmarked"}], watermark)
+    assert not FIELDS.is_stale([{"id": 9}], None)